@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import textwrap
+import importlib
+import statistics
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from result_store import git_commit
+from keyword_matcher import KEYWORDS_PATH
+
+# Where benchmark results are written unless --output is given
+default_output_path = './results/benchmark.json'
+
+# Keyword file the synthetic papers draw their terms from
+default_keywords_path = KEYWORDS_PATH
+
+# Analysis scripts that can be benchmarked, by short name
+benchmark_scripts = {'themes': 'pdf_analyze_themes', 'equations': 'pdf_analyze_equations'}
+
+# Filler vocabulary for the synthetic body text
+filler_words = ("the of and a to in is for on with that by this we are from as an be our results method model "
+                "approach data system network fire forest area based using proposed study sensor value time "
+                "shows used each can between than high low figure table section".split())
+
+# Equations typeset on the synthetic pages (matplotlib mathtext)
+synthetic_equations = [
+    r'$R = \frac{I_R \xi (1 + \phi_w + \phi_s)}{\rho_b \epsilon Q_{ig}}$',
+    r'$\frac{\partial T}{\partial t} = \alpha \nabla^2 T + Q(x, t)$',
+    r'$\min_{x} \sum_{i=1}^{n} c_i x_i \quad \mathrm{s.t.} \quad \sum_j a_{ij} x_j \geq b_i$',
+    r'$P(F \mid S) = \frac{P(S \mid F) P(F)}{P(S)}$',
+    r'$E_{tx}(k, d) = E_{elec} k + \epsilon_{amp} k d^2$',
+    r'$FWI = f(ISI, BUI)$'
+]
+
+# Columns and row labels of the synthetic results tables
+table_columns = ['Sensor', 'Accuracy', 'Latency (s)', 'Energy (J)']
+table_rows = ['Temperature', 'Humidity', 'Smoke', 'CO2', 'Infrared', 'Camera']
+
+
+def generate_corpus(folder, papers=20, min_pages=2, max_pages=8, seed=0, keywords_path=default_keywords_path,
+                    keyword_rate=0.03):
+    """Writes a reproducible synthetic corpus of PDFs into a folder and returns their paths.
+
+    Each page has wrapped body text in which roughly `keyword_rate` of the words are
+    keywords drawn from keywords.json, a typeset equation, and on every other page a small
+    results table. The same arguments always produce byte-identical files.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    with open(keywords_path, 'r') as f:
+        keyword_data = json.load(f)
+    # The 'dataset_variations' entries are regular expressions, not literal phrases
+    keywords = [keyword for section, section_keywords in keyword_data.items() if section != 'dataset_variations'
+                for keyword in section_keywords]
+
+    os.makedirs(folder, exist_ok=True)
+    rng = random.Random(seed)
+    pdf_paths = []
+    for paper in range(papers):
+        pdf_path = os.path.join(folder, f'synthetic_{paper:04d}.pdf')
+        with PdfPages(pdf_path, metadata={'CreationDate': None, 'Title': f'Synthetic paper {paper}'}) as pdf:
+            for page in range(rng.randint(min_pages, max_pages)):
+                words = [rng.choice(keywords) if rng.random() < keyword_rate else rng.choice(filler_words)
+                         for _ in range(450)]
+                fig = plt.figure(figsize=(8.5, 11))
+                fig.text(0.08, 0.95, '\n'.join(textwrap.wrap(' '.join(words), 100)), va='top', fontsize=8)
+                fig.text(0.5, 0.42, rng.choice(synthetic_equations), ha='center', fontsize=14)
+                if page % 2 == 0:
+                    ax = fig.add_axes([0.1, 0.08, 0.8, 0.25])
+                    ax.axis('off')
+                    cells = [[row, f'{rng.uniform(0.6, 1.0):.3f}', f'{rng.uniform(0.1, 30):.1f}', f'{rng.uniform(0.01, 5):.2f}']
+                             for row in rng.sample(table_rows, 4)]
+                    ax.table(cellText=cells, colLabels=table_columns, loc='center')
+                pdf.savefig(fig)
+                plt.close(fig)
+        pdf_paths.append(pdf_path)
+    return pdf_paths
+
+
+class StageTimer:
+    """Records the wall-clock and CPU time of named stages."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {'wall': time.perf_counter() - wall_start, 'cpu': time.process_time() - cpu_start}
+
+
+def _themes_input(module, pdf_path, cache):
+    from pdf_text import extract_pages_from_pdf
+    pages = extract_pages_from_pdf(pdf_path, cache)
+    return module.analyze_pages, (os.path.basename(pdf_path), pages, module.extract_metadata_from_pdf(pdf_path))
+
+
+def _equations_input(module, pdf_path, cache):
+    from pdf_text import extract_pages_from_pdf
+    return module.analyze_pages, (os.path.basename(pdf_path), extract_pages_from_pdf(pdf_path, cache))
+
+
+def time_script(script, pdf_paths, workdir):
+    """Runs one analysis script's stages over the corpus and returns their timings.
+
+    Meant to run in a fresh process: the scripts keep their counts in module-level state,
+    and the working directory is switched to `workdir`, where the reports and plots land.
+    """
+    os.chdir(workdir)
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    timer = StageTimer()
+    with timer.stage('import'):
+        module = importlib.import_module(benchmark_scripts[script])
+    from pdf_text import TextCache
+
+    # A fresh text cache per run, so extraction is always measured cold
+    cache_path = os.path.join(workdir, f'{script}_text.sqlite')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+    cache = TextCache(cache_path)
+
+    prepare = _themes_input if script == 'themes' else _equations_input
+    with timer.stage('extraction'):
+        inputs = [prepare(module, pdf_path, cache) for pdf_path in pdf_paths]
+    with timer.stage('matching'):
+        results = [analyze(*args) for analyze, args in inputs]
+    with timer.stage('cooccurrence'):
+        for result in results:
+            module.merge_result(result)
+        vocabularies = list(module.term_incidence.vocabularies)
+        for a in vocabularies:
+            for b in vocabularies:
+                module.term_incidence.cooccurrence(a, b)
+    with timer.stage('report'):
+        if script == 'themes':
+            module.generate_summary_report(results)
+        else:
+            module.write_summary_report(results)
+    if hasattr(module, 'plot_summary'):
+        with timer.stage('plotting'):
+            # Every repeat draws the figures, rather than finding them up to date from the last one
+            module.plot_summary(force=True)
+    cache.close()
+    return timer.stages
+
+
+def corpus_stats(pdf_paths):
+    """Returns the number of papers, pages, and PDF bytes in the corpus."""
+    import PyPDF2
+    return {
+        'papers': len(pdf_paths),
+        'pages': sum(len(PyPDF2.PdfReader(pdf_path).pages) for pdf_path in pdf_paths),
+        'pdf_bytes': sum(os.path.getsize(pdf_path) for pdf_path in pdf_paths)
+    }
+
+
+def run_benchmark(pdf_paths, scripts, repeat, workdir):
+    """Times every stage of each script `repeat` times, each run in a fresh process.
+
+    Returns {script: {stage: {'wall': [...], 'cpu': [...], 'wall_median': ..., 'wall_min': ...}}}.
+    """
+    pdf_paths = [os.path.abspath(pdf_path) for pdf_path in pdf_paths]
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    context = multiprocessing.get_context('spawn')
+    timings = {}
+    for script in scripts:
+        runs = []
+        for run in range(repeat):
+            print(f"Benchmarking {script} (run {run + 1}/{repeat})...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(time_script, script, pdf_paths, workdir).result())
+        timings[script] = {}
+        for stage in runs[0]:
+            wall = [stages[stage]['wall'] for stages in runs]
+            cpu = [stages[stage]['cpu'] for stages in runs]
+            timings[script][stage] = {
+                'wall': wall,
+                'cpu': cpu,
+                'wall_median': statistics.median(wall),
+                'wall_min': min(wall),
+                'cpu_median': statistics.median(cpu)
+            }
+    return timings
+
+
+def compare(baseline, current, tolerance, noise_floor):
+    """Prints the median wall time of every stage against a baseline result file.
+
+    Returns the (script, stage) pairs that got slower than `tolerance` times the baseline
+    by more than `noise_floor` seconds.
+    """
+    regressions = []
+    print(f"\n{'stage':<28}{'baseline':>10}{'current':>10}{'ratio':>8}")
+    for script, stages in current['timings'].items():
+        for stage, timing in stages.items():
+            old = baseline.get('timings', {}).get(script, {}).get(stage)
+            if old is None:
+                continue
+            ratio = timing['wall_median'] / old['wall_median'] if old['wall_median'] else float('inf')
+            slower = ratio > tolerance and timing['wall_median'] - old['wall_median'] > noise_floor
+            if slower:
+                regressions.append((script, stage))
+            print(f"{script + '.' + stage:<28}{old['wall_median']:>9.3f}s{timing['wall_median']:>9.3f}s"
+                  f"{ratio:>7.2f}x{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the analysis scripts stage by stage on a synthetic PDF corpus.")
+    parser.add_argument("--papers", type=int, default=20, help="number of synthetic papers (default: 20)")
+    parser.add_argument("--pages", default="2-8", help="pages per paper as N or MIN-MAX (default: 2-8)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the synthetic corpus (default: 0)")
+    parser.add_argument("--keywords", default=default_keywords_path, help=f"keyword file (default: {default_keywords_path})")
+    parser.add_argument("--corpus", help="benchmark an existing folder of PDFs instead of generating one")
+    parser.add_argument("--scripts", nargs="+", choices=sorted(benchmark_scripts), default=sorted(benchmark_scripts),
+                        help="scripts to benchmark (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per script, each in a fresh process (default: 3)")
+    parser.add_argument("--workdir", default="./cache/benchmark", help="scratch folder for the corpus and outputs")
+    parser.add_argument("--output", default=default_output_path, help=f"result file (default: {default_output_path})")
+    parser.add_argument("--compare", help="earlier result file to compare against; exits non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio counted as a regression (default: 1.25)")
+    parser.add_argument("--noise-floor", type=float, default=0.05, help="ignore slowdowns smaller than this many seconds (default: 0.05)")
+    args = parser.parse_args()
+
+    keywords_path = os.path.abspath(args.keywords)
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    # The benchmarked scripts, each run in a fresh process, load this keyword file
+    os.environ['KEYWORDS'] = keywords_path
+
+    min_pages, _, max_pages = args.pages.partition('-')
+    corpus = {'seed': args.seed, 'pages_per_paper': args.pages}
+    if args.corpus:
+        from corpus import list_pdf_files
+        pdf_paths = [os.path.join(args.corpus, filename) for filename in list_pdf_files(args.corpus)]
+        corpus = {'folder': os.path.abspath(args.corpus)}
+    else:
+        print(f"Generating {args.papers} synthetic papers...")
+        pdf_paths = generate_corpus(os.path.join(workdir, 'corpus'), args.papers, int(min_pages),
+                                    int(max_pages or min_pages), args.seed, keywords_path)
+    corpus.update(corpus_stats(pdf_paths))
+
+    result = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': corpus,
+        'repeat': args.repeat,
+        'timings': run_benchmark(pdf_paths, args.scripts, args.repeat, workdir)
+    }
+
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=4)
+    print(f"Benchmark results saved at {args.output}")
+
+    for script, stages in result['timings'].items():
+        print(f"\n{script}: {corpus['papers']} papers, {corpus['pages']} pages")
+        for stage, timing in stages.items():
+            print(f"  {stage:<14}{timing['wall_median']:>8.3f}s wall  {timing['cpu_median']:>8.3f}s cpu")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.tolerance, args.noise_floor)
+        if regressions:
+            sys.exit(f"{len(regressions)} stages regressed: {', '.join(f'{script}.{stage}' for script, stage in regressions)}")
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+class TermIncidence:
+    """Paper-by-term incidence matrix from which every co-occurrence table is derived.
+
+    Terms are grouped into named vocabularies (e.g. 'themes', 'datasets'), each laid out as a
+    block of columns in keyword-list order. Co-occurrence counts are matrix products of those
+    blocks, so pairs are always ordered by the keyword lists rather than by discovery order,
+    and no per-pair Python work is done.
+    """
+
+    def __init__(self, vocabularies):
+        self.vocabularies = {name: list(terms) for name, terms in vocabularies.items()}
+        self._columns = {}
+        self._blocks = {}
+        start = 0
+        for name, terms in self.vocabularies.items():
+            self._blocks[name] = slice(start, start + len(terms))
+            self._columns[name] = {term: start + i for i, term in enumerate(terms)}
+            start += len(terms)
+        self.n_terms = start
+        self._paper_rows = []
+        self._term_columns = []
+        self.n_papers = 0
+        self._matrix = None
+
+    def add_paper(self, found_terms):
+        """Adds one paper given the terms it mentions, as {vocabulary: [term, ...]}."""
+        columns = {self._columns[name][term] for name, terms in found_terms.items() for term in terms}
+        self._paper_rows.extend([self.n_papers] * len(columns))
+        self._term_columns.extend(sorted(columns))
+        self.n_papers += 1
+        self._matrix = None
+
+    def incidence(self, vocabulary=None):
+        """Returns the 0/1 papers x terms matrix, optionally restricted to one vocabulary."""
+        if self._matrix is None:
+            self._matrix = np.zeros((self.n_papers, self.n_terms), dtype=np.int32)
+            self._matrix[self._paper_rows, self._term_columns] = 1
+        return self._matrix if vocabulary is None else self._matrix[:, self._blocks[vocabulary]]
+
+    def cooccurrence(self, a, b=None):
+        """Returns the len(a) x len(b) matrix of how many papers mention both terms.
+
+        With one vocabulary the matrix is symmetric and its diagonal holds each term's paper count.
+        """
+        return self.incidence(a).T @ self.incidence(a if b is None else b)
+
+    def cooccurrence3(self, a, b, c):
+        """Returns the len(a) x len(b) x len(c) tensor of how many papers mention all three terms."""
+        return np.einsum('pi,pj,pk->ijk', self.incidence(a), self.incidence(b), self.incidence(c))
+
+    def pair_counts(self, a, b=None):
+        """Returns [((term_a, term_b), count), ...] for every pair mentioned together at least once.
+
+        Within a single vocabulary each unordered pair is listed once (term_a before term_b in
+        keyword-list order).
+        """
+        matrix = self.cooccurrence(a, b)
+        if b is None:
+            matrix = np.triu(matrix, k=1)
+        terms_a = self.vocabularies[a]
+        terms_b = self.vocabularies[a if b is None else b]
+        return [((terms_a[i], terms_b[j]), int(matrix[i, j])) for i, j in zip(*np.nonzero(matrix))]
+
+    def to_sparse(self, a, b=None):
+        """Returns a co-occurrence matrix in coordinate form as (rows, columns, counts) arrays,
+        e.g. for ``scipy.sparse.coo_matrix((counts, (rows, columns)))``."""
+        matrix = self.cooccurrence(a, b)
+        rows, columns = np.nonzero(matrix)
+        return rows, columns, matrix[rows, columns]
+
+    def save(self, path, tables):
+        """Saves dense co-occurrence tables and their term labels to a .npz file for plotting.
+
+        `tables` maps an output name to a tuple of vocabulary names (one to three of them).
+        """
+        arrays = {f"{name}_terms": np.array(terms) for name, terms in self.vocabularies.items()}
+        for table, vocabularies in tables.items():
+            arrays[table] = self.cooccurrence3(*vocabularies) if len(vocabularies) == 3 else self.cooccurrence(*vocabularies)
+        np.savez_compressed(path, **arrays)
@@ -0,0 +1,346 @@
+import os
+import csv
+import time
+import resource
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import wait
+from pdf_text import use_extractor, active_extractor, FALLBACK_EXTRACTOR
+from instrumentation import get_tracer, profiled_worker
+
+# Default limits for analyzing one paper: wall-clock seconds and worker address space in MB
+DEFAULT_TIMEOUT = 300
+DEFAULT_MEMORY_MB = 4096
+
+# Papers read ahead of the extraction workers by this many threads, so file I/O (e.g. from a
+# network share) overlaps with parsing; also bounds how far workers run ahead of the next paper
+# in order, which keeps the results held for reordering bounded
+DEFAULT_PREFETCH = 8
+PREFETCH_THREADS = 2
+
+# Columns of the extraction failure table
+failure_columns = ['file', 'extractor', 'failure', 'error', 'seconds', 'outcome']
+
+
+def list_pdf_files(folder_path):
+    """Returns the PDF filenames in a folder in a stable (sorted) order."""
+    return sorted(filename for filename in os.listdir(folder_path) if filename.endswith(".pdf"))
+
+
+class Supervision:
+    """Limits for analyzing each paper in a supervised worker process, and the failures seen.
+
+    A paper whose analysis raises, runs past `timeout` seconds, or takes its worker down
+    (e.g. by exceeding `memory_mb`) is retried with the fallback extractor. Every failed
+    attempt is recorded in `failures` with the paper's final outcome: 'recovered' when the
+    fallback succeeded, 'failed' when the paper could not be analyzed at all.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, memory_mb=DEFAULT_MEMORY_MB, fallback=True):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.fallback = fallback
+        self.failures = []
+
+    def failed_files(self):
+        """Returns the files that could not be analyzed at all."""
+        return sorted({failure['file'] for failure in self.failures if failure['outcome'] == 'failed'})
+
+
+def map_papers(analyze, pdf_paths, workers=1, manifest=None, supervision=None, prefetch=DEFAULT_PREFETCH):
+    """Yields analyze(pdf_path) for every path that could be analyzed, in the order the paths were given.
+
+    Papers are analyzed in `workers` supervised processes (see Supervision); papers that
+    fail even with the fallback extractor are left out and listed in `supervision.failures`.
+    Results still come back in input order so callers can merge them deterministically.
+    Up to `prefetch` papers are read ahead of the workers (see PipelineStats for how busy
+    each stage was). When a manifest is given, unchanged papers reuse their stored result,
+    papers that left the folder are dropped from it, and only new or changed papers are analyzed.
+    """
+    supervision = supervision or Supervision()
+    if manifest is None:
+        yield from (result for _, result in _analyze_in_order(analyze, pdf_paths, workers, supervision, prefetch))
+        return
+
+    removed = manifest.retain(pdf_paths)
+    stored = {pdf_path: manifest.lookup(pdf_path) for pdf_path in pdf_paths}
+    pending = [pdf_path for pdf_path in pdf_paths if stored[pdf_path] is None]
+    print(f"Reusing {len(pdf_paths) - len(pending)} unchanged papers, analyzing {len(pending)}, "
+          f"retracting {len(removed)} removed.")
+
+    # Each paper is recorded as soon as it finishes, so a run that dies keeps what it did;
+    # failed papers aren't recorded, so the next run tries them again
+    fresh = {}
+    for pdf_path, result in _analyze_in_order(analyze, pending, workers, supervision, prefetch):
+        manifest.record(pdf_path, result)
+        fresh[pdf_path] = result
+    manifest.save()
+
+    for pdf_path in pdf_paths:
+        if stored[pdf_path] is not None:
+            yield stored[pdf_path]
+        elif pdf_path in fresh:
+            yield fresh[pdf_path]
+
+
+def _read_file(path):
+    """Reads a file through once, so the worker parsing it finds it in the OS page cache; returns the seconds taken."""
+    start_time = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            while f.read(1024 * 1024):
+                pass
+    except OSError:
+        pass  # The worker will report it
+    return time.perf_counter() - start_time
+
+
+class PipelineStats:
+    """How busy the read, extract, and consume stages of a map_papers run were.
+
+    Occupancy is the share of the run's wall time each stage's slots (reader threads,
+    worker processes, the consuming loop) spent working; queue depths are time-weighted
+    means of the papers read but not yet handed to a worker, and of the results waiting
+    for an earlier paper to finish.
+    """
+
+    def __init__(self, readers, workers):
+        self.start_time = time.perf_counter()
+        self.slots = {'read': readers, 'extract': workers, 'consume': 1}
+        self.busy = {'read': 0.0, 'extract': 0.0, 'consume': 0.0}
+        self.queued = {'read': 0.0, 'reorder': 0.0}
+        self._sampled = self.start_time
+
+    def sample(self, read, reorder):
+        """Records the current queue depths, weighted by the time since the last sample."""
+        now = time.perf_counter()
+        self.queued['read'] += read * (now - self._sampled)
+        self.queued['reorder'] += reorder * (now - self._sampled)
+        self._sampled = now
+
+    def summary(self):
+        wall = time.perf_counter() - self.start_time
+        return {
+            'wall': wall,
+            'occupancy': {stage: self.busy[stage] / (wall * self.slots[stage]) if wall else 0.0 for stage in self.busy},
+            'mean_queue': {queue: depth / wall if wall else 0.0 for queue, depth in self.queued.items()}
+        }
+
+
+def report_pipeline(stats):
+    """Prints the occupancy of each stage and records it in the run's trace."""
+    summary = stats.summary()
+    occupancy = ', '.join(f"{stage} {share:.0%}" for stage, share in summary['occupancy'].items())
+    print(f"Pipeline occupancy: {occupancy} (mean queued: {summary['mean_queue']['read']:.1f} read ahead, "
+          f"{summary['mean_queue']['reorder']:.1f} waiting to be reordered)")
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.emit('pipeline', slots=stats.slots, **summary)
+
+
+def _supervised_worker(conn, analyze, memory_mb, parent_pid=None):
+    """Analyzes papers sent over `conn` until it receives None, or until its parent process is gone.
+
+    While the run is profiled, the worker profiles itself for the run to merge (see profiled_worker).
+    """
+    if memory_mb:
+        try:
+            limit = memory_mb * 1024 ** 2
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass  # The cap can't be enforced on this platform (e.g. macOS)
+    with profiled_worker():
+        _serve_papers(conn, analyze, memory_mb, parent_pid)
+
+
+def _serve_papers(conn, analyze, memory_mb, parent_pid):
+    while True:
+        # A forked worker holds a copy of the parent's end of the pipe, so it would wait forever
+        # for the next paper if the run were killed; poll and check the parent is still there
+        while not conn.poll(1.0):
+            if parent_pid is not None and os.getppid() != parent_pid:
+                return
+        task = conn.recv()
+        if task is None:
+            return
+        pdf_path, extractor = task
+        try:
+            with use_extractor(extractor):
+                result = analyze(pdf_path)
+        except MemoryError:
+            # Leave it to the supervisor to start a fresh worker
+            conn.send(('memory', f"exceeded the {memory_mb} MB memory cap"))
+            return
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+        else:
+            conn.send(('ok', result))
+
+
+class _Worker:
+    def __init__(self, context, analyze, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_supervised_worker, args=(child_conn, analyze, memory_mb, os.getpid()),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.task = None
+        self.started = None
+
+    def submit(self, task):
+        self.task = task
+        self.started = time.perf_counter()
+        self.conn.send(task[1:])
+
+    def stop(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+def _analyze_in_order(analyze, pdf_paths, workers, supervision, prefetch=DEFAULT_PREFETCH):
+    """Yields (pdf_path, result) pairs in input order, analyzing the papers in supervised worker processes.
+
+    Reader threads read up to `prefetch` papers ahead, and no paper more than `prefetch`
+    places past the next one due is handed out, so neither the papers read ahead nor the
+    results held for reordering grow without bound.
+    """
+    if not pdf_paths:
+        return
+    context = multiprocessing.get_context()
+    tasks = deque((index, pdf_path, None) for index, pdf_path in enumerate(pdf_paths))
+    results = {}
+    attempts = {}
+    next_index = 0
+    pool = []
+    window = max(prefetch, workers, 1)
+    stats = PipelineStats(PREFETCH_THREADS, max(1, workers))
+    readers = ThreadPoolExecutor(PREFETCH_THREADS)
+    reads = {}
+
+    def read_ahead():
+        # Queue reads for the papers within the window that haven't been read yet
+        for index in range(next_index, min(next_index + window, len(pdf_paths))):
+            if index not in reads:
+                reads[index] = readers.submit(_read_file, pdf_paths[index])
+
+    def ready(task):
+        # Whether a paper is within the window and has been read
+        read = reads.get(task[0])
+        return task[0] < next_index + window and (read is None or read.done())
+
+    def finish(worker):
+        stats.busy['extract'] += time.perf_counter() - worker.started
+        worker.task = None
+
+    def fail(worker, failure, error):
+        index, pdf_path, extractor = worker.task
+        extractor = extractor or active_extractor()
+        attempts.setdefault(index, []).append({
+            'file': os.path.basename(pdf_path), 'extractor': extractor, 'failure': failure,
+            'error': error, 'seconds': round(time.perf_counter() - worker.started, 3)
+        })
+        stats.busy['extract'] += time.perf_counter() - worker.started
+        print(f"Could not analyze {os.path.basename(pdf_path)} with {extractor} ({failure}): {error}")
+        if extractor != FALLBACK_EXTRACTOR and supervision.fallback:
+            # Retry next, so results keep flowing in order
+            tasks.appendleft((index, pdf_path, FALLBACK_EXTRACTOR))
+        else:
+            results[index] = None
+        worker.task = None
+
+    def record(index, outcome):
+        for failure in attempts.pop(index, []):
+            failure['outcome'] = outcome
+            supervision.failures.append(failure)
+            tracer = get_tracer()
+            if tracer is not None:
+                tracer.emit('failure', **failure)
+
+    try:
+        while tasks or any(worker.task for worker in pool):
+            read_ahead()
+            # Hand out work, replacing workers that were killed or died
+            pool = [worker for worker in pool if worker.process.is_alive() or worker.task]
+            while tasks and len([worker for worker in pool if worker.task]) < max(1, workers):
+                if not ready(tasks[0]):
+                    if any(worker.task for worker in pool):
+                        break
+                    # Nothing else is running, so wait for the next paper to be read
+                    reads[tasks[0][0]].result()
+                idle = [worker for worker in pool if worker.task is None]
+                worker = idle[0] if idle else _Worker(context, analyze, supervision.memory_mb)
+                if not idle:
+                    pool.append(worker)
+                worker.submit(tasks.popleft())
+
+            busy = [worker for worker in pool if worker.task]
+            remaining = [worker.started + supervision.timeout - time.perf_counter() for worker in busy] if supervision.timeout else []
+            if tasks and len(busy) < max(1, workers) and tasks[0][0] < next_index + window and not ready(tasks[0]):
+                # A worker is free but its next paper is still being read; check back shortly
+                remaining.append(0.05)
+            stats.sample(sum(1 for task in itertools.islice(tasks, window) if task[0] in reads and reads[task[0]].done()),
+                         len(results))
+            finished = wait([worker.conn for worker in busy], timeout=max(0, min(remaining)) if remaining else None)
+            for worker in busy:
+                if worker.conn in finished:
+                    try:
+                        status, payload = worker.conn.recv()
+                    except EOFError:
+                        worker.process.join()
+                        status, payload = 'crashed', f"worker exited with code {worker.process.exitcode}"
+                    if status == 'ok':
+                        results[worker.task[0]] = payload
+                        finish(worker)
+                    else:
+                        fail(worker, status, payload)
+                    if status in ('crashed', 'memory'):
+                        worker.stop()
+                elif supervision.timeout and time.perf_counter() - worker.started >= supervision.timeout:
+                    worker.stop()
+                    fail(worker, 'timeout', f"took longer than {supervision.timeout}s")
+
+            while next_index in results:
+                result = results.pop(next_index)
+                record(next_index, 'failed' if result is None else 'recovered')
+                read = reads.pop(next_index, None)
+                if read is not None and read.done():
+                    stats.busy['read'] += read.result()
+                next_index += 1
+                if result is not None:
+                    # Time the consumer spends on a result before asking for the next one
+                    consume_start = time.perf_counter()
+                    yield pdf_paths[next_index - 1], result
+                    stats.busy['consume'] += time.perf_counter() - consume_start
+        report_pipeline(stats)
+    finally:
+        readers.shutdown(wait=False, cancel_futures=True)
+        for worker in pool:
+            if worker.process.is_alive() and worker.task is None:
+                try:
+                    worker.conn.send(None)
+                    worker.process.join(timeout=5)
+                except OSError:
+                    pass
+            worker.stop()
+
+
+def write_failure_table(failures, path):
+    """Writes the extraction failures of a run to a CSV file, one row per failed attempt."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=failure_columns)
+        writer.writeheader()
+        writer.writerows(failures)
+
+
+def report_failures(supervision, path):
+    """Prints how many papers failed or were recovered and writes the failure table when there were any."""
+    if not supervision.failures:
+        return
+    write_failure_table(supervision.failures, path)
+    recovered = {failure['file'] for failure in supervision.failures if failure['outcome'] == 'recovered'}
+    print(f"{len(recovered)} papers recovered with {FALLBACK_EXTRACTOR}, {len(supervision.failed_files())} could "
+          f"not be analyzed and are left out of the results; see {path}")
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+
+
+class DiskCache:
+    """SQLite store of zlib-compressed JSON values, evicted least-recently-used by size.
+
+    Values are addressed by a content key (usually a SHA-256) and a version string that
+    describes how the value was produced, so changing the producer invalidates old entries.
+    """
+
+    table = 'entries'
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        # Write-ahead logging lets parallel workers read while another one writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " key TEXT NOT NULL, version TEXT NOT NULL, data BLOB NOT NULL,"
+            " size INTEGER NOT NULL, last_used REAL NOT NULL,"
+            " PRIMARY KEY (key, version))"
+        )
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_used ON {self.table} (last_used)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Returns the cached value, or None when nothing is cached under the key and version."""
+        return self.get_first(key, [version])
+
+    def get_first(self, key, versions):
+        """Returns the value cached under the first of the versions that has one, or None.
+
+        However many versions are tried, the lookup counts as a single hit or miss.
+        """
+        rows = dict(self.conn.execute(
+            f"SELECT version, data FROM {self.table} WHERE key = ? AND version IN ({', '.join('?' * len(versions))})",
+            (key, *versions)
+        ).fetchall())
+        version = next((version for version in versions if version in rows), None)
+        if version is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute(
+            f"UPDATE {self.table} SET last_used = ? WHERE key = ? AND version = ?", (time.time(), key, version)
+        )
+        self.conn.commit()
+        return json.loads(zlib.decompress(rows[version]).decode('utf-8'))
+
+    def put(self, key, value, version):
+        """Stores a value and evicts old entries beyond the size budget."""
+        data = zlib.compress(json.dumps(value).encode('utf-8'))
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, version, data, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, version, data, len(data), time.time())
+        )
+        self.evict()
+        self.conn.commit()
+
+    def total_size(self):
+        """Returns the compressed size of all cached values in bytes."""
+        return self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def evict(self):
+        """Drops least recently used values until the cache fits within max_bytes."""
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return
+        for key, version, size in self.conn.execute(
+            f"SELECT key, version, size FROM {self.table} ORDER BY last_used"
+        ).fetchall():
+            if excess <= 0:
+                break
+            self.conn.execute(f"DELETE FROM {self.table} WHERE key = ? AND version = ?", (key, version))
+            excess -= size
+
+    def close(self):
+        self.conn.close()
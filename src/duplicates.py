@@ -0,0 +1,290 @@
+import os
+import re
+import zlib
+import argparse
+import numpy as np
+import PyPDF2
+from disk_cache import DiskCache
+from corpus import list_pdf_files, map_papers, Supervision
+from pdf_text import file_sha256, extract_pages_from_pdf
+
+# Papers are compared as sets of overlapping runs of this many words
+SHINGLE_WORDS = 5
+
+# MinHash signature length, split into LSH bands of NUM_PERM // BANDS rows. Papers sharing any
+# band are compared; with 32 bands of 4 rows, pairs above about 0.5 similarity almost always are
+NUM_PERM = 128
+BANDS = 32
+
+# Estimated shingle similarity (Jaccard) above which two papers count as copies of one another
+DEFAULT_THRESHOLD = 0.7
+
+# Lower similarity that papers sharing a DOI, PDF title or search-result row must also reach:
+# a paper can print the DOI of another (a cited or companion article) on its first pages,
+# generic titles recur, and a loose title match can pair unrelated papers with one row.
+# Unrelated papers are near 0, while versions of one paper are well above this
+IDENTIFIER_THRESHOLD = 0.3
+
+# Characters of a paper's first page kept for matching it to the search-result exports by title
+FIRST_PAGE_CHARS = 2000
+
+# Location and size budget of the signature cache (overridable from the environment)
+SIGNATURE_CACHE_PATH = os.environ.get('MINHASH_CACHE', './cache/minhash.sqlite')
+SIGNATURE_CACHE_MAX_BYTES = int(os.environ.get('MINHASH_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+
+# Bump whenever shingling or hashing changes, so stale signatures are ignored
+SIGNATURE_VERSION = f"minhash-{SHINGLE_WORDS}x{NUM_PERM}/1"
+
+# Universal hash functions (a * x + b) mod p over the 32-bit CRC of each shingle, fixed by the seed
+# so signatures stay comparable across runs. With p < 2^31 the products fit in 64 bits
+_PRIME = (1 << 31) - 1
+_random = np.random.RandomState(20240101)
+_a = _random.randint(1, _PRIME, NUM_PERM).astype(np.uint64)
+_b = _random.randint(0, _PRIME, NUM_PERM).astype(np.uint64)
+
+# A DOI printed on the first pages of a paper; trailing punctuation is trimmed off
+_doi = re.compile(r'\b10\.\d{4,9}/[^\s"<>]+')
+
+
+def normalize_doi(doi):
+    """Lowercases a DOI and strips any https://doi.org/ or doi: prefix, as the metadata deduplication does."""
+    return re.sub(r'^(https?://(dx\.)?doi\.org/|doi:\s*)', '', doi.strip().lower())
+
+
+def normalize_title(title):
+    """Lowercases a title and collapses everything but letters and digits to single spaces."""
+    return re.sub(r'[\W_]+', ' ', title.lower()).strip()
+
+
+def find_doi(pages):
+    """Returns the first DOI printed on the first two pages, normalized, or None."""
+    for page_text in pages[:2]:
+        match = _doi.search(page_text)
+        if match:
+            return normalize_doi(match.group().rstrip('.,;:)]'))
+    return None
+
+
+def pdf_title(pdf_path):
+    """Returns the title recorded in a PDF's document information, or None."""
+    try:
+        with open(pdf_path, 'rb') as f:
+            title = (PyPDF2.PdfReader(f).metadata or {}).get('/Title')
+    except Exception:
+        return None
+    return str(title) if title and str(title).strip() else None
+
+
+class SignatureCache(DiskCache):
+    """MinHash signatures and identifiers of papers, keyed by the SHA-256 of the PDF."""
+
+    table = 'signatures'
+
+    def __init__(self, path=SIGNATURE_CACHE_PATH, max_bytes=SIGNATURE_CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes)
+
+
+_signature_cache = None
+_signature_cache_pid = None
+
+
+def get_signature_cache():
+    """Opens the signature cache on first use (and again in each worker process)."""
+    global _signature_cache, _signature_cache_pid
+    if _signature_cache is None or _signature_cache_pid != os.getpid():
+        _signature_cache = SignatureCache()
+        _signature_cache_pid = os.getpid()
+    return _signature_cache
+
+
+def shingles(text):
+    """Returns the set of SHINGLE_WORDS-word runs in the text, lowercased (the whole text when shorter)."""
+    words = re.findall(r'\w+', text.lower())
+    return {' '.join(words[start:start + SHINGLE_WORDS]) for start in range(max(1, len(words) - SHINGLE_WORDS + 1))} \
+        if words else set()
+
+
+def minhash(text, block=4096):
+    """Returns the MinHash signature of the text's shingles as NUM_PERM integers, or None for empty text."""
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles(text)), dtype=np.uint64)
+    if not len(hashes):
+        return None
+    signature = np.full(NUM_PERM, _PRIME, dtype=np.uint64)
+    # Hash in blocks so a long paper doesn't need a shingles x NUM_PERM array at once
+    for start in range(0, len(hashes), block):
+        values = (hashes[start:start + block, None] * _a + _b) % _PRIME
+        signature = np.minimum(signature, values.min(axis=0))
+    return signature
+
+
+def similarity(signature, other):
+    """Estimates the Jaccard similarity of two papers' shingle sets from their signatures."""
+    return float(np.mean(np.asarray(signature) == np.asarray(other)))
+
+
+class MinHashIndex:
+    """Locality-sensitive hash index of MinHash signatures.
+
+    Each signature is cut into BANDS bands and filed under every band's value, so a query
+    only compares the papers that share a band with it instead of the whole corpus.
+    """
+
+    def __init__(self, bands=BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.buckets = [{} for _ in range(bands)]
+        self.signatures = {}
+
+    def _band_keys(self, signature):
+        signature = np.asarray(signature, dtype=np.uint64)
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def add(self, key, signature):
+        self.signatures[key] = signature
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band_key, []).append(key)
+
+    def query(self, signature, threshold=DEFAULT_THRESHOLD):
+        """Returns [(key, similarity), ...] of the indexed papers at least `threshold` similar, most similar first."""
+        candidates = {key for bucket, band_key in zip(self.buckets, self._band_keys(signature))
+                      for key in bucket.get(band_key, ())}
+        matches = [(key, similarity(signature, self.signatures[key])) for key in candidates]
+        return sorted((match for match in matches if match[1] >= threshold), key=lambda match: (-match[1], match[0]))
+
+
+def paper_signature(pdf_path, cache=None):
+    """Returns a paper's MinHash signature and identifiers, computing them only if they are not cached.
+
+    The text comes from the extracted text cache, so the analysis that follows doesn't parse the paper again.
+    """
+    cache = cache or get_signature_cache()
+    sha256 = file_sha256(pdf_path)
+    entry = cache.get(sha256, SIGNATURE_VERSION)
+    if entry is None:
+        pages = extract_pages_from_pdf(pdf_path)
+        signature = minhash('\n'.join(pages))
+        entry = {'signature': signature.tolist() if signature is not None else None,
+                 'words': sum(len(re.findall(r'\w+', page_text)) for page_text in pages),
+                 'doi': find_doi(pages), 'title': pdf_title(pdf_path),
+                 'first_page': normalize_title(pages[0])[:FIRST_PAGE_CHARS] if pages else ''}
+        cache.put(sha256, entry, SIGNATURE_VERSION)
+    return {'path': pdf_path, 'sha256': sha256, **entry}
+
+
+def _metadata_rows(papers, metadata_pattern):
+    """Returns the search-result export row each paper matches (None when it matches none)."""
+    from term_store import load_metadata, match_metadata
+    metadata = load_metadata(metadata_pattern)
+    if metadata.empty:
+        return [None] * len(papers)
+    return [row for row, _ in match_metadata(papers, metadata)]
+
+
+def find_duplicates(pdf_paths, workers=1, supervision=None, threshold=DEFAULT_THRESHOLD, metadata_pattern=None):
+    """Groups the papers that are copies of one another and picks one canonical copy of each.
+
+    Papers are the same when their files are identical, when they print the same DOI, carry
+    the same PDF title or match the same row of the search-result exports (with
+    `metadata_pattern`) and their texts are at least IDENTIFIER_THRESHOLD similar, or when
+    their texts are at least `threshold` similar. Of each group, the
+    copy with a DOI, then the most text, then the first in order is canonical.
+
+    Returns {canonical path: [alias paths]} for every group with more than one copy. Papers
+    whose text can't be read are left to the analysis, which records the failure.
+    """
+    # Signature failures are recorded by the analysis itself, not twice
+    supervision = Supervision(supervision.timeout, supervision.memory_mb) if supervision else None
+    papers = list(map_papers(paper_signature, pdf_paths, workers, supervision=supervision))
+    order = {pdf_path: number for number, pdf_path in enumerate(pdf_paths)}
+
+    parents = list(range(len(papers)))
+
+    def root(number):
+        while parents[number] != number:
+            parents[number] = parents[parents[number]]
+            number = parents[number]
+        return number
+
+    def link(number, other):
+        parents[root(number)] = root(other)
+
+    def same_text(number, other):
+        signature, other_signature = papers[number]['signature'], papers[other]['signature']
+        return signature is not None and other_signature is not None and \
+            similarity(signature, other_signature) >= IDENTIFIER_THRESHOLD
+
+    # Identical identifiers
+    seen = {}
+    identifiers = [[('sha256', paper['sha256']), ('doi', paper['doi'])] for paper in papers]
+    for number, paper in enumerate(papers):
+        title = normalize_title(paper['title']) if paper['title'] else ''
+        if len(title.split()) >= 4:  # Shorter PDF titles are often placeholders like "Untitled"
+            identifiers[number].append(('title', title))
+    if metadata_pattern:
+        for number, row in enumerate(_metadata_rows(papers, metadata_pattern)):
+            identifiers[number].append(('metadata', row))
+    for number, keys in enumerate(identifiers):
+        for key in keys:
+            if key[1] is None:
+                continue
+            if key[0] != 'sha256':
+                for other in seen.get(key, []):
+                    if same_text(number, other):
+                        link(number, other)
+            elif key in seen:
+                link(number, seen[key][0])
+            seen.setdefault(key, []).append(number)
+
+    # Near-identical text
+    index = MinHashIndex()
+    for number, paper in enumerate(papers):
+        if paper['signature'] is None:
+            continue
+        for other, _ in index.query(paper['signature'], threshold):
+            link(number, other)
+        index.add(number, paper['signature'])
+
+    groups = {}
+    for number in range(len(papers)):
+        groups.setdefault(root(number), []).append(papers[number])
+    duplicates = {}
+    for group in groups.values():
+        if len(group) > 1:
+            group.sort(key=lambda paper: (paper['doi'] is None, -paper['words'], order[paper['path']]))
+            duplicates[group[0]['path']] = sorted((paper['path'] for paper in group[1:]), key=order.get)
+    return duplicates
+
+
+def canonical_papers(pdf_paths, workers=1, supervision=None, threshold=DEFAULT_THRESHOLD, metadata_pattern=None):
+    """Returns the paths without the duplicate copies, in their original order, and {canonical file: [alias files]}."""
+    duplicates = find_duplicates(pdf_paths, workers, supervision, threshold, metadata_pattern)
+    aliases = {alias for paths in duplicates.values() for alias in paths}
+    if duplicates:
+        print(f"Found {len(aliases)} duplicate copies of {len(duplicates)} papers; analyzing one copy of each.")
+    return ([pdf_path for pdf_path in pdf_paths if pdf_path not in aliases],
+            {os.path.basename(path): [os.path.basename(alias) for alias in paths] for path, paths in duplicates.items()})
+
+
+def link_aliases(results, aliases):
+    """Records the duplicate copies of each paper (by filename) in its result's 'aliases'."""
+    for result in results:
+        result['aliases'] = aliases.get(result['file'], [])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the PDFs in a folder that are copies of one another.")
+    parser.add_argument("folder", help="folder containing the PDF files")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help=f"estimated text similarity above which papers are copies (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--metadata", metavar="PATTERN", help="also group papers matching the same row of these search-result exports, e.g. './data/export*.csv'")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    args = parser.parse_args()
+
+    pdf_paths = [os.path.join(args.folder, filename) for filename in list_pdf_files(args.folder)]
+    duplicates = find_duplicates(pdf_paths, args.workers, threshold=args.threshold, metadata_pattern=args.metadata)
+    for canonical, paths in duplicates.items():
+        print(f"{os.path.basename(canonical)}")
+        for path in paths:
+            print(f"  = {os.path.basename(path)}")
+    print(f"{sum(len(paths) for paths in duplicates.values())} duplicate copies of {len(duplicates)} papers "
+          f"among {len(pdf_paths)} PDFs.")
@@ -0,0 +1,374 @@
+import os
+import sys
+import json
+import time
+import uuid
+import resource
+from contextlib import contextmanager
+
+# A traced run passes its trace file, run id, and script name to worker processes through
+# the environment, so papers analyzed in a process pool are traced too
+TRACE_PATH_ENV = 'PAPER_TRACE'
+TRACE_RUN_ENV = 'PAPER_TRACE_RUN'
+TRACE_SCRIPT_ENV = 'PAPER_TRACE_SCRIPT'
+
+# A profiled run passes a directory to worker processes through the environment; each worker
+# writes its cProfile stats there and the run merges them into its own profile
+PROFILE_DIR_ENV = 'PAPER_PROFILE_DIR'
+
+# Number of slowest papers listed in a run summary
+DEFAULT_SLOWEST = 10
+
+
+def peak_rss_mb(children=False):
+    """Returns the peak resident set size of this process (or of its finished children) in megabytes."""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KiB elsewhere
+
+
+class Tracer:
+    """Appends timing events of one run to a JSONL trace file.
+
+    Every event is one JSON object per line with the run id, script, pid and a timestamp.
+    Lines are written and flushed one at a time in append mode, so worker processes can
+    share the file.
+    """
+
+    def __init__(self, path, script, run_id=None):
+        self.path = path
+        self.script = script
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.start_time = time.perf_counter()
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'run': self.run_id, 'script': self.script, 'pid': os.getpid(),
+                  'time': round(time.time(), 3), **fields}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Times a run-level stage (e.g. the report) and records it as a 'stage' event."""
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.emit('stage', stage=name, wall=time.perf_counter() - wall_start,
+                      cpu=time.process_time() - cpu_start, peak_rss_mb=peak_rss_mb(), **fields)
+
+    def events(self):
+        """Returns this run's events from the trace file."""
+        events = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['run'] == self.run_id:
+                    events.append(record)
+        return events
+
+    def summary(self, slowest=DEFAULT_SLOWEST, **fields):
+        """Records and returns a 'summary' event aggregating the run's paper and stage events."""
+        events = self.events()
+        papers = [event for event in events if event['event'] == 'paper' and 'error' not in event]
+        started = {event['file'] for event in events if event['event'] == 'paper_start'}
+        wall = time.perf_counter() - self.start_time
+        pages = sum(paper.get('pages', 0) for paper in papers)
+        paper_stages = {}
+        for paper in papers:
+            for stage, seconds in paper['stages'].items():
+                paper_stages[stage] = paper_stages.get(stage, 0) + seconds
+        stages = {}
+        for event in events:
+            if event['event'] == 'stage':
+                stages[event['stage']] = stages.get(event['stage'], 0) + event['wall']
+        caches = {'text': [sum(paper.get('cache_hits', 0) for paper in papers),
+                           sum(paper.get('cache_misses', 0) for paper in papers)]}
+        for event in events:
+            if event['event'] == 'cache':
+                hits, misses = caches.get(event['cache'], [0, 0])
+                caches[event['cache']] = [hits + event['hits'], misses + event['misses']]
+        extractors = {}
+        for event in events:
+            if event['event'] == 'extraction':
+                backend = extractors.setdefault(event['extractor'], {'papers': 0, 'rejected': 0, 'pages': 0, 'seconds': 0.0})
+                backend['rejected' if 'rejected' in event else 'papers'] += 1
+                backend['pages'] += event['pages']
+                backend['seconds'] += event['seconds']
+        for backend in extractors.values():
+            backend['pages_per_second'] = backend['pages'] / backend['seconds'] if backend['seconds'] else 0.0
+        failures = [event for event in events if event['event'] == 'failure']
+        summary = {
+            'papers': len(papers),
+            'unfinished': sorted(started - {paper['file'] for paper in papers} - {failure['file'] for failure in failures}),
+            'failed': sorted({failure['file'] for failure in failures if failure['outcome'] == 'failed'}),
+            'recovered': sorted({failure['file'] for failure in failures if failure['outcome'] == 'recovered'}),
+            'wall': wall,
+            'paper_wall': sum(paper['wall'] for paper in papers),
+            'paper_cpu': sum(paper['cpu'] for paper in papers),
+            'pages': pages,
+            'pages_per_second': pages / wall if wall else 0.0,
+            'text_bytes': sum(paper.get('text_bytes', 0) for paper in papers),
+            'paper_stages': paper_stages,
+            'stages': stages,
+            'extractors': extractors,
+            'pipeline': [{key: event[key] for key in ('slots', 'occupancy', 'mean_queue')}
+                         for event in events if event['event'] == 'pipeline'],
+            'cache_hit_rates': {name: hits / (hits + misses) for name, (hits, misses) in caches.items() if hits + misses},
+            'peak_rss_mb': max(peak_rss_mb(), max((paper['peak_rss_mb'] for paper in papers), default=0)),
+            'slowest': [{'file': paper['file'], 'wall': paper['wall'], 'pages': paper.get('pages')}
+                        for paper in sorted(papers, key=lambda paper: paper['wall'], reverse=True)[:slowest]],
+            **fields
+        }
+        self.emit('summary', **summary)
+        return summary
+
+
+_tracer = None
+
+
+def start_tracing(path, script):
+    """Starts tracing this run to a JSONL file; worker processes started afterwards trace into it too."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tracer = Tracer(path, script)
+    os.environ[TRACE_PATH_ENV] = path
+    os.environ[TRACE_RUN_ENV] = tracer.run_id
+    os.environ[TRACE_SCRIPT_ENV] = script
+    global _tracer
+    _tracer = tracer
+    tracer.emit('run_start', argv=sys.argv)
+    return tracer
+
+
+def get_tracer():
+    """Returns the tracer of the current run, or None when the run isn't traced."""
+    global _tracer
+    if _tracer is None and os.environ.get(TRACE_PATH_ENV):
+        _tracer = Tracer(os.environ[TRACE_PATH_ENV], os.environ.get(TRACE_SCRIPT_ENV, ''), os.environ.get(TRACE_RUN_ENV))
+    return _tracer
+
+
+class PaperTrace:
+    """Per-stage wall time, page count, and extracted text size of one paper."""
+
+    def __init__(self):
+        self.stages = {}
+        self.pages = 0
+        self.text_bytes = 0
+        self._nested = []
+
+    @contextmanager
+    def stage(self, name):
+        """Times a stage of the paper's analysis, excluding time spent in stages nested inside it."""
+        self._nested.append(0.0)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.stages[name] = self.stages.get(name, 0) + elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def count_pages(self, pages, stage='extraction'):
+        """Passes page texts through, counting them and their UTF-8 size and timing how long each took to produce."""
+        pages = iter(pages)
+        while True:
+            with self.stage(stage):
+                page_text = next(pages, None)
+            if page_text is None:
+                return
+            self.pages += 1
+            self.text_bytes += len(page_text.encode('utf-8'))
+            yield page_text
+
+
+@contextmanager
+def trace_paper(pdf_path, cache_stats=None):
+    """Times the analysis of one paper and, when the run is traced, records it.
+
+    A 'paper_start' event is written before the paper is analyzed, so a paper that stalls
+    or crashes the run still shows up in the trace. `cache_stats` returns the text cache's
+    (hits, misses) so the paper's cache use can be recorded.
+    """
+    tracer = get_tracer()
+    paper = PaperTrace()
+    filename = os.path.basename(pdf_path)
+    if tracer is not None:
+        tracer.emit('paper_start', file=filename)
+    hits, misses = cache_stats() if cache_stats else (0, 0)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    error = {}
+    try:
+        yield paper
+    except Exception as e:
+        error = {'error': repr(e)}
+        raise
+    finally:
+        if tracer is not None:
+            end_hits, end_misses = cache_stats() if cache_stats else (0, 0)
+            tracer.emit('paper', file=filename, wall=time.perf_counter() - wall_start, cpu=time.process_time() - cpu_start,
+                        pages=paper.pages, text_bytes=paper.text_bytes, stages=paper.stages,
+                        cache_hits=end_hits - hits, cache_misses=end_misses - misses, peak_rss_mb=peak_rss_mb(), **error)
+
+
+@contextmanager
+def trace_stage(name, **fields):
+    """Times a run-level stage when the run is traced; does nothing otherwise."""
+    tracer = get_tracer()
+    if tracer is None:
+        yield
+        return
+    with tracer.stage(name, **fields):
+        yield
+
+
+_exhausted = object()
+
+
+def trace_iter(items, name, **fields):
+    """Yields the items of an iterable, tracing the time taken to produce each one as a stage."""
+    items = iter(items)
+    while True:
+        with trace_stage(name, **fields):
+            item = next(items, _exhausted)
+        if item is _exhausted:
+            return
+        yield item
+
+
+def trace_cache(name, cache):
+    """Records the hits and misses of a cache (e.g. the summary cache) in the trace."""
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.emit('cache', cache=name, hits=cache.hits, misses=cache.misses)
+
+
+def finish_tracing(slowest=DEFAULT_SLOWEST, **fields):
+    """Records and prints the summary of a traced run; does nothing when the run isn't traced."""
+    tracer = get_tracer()
+    if tracer is None:
+        return None
+    summary = tracer.summary(slowest, **fields)
+    print_summary(summary)
+    print(f"Trace saved at {tracer.path} (run {tracer.run_id})")
+    return summary
+
+
+def print_summary(summary):
+    """Prints the headline numbers of a run summary."""
+    print(f"\nTraced run took {summary['wall']:.1f}s, peak RSS {summary['peak_rss_mb']:.0f} MB")
+    if summary['papers']:
+        print(f"{summary['papers']} papers, {summary['pages']} pages ({summary['pages_per_second']:.1f} pages/s), "
+              f"{summary['text_bytes'] / 1024:.0f} KB of text")
+    for name, backend in summary['extractors'].items():
+        rejected = f" ({backend['rejected']} rejected)" if backend['rejected'] else ""
+        print(f"Parsed {backend['papers']} papers with {name}{rejected}: {backend['pages']} pages in "
+              f"{backend['seconds']:.1f}s ({backend['pages_per_second']:.1f} pages/s)")
+    for name, rate in summary['cache_hit_rates'].items():
+        print(f"{name.capitalize()} cache hit rate: {rate:.0%}")
+    for stage, seconds in {**summary['paper_stages'], **summary['stages']}.items():
+        print(f"  {stage:<16}{seconds:>8.2f}s")
+    if summary['slowest']:
+        print("Slowest papers:")
+        for paper in summary['slowest']:
+            print(f"  {paper['wall']:>8.2f}s  {paper['file']} ({paper['pages']} pages)")
+    if summary['failed'] or summary['recovered']:
+        print(f"Extraction failures: {len(summary['failed'])} papers failed, {len(summary['recovered'])} recovered")
+    if summary['unfinished']:
+        print(f"Started but never finished: {', '.join(summary['unfinished'])}")
+
+
+@contextmanager
+def profiled(path):
+    """Profiles the enclosed code into `path` when it is given.
+
+    A path ending in .html uses pyinstrument (if installed) for a readable call tree;
+    anything else writes cProfile stats that can be opened with pstats or snakeviz.
+    Worker processes started meanwhile (see profiled_worker) are profiled with cProfile and
+    their stats are merged into the .prof profile, or saved next to an .html one as
+    <name>.workers.prof.
+    """
+    if not path:
+        yield
+        return
+    if path.endswith('.html'):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            sys.exit("Profiling to HTML needs pyinstrument (pip install pyinstrument); use a .prof path for cProfile.")
+    import pstats
+    import tempfile
+    worker_dir = tempfile.mkdtemp(prefix='paper-profile-')
+    os.environ[PROFILE_DIR_ENV] = worker_dir
+    try:
+        with _profiled_process(path):
+            yield
+    finally:
+        del os.environ[PROFILE_DIR_ENV]
+        worker_paths = sorted(os.path.join(worker_dir, name) for name in os.listdir(worker_dir))
+        workers = f"{len(worker_paths)} worker process{'es' if len(worker_paths) != 1 else ''}"
+        workers_note = f" (with {workers})" if worker_paths else ""
+        if path.endswith('.html'):
+            if worker_paths:
+                workers_path = os.path.splitext(path)[0] + '.workers.prof'
+                pstats.Stats(*worker_paths).dump_stats(workers_path)
+                workers_note = f"; {workers} in {workers_path}"
+            print(f"Profile saved at {path}{workers_note}")
+        else:
+            stats = pstats.Stats(path)
+            if worker_paths:
+                stats.add(*worker_paths)
+                stats.dump_stats(path)
+            print(f"Profile saved at {path}{workers_note}; top functions by cumulative time:")
+            stats.sort_stats('cumulative').print_stats(15)
+        for worker_path in worker_paths:
+            os.remove(worker_path)
+        os.rmdir(worker_dir)
+
+
+@contextmanager
+def _profiled_process(path):
+    """Profiles the enclosed code of this process into `path` (pyinstrument HTML or cProfile stats)."""
+    if path.endswith('.html'):
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+@contextmanager
+def profiled_worker():
+    """Profiles a worker process with cProfile while the run that started it is profiled.
+
+    The stats go to a file of the worker's own in the run's profile directory, where
+    profiled() merges them when the run finishes. A worker that is killed (e.g. on a
+    timeout) leaves no stats.
+    """
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    if not profile_dir:
+        yield
+        return
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(profile_dir, f"worker-{os.getpid()}.prof"))
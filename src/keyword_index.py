@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import json
+import hashlib
+from disk_cache import DiskCache
+from keyword_matcher import KeywordMatcher, KEYWORDS_PATH
+
+# Sections the analysis scripts read; a keywords.json may define others (e.g. problems, solutions)
+REQUIRED_SECTIONS = ['themes', 'datasets', 'regions', 'dataset_variations',
+                     'detection_variations', 'prevention_variations', 'prediction_variations',
+                     'management_variations', 'vegetation_variations', 'elevation_variations',
+                     'pde_categories', 'sde_categories', 'sensor_categories']
+
+# Sections that hold regular expressions rather than literal keywords
+PATTERN_SECTIONS = ['dataset_variations']
+
+# Every section is a list of distinct, non-blank keywords (or regular expressions)
+_keyword_list = {'type': 'array', 'uniqueItems': True, 'items': {'type': 'string', 'pattern': r'\S'}}
+KEYWORDS_SCHEMA = {
+    'type': 'object',
+    'required': REQUIRED_SECTIONS,
+    'properties': {section: {**_keyword_list, 'items': {**_keyword_list['items'], 'format': 'regex'}}
+                   for section in PATTERN_SECTIONS},
+    'additionalProperties': _keyword_list
+}
+
+# Bump whenever the schema or KeywordMatcher's compiled form changes, so stale cache entries are ignored
+INDEX_VERSION = 'keyword-index/1'
+
+# Location and size budget of the compiled keyword cache (overridable from the environment)
+INDEX_CACHE_PATH = os.environ.get('KEYWORD_INDEX_CACHE', './cache/keyword_index.sqlite')
+INDEX_CACHE_MAX_BYTES = int(os.environ.get('KEYWORD_INDEX_CACHE_MAX_BYTES', 64 * 1024 ** 2))
+
+# Seconds between checks of a keyword file for changes by get_keyword_index
+RELOAD_INTERVAL = 2.0
+
+
+class KeywordFileError(ValueError):
+    """A keywords.json file that does not match the schema."""
+
+
+class KeywordIndexCache(DiskCache):
+    """Compiled keyword matchers keyed by the SHA-256 of the keyword file and the sections they cover."""
+
+    table = 'keyword_index'
+
+    def __init__(self, path=INDEX_CACHE_PATH, max_bytes=INDEX_CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes)
+
+
+_index_cache = None
+_index_cache_pid = None
+
+
+def get_index_cache():
+    """Opens the compiled keyword cache on first use (and again in each worker process)."""
+    global _index_cache, _index_cache_pid
+    if _index_cache is None or _index_cache_pid != os.getpid():
+        _index_cache = KeywordIndexCache()
+        _index_cache_pid = os.getpid()
+    return _index_cache
+
+
+def validate_keywords(keyword_data, path=KEYWORDS_PATH):
+    """Checks keyword data against KEYWORDS_SCHEMA, raising KeywordFileError on the first problem."""
+    import jsonschema
+    validator = jsonschema.Draft7Validator(KEYWORDS_SCHEMA, format_checker=jsonschema.FormatChecker())
+    error = jsonschema.exceptions.best_match(validator.iter_errors(keyword_data))
+    if error is not None:
+        location = '/'.join(str(part) for part in error.absolute_path) or 'top level'
+        raise KeywordFileError(f"{path}: {error.message} (at {location})")
+
+
+class KeywordIndex:
+    """The validated sections of a keywords.json file and the matchers compiled from them.
+
+    The file is validated against KEYWORDS_SCHEMA once per version of its contents, and
+    compiled matchers are cached on disk under the file's SHA-256, so a script only builds
+    them the first time it runs with a new keyword file. An index never changes once loaded,
+    so code holding one (like the analysis scripts, which take theirs when they start)
+    classifies every paper with the keywords whose hash it stores; get_keyword_index hands
+    out a new index when the file changes.
+    """
+
+    def __init__(self, path=KEYWORDS_PATH, cache=None):
+        self.path = path
+        self._cache = cache
+        self.signature = _file_signature(path)
+        with open(self.path, 'rb') as f:
+            contents = f.read()
+        sha256 = hashlib.sha256(contents).hexdigest()
+        keyword_data = json.loads(contents)
+        cache = self._cache or get_index_cache()
+        if cache.get(sha256, INDEX_VERSION) is None:
+            validate_keywords(keyword_data, self.path)
+            cache.put(sha256, True, INDEX_VERSION)
+        self.keyword_data = keyword_data
+        self.sha256 = sha256
+        self._matchers = {}
+        self._patterns = {}
+
+    def sections(self, names):
+        """Returns {section: keywords} for the named sections."""
+        return {name: self.keyword_data[name] for name in names}
+
+    def matcher(self, names):
+        """Returns a KeywordMatcher over the named sections, compiled only if it is not cached."""
+        names = tuple(names)
+        if names not in self._matchers:
+            cache = self._cache or get_index_cache()
+            version = f"{INDEX_VERSION} {' '.join(names)}"
+            compiled = cache.get(self.sha256, version)
+            if compiled is None:
+                matcher = KeywordMatcher({name: self.keyword_data[name] for name in names})
+                cache.put(self.sha256, matcher.compiled(), version)
+            else:
+                matcher = KeywordMatcher.from_compiled(compiled)
+            self._matchers[names] = matcher
+        return self._matchers[names]
+
+    def patterns(self, name):
+        """Returns the regular expressions of a pattern section (e.g. dataset_variations), compiled case-insensitively."""
+        if name not in self._patterns:
+            self._patterns[name] = [re.compile(pattern, re.IGNORECASE) for pattern in self.keyword_data[name]]
+        return self._patterns[name]
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+_indexes = {}
+_checked = {}
+
+
+def get_keyword_index(path=KEYWORDS_PATH):
+    """Returns this process's index of a keyword file, loading it on first use.
+
+    The file is checked for changes at most every RELOAD_INTERVAL seconds, and a changed file
+    is loaded into a new index, so e.g. a notebook calling this (or text_index's
+    load_keyword_sections) sees edits without restarting. An edit that fails validation is
+    reported and the previous index is kept.
+    """
+    path = os.path.abspath(path)
+    if path not in _indexes:
+        _indexes[path] = KeywordIndex(path)
+        _checked[path] = (time.monotonic(), _indexes[path].signature)
+        return _indexes[path]
+
+    checked, seen = _checked[path]
+    if time.monotonic() - checked < RELOAD_INTERVAL:
+        return _indexes[path]
+    try:
+        signature = _file_signature(path)
+    except OSError:
+        signature = seen  # e.g. replaced by an editor; looked at again on the next check
+    if signature != seen:
+        try:
+            _indexes[path] = KeywordIndex(path)
+        except (OSError, ValueError) as e:  # e.g. malformed JSON, or caught mid-save
+            print(f"Keeping the previous keywords: {e}")
+    # A broken edit is reported once, not at every check until it is fixed
+    _checked[path] = (time.monotonic(), signature)
+    return _indexes[path]
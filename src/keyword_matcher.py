@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import bisect
+import itertools
+
+# keywords.json next to the scripts, wherever they are run from (overridable from the environment)
+KEYWORDS_PATH = os.environ.get('KEYWORDS', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keywords.json'))
+
+# Same notion of a "word" character as the \b anchors the scripts have always used
+WORD_CHAR = re.compile(r'\w')
+
+
+def _is_boundary(left, right):
+    """Returns True when a \\b anchor would match between the two characters."""
+    return bool(WORD_CHAR.match(left)) != bool(WORD_CHAR.match(right))
+
+
+def _trie_pattern(node):
+    """Turns a character trie into a regex that prefers the longest keyword."""
+    terminal = '' in node
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+    pattern = '(?:' + '|'.join(branches) + ')'
+    return pattern + '?' if terminal else pattern
+
+
+def _lowered(text):
+    """Returns the lowercased text and, where lowercasing changed its length (e.g. 'İ' becomes
+    two characters), the position in the original text of each lowercased character, else None."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered, None
+    return lowered, [position for position, char in enumerate(text) for _ in char.lower()]
+
+
+def load_keywords(path=KEYWORDS_PATH):
+    """Returns the keyword lists of a keywords.json file, by section."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class KeywordMatcher:
+    """Finds every keyword of every category in a single pass over the lowercased text.
+
+    All keywords are folded into one trie-shaped alternation that is tried at every
+    position of the text, so the cost is one scan regardless of how many keywords
+    there are. A keyword is reported exactly when ``re.search(r'\\b' + re.escape(kw) + r'\\b',
+    text, re.IGNORECASE)`` would have found it.
+    """
+
+    def __init__(self, categories):
+        self.categories = {name: list(keywords) for name, keywords in categories.items()}
+        keys = sorted({keyword.lower() for keywords in self.categories.values() for keyword in keywords})
+
+        trie = {}
+        for key in keys:
+            node = trie
+            for char in key:
+                node = node.setdefault(char, {})
+            node[''] = True
+
+        # The regex reports the longest keyword starting at a position; shorter keywords
+        # that are prefixes of it (ending on a word boundary) are found there too. They all
+        # lie on the key's path through the trie.
+        self._implied = {}
+        for key in keys:
+            node = trie
+            prefixes = []
+            for end, char in enumerate(key, 1):
+                node = node[char]
+                if '' in node and (end == len(key) or _is_boundary(key[end - 1], key[end])):
+                    prefixes.append(key[:end])
+            self._implied[key] = prefixes
+        self._set_owners()
+        self.max_length = max((len(key) for key in keys), default=0)
+        self._pattern = re.compile(r'(?=\b(' + _trie_pattern(trie) + r')\b)') if keys else None
+
+    def _set_owners(self):
+        self._owners = {}
+        for name, keywords in self.categories.items():
+            for keyword in keywords:
+                self._owners.setdefault(keyword.lower(), []).append((name, keyword))
+
+    def compiled(self):
+        """Returns the matcher as JSON-serializable data that from_compiled turns back into a matcher."""
+        return {'categories': self.categories, 'implied': self._implied, 'max_length': self.max_length,
+                'pattern': self._pattern.pattern if self._pattern is not None else None}
+
+    @classmethod
+    def from_compiled(cls, data):
+        """Rebuilds a matcher from compiled() data without building the trie again."""
+        matcher = cls.__new__(cls)
+        matcher.categories = data['categories']
+        matcher._implied = data['implied']
+        matcher._set_owners()
+        matcher.max_length = data['max_length']
+        matcher._pattern = re.compile(data['pattern']) if data['pattern'] is not None else None
+        return matcher
+
+    def find_keys(self, text):
+        """Returns the set of lowercased keywords present in the text."""
+        found = set()
+        if self._pattern is None:
+            return found
+        for key in set(self._pattern.findall(text.lower())):
+            found.update(self._implied[key])
+        return found
+
+    def find_keys_in_stream(self, chunks):
+        """Returns the set of lowercased keywords present in the concatenation of the chunks (see KeywordStream)."""
+        stream = KeywordStream(self)
+        for chunk in chunks:
+            stream.feed(chunk)
+        return stream.close()
+
+    def locate(self, text):
+        """Returns (category, keyword, start, end) for every occurrence of every keyword in the text.
+
+        Offsets index the text as given, even where lowercasing it changed its length.
+        """
+        occurrences = []
+        if self._pattern is None:
+            return occurrences
+        lowered, positions = _lowered(text)
+        for match in self._pattern.finditer(lowered):
+            for key in self._implied[match.group(1)]:
+                start, end = match.start(1), match.start(1) + len(key)
+                if positions is not None:
+                    start, end = positions[start], positions[end - 1] + 1
+                for name, keyword in self._owners[key]:
+                    occurrences.append((name, keyword, start, end))
+        return occurrences
+
+    def locate_pages(self, pages):
+        """Returns [category, keyword, page, start, end] for every keyword occurrence, numbering pages from 1.
+
+        The pages are matched joined together, as find would match the document's text, so a
+        keyword may continue onto the next page; its offsets are from the start of the page it
+        begins on.
+        """
+        page_starts = list(itertools.accumulate((len(page_text) for page_text in pages[:-1]), initial=0))
+        occurrences = []
+        for name, keyword, start, end in self.locate(''.join(pages)):
+            number = bisect.bisect_right(page_starts, start)
+            occurrences.append([name, keyword, number, start - page_starts[number - 1], end - page_starts[number - 1]])
+        return occurrences
+
+    def find(self, text):
+        """Returns, for each category, the keywords present in the text in keyword-list order."""
+        return self.resolve(self.find_keys(text))
+
+    def find_in_stream(self, chunks):
+        """Like find, but consumes the text incrementally from an iterable of chunks."""
+        return self.resolve(self.find_keys_in_stream(chunks))
+
+    def resolve(self, found_keys):
+        """Maps a set of lowercased keywords back onto each category's keyword list."""
+        return {name: [keyword for keyword in keywords if keyword.lower() in found_keys]
+                for name, keywords in self.categories.items()}
+
+
+class KeywordStream:
+    """Finds a matcher's keywords in text fed chunk by chunk (e.g. pages), as find_keys would in the whole text.
+
+    The last max_length + 1 characters are carried over so keywords spanning a boundary are
+    found, and a match touching the end of a chunk is only accepted once the character
+    after it is known.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.found = set()
+        self._carry = ''
+        self._at_start = True  # Whether the carry still begins at the very start of the text
+
+    def feed(self, chunk):
+        pattern = self.matcher._pattern
+        if pattern is None or not chunk:
+            return
+        text = self._carry + chunk.lower()
+        for match in pattern.finditer(text):
+            # Position 0 of a carried-over window lacks the character before it
+            if (match.start() or self._at_start) and match.end(1) < len(text):
+                self.found.update(self.matcher._implied[match.group(1)])
+        self._at_start = self._at_start and len(text) <= self.matcher.max_length + 1
+        self._carry = text[-(self.matcher.max_length + 1):]
+
+    def close(self):
+        """Returns the set of lowercased keywords present in all the text fed."""
+        if self.matcher._pattern is not None:
+            for match in self.matcher._pattern.finditer(self._carry):
+                if match.start() or self._at_start:
+                    self.found.update(self.matcher._implied[match.group(1)])
+        self._carry = ''
+        return self.found
+
+
+class PatternStream:
+    """Finds a regular expression's matches in text fed chunk by chunk, as finditer would in the whole text.
+
+    Only the text that a match could still start in is kept: a match is accepted once
+    `window` more characters have arrived after it (or the text has ended), so a pattern is
+    matched exactly as long as its matches, together with any look-ahead or look-behind, stay
+    within `window` characters. Each match is returned with the `context` characters after it.
+    """
+
+    def __init__(self, pattern, context=0, window=1000):
+        self.pattern = pattern
+        self.context = context
+        self.window = max(window, context)
+        self.matches = []
+        self._buffer = ''
+        self._pos = 0  # Where in the buffer the next match may start
+
+    def feed(self, chunk):
+        if chunk:
+            self._buffer += chunk
+            self._scan(final=False)
+
+    def close(self):
+        """Returns [(matched text, following context), ...] for every match in all the text fed."""
+        self._scan(final=True)
+        self._buffer = ''
+        return self.matches
+
+    def _scan(self, final):
+        while True:
+            # Past an empty match at the very end there is nothing left to search
+            match = self.pattern.search(self._buffer, self._pos) if self._pos <= len(self._buffer) else None
+            if match is None or (not final and len(self._buffer) - match.end() < self.window):
+                break
+            self.matches.append((match.group(), self._buffer[match.end():match.end() + self.context]))
+            # Like finditer, move past an empty match
+            self._pos = match.end() if match.end() > match.start() else match.end() + 1
+        if final:
+            return
+        # No match can start further than `window` characters from the end and still change
+        # with more text, so skip ahead to there (but not past a match waiting for its context)
+        skip_to = len(self._buffer) - self.window
+        self._pos = max(self._pos, min(match.start(), skip_to) if match is not None else skip_to)
+        # Keep `window` characters before the scan position for look-behind (e.g. \b)
+        cut = max(0, self._pos - self.window)
+        self._buffer = self._buffer[cut:]
+        self._pos -= cut
@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+from pdf_text import file_sha256
+
+
+def keyword_sections_hash(keyword_data, sections, result_version=None):
+    """Returns a hash of the keyword.json sections a script classifies papers with.
+
+    `result_version` is mixed in when given, so bumping it retires results stored in an
+    older shape.
+    """
+    selected = {section: keyword_data[section] for section in sections}
+    if result_version is not None:
+        selected = {'result_version': result_version, 'sections': selected}
+    return hashlib.sha256(json.dumps(selected, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """Records each analyzed paper's fingerprint and result so later runs can skip it.
+
+    An entry is reused while the file's size and mtime (or, failing those, its SHA-256)
+    are unchanged and it was classified with the current keyword sections.
+
+    Each recorded entry is also appended to a journal next to the manifest and synced to
+    disk straight away, so a run that dies part-way keeps the papers it finished; the next
+    run replays the journal, and save() folds it into the manifest.
+    """
+
+    def __init__(self, path, keywords_hash):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.keywords_hash = keywords_hash
+        self.entries = {}
+        self._journal = None
+        self._torn_tail = False
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)['papers']
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    # A record torn by a crash is skipped, and the next record starts on a line of its own
+                    self._torn_tail = not line.endswith('\n')
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.entries[entry['path']] = entry
+
+    def lookup(self, pdf_path):
+        """Returns the stored result for an unchanged paper, or None if it must be re-analyzed."""
+        entry = self.entries.get(pdf_path)
+        if entry is None or entry['keywords_hash'] != self.keywords_hash:
+            return None
+        stat = os.stat(pdf_path)
+        if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            return entry['result']
+        # Touched but possibly not modified: fall back to comparing contents
+        if stat.st_size == entry['size'] and file_sha256(pdf_path) == entry['sha256']:
+            entry['mtime'] = stat.st_mtime
+            return entry['result']
+        return None
+
+    def record(self, pdf_path, result):
+        """Stores a freshly analyzed paper's fingerprint and result."""
+        stat = os.stat(pdf_path)
+        self.entries[pdf_path] = {
+            'path': pdf_path,
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha256': file_sha256(pdf_path),
+            'keywords_hash': self.keywords_hash,
+            'result': result
+        }
+        if self._journal is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._journal = open(self.journal_path, 'a')
+            if self._torn_tail:
+                self._journal.write('\n')
+        self._journal.write(json.dumps(self.entries[pdf_path]) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def retain(self, pdf_paths):
+        """Forgets papers that are no longer in the corpus and returns their paths."""
+        keep = set(pdf_paths)
+        removed = sorted(path for path in self.entries if path not in keep)
+        for path in removed:
+            del self.entries[path]
+        return removed
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'keywords_hash': self.keywords_hash, 'papers': self.entries}, f)
+        os.replace(tmp_path, self.path)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+def remove_manifest(path):
+    """Deletes a manifest and its journal, e.g. a checkpoint once its run has been stored."""
+    for stale_path in (path, path + '.journal'):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
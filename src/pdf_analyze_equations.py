@@ -1,44 +1,65 @@
 import os
-import pdfplumber
-import re
-import json
+import csv
+import argparse
+from functools import partial
 from collections import defaultdict
-import matplotlib.pyplot as plt
+from plotting import bar_chart, render_figures
+from keyword_index import get_keyword_index
+from keyword_matcher import KeywordStream
+from pdf_text import stream_text_from_pdf, default_cache_stats
+from duplicates import canonical_papers, link_aliases
+from corpus import list_pdf_files, map_papers, Supervision, report_failures, DEFAULT_TIMEOUT, DEFAULT_MEMORY_MB
+from manifest import Manifest, keyword_sections_hash, remove_manifest
+from result_store import ResultStore, OFFSETS_KEY
+from sections import extract_section_pages, section_text, equation_excerpts, SECTIONS, DEFAULT_SECTIONS
+from cooccurrence import TermIncidence
+from instrumentation import start_tracing, trace_paper, trace_stage, finish_tracing, profiled
 
-# Load keyword lists from JSON file
-with open('./src/keywords.json', 'r') as f:
-    keyword_data = json.load(f)
+# Load the validated keyword lists (see keyword_index.py)
+keyword_index = get_keyword_index()
+keyword_data = keyword_index.keyword_data
 
 # Extract the lists from the loaded JSON
 pde_subcategories = keyword_data['pde_categories']
 sde_subcategories = keyword_data['sde_categories']
 sensor_subcategories = keyword_data['sensor_categories']
 
+# Compile the PDE, SDE, and sensor lists into one matcher so each PDF is scanned once
+keyword_matcher = keyword_index.matcher(['pde_categories', 'sde_categories', 'sensor_categories'])
+
+# Manifest of analyzed papers used by --incremental runs, tied to the keyword sections above
+manifest_path = './cache/equations_manifest.json'
+# Results of an unfinished --checkpoint run; removed once the run has been stored
+checkpoint_path = './cache/equations_checkpoint.json'
+keyword_sections = ['pde_categories', 'sde_categories', 'sensor_categories']
+# Bump when the shape of analyze_pdf's result changes, so older manifest entries are re-analyzed
+result_version = 3
+keywords_hash = keyword_sections_hash(keyword_data, keyword_sections, result_version)
+
 # Initialize counters and dictionaries
 paper_categories = {"PDE-only": 0, "SDE-only": 0, "Both PDE and SDE": 0, "Neither": 0, "Sensors": 0}
 paper_filenames = {"PDE-only": [], "SDE-only": [], "Both PDE and SDE": [], "Neither": [], "Sensors": []}
 pde_subcategory_counts = {subcat: 0 for subcat in pde_subcategories}
 sde_subcategory_counts = {subcat: 0 for subcat in sde_subcategories}
 sensor_subcategory_counts = {subcat: 0 for subcat in sensor_subcategories}
+term_incidence = TermIncidence({'pde': pde_subcategories, 'sde': sde_subcategories, 'sensor': sensor_subcategories})
+
+# Papers that could not be read are listed here instead of in the results
+failure_table_path = './equation_analysis_failures.csv'
+
+# Co-occurrence tables saved for the notebooks' heatmaps
+cooccurrence_path = './equation_cooccurrence.npz'
+
+# Per-paper table read by the notebooks
+detailed_results_path = './results/detailed_analysis_results.csv'
+detailed_results_columns = ['file', 'category', 'pde_subcategories', 'sde_subcategories', 'sensor_subcategories', 'equation_excerpts']
 
 # Helper functions
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a PDF file."""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text()
-        return text
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return ""
-
-def categorize_paper(text):
+def categorize_paper(matches):
     """Categorizes the paper into PDE-only, SDE-only, Both, Neither, or Sensors."""
-    has_pde = any(re.search(r'\b' + re.escape(subcat) + r'\b', text, re.IGNORECASE) for subcat in pde_subcategories)
-    has_sde = any(re.search(r'\b' + re.escape(subcat) + r'\b', text, re.IGNORECASE) for subcat in sde_subcategories)
-    has_sensors = any(re.search(r'\b' + re.escape(subcat) + r'\b', text, re.IGNORECASE) for subcat in sensor_subcategories)
+    has_pde = bool(matches['pde_categories'])
+    has_sde = bool(matches['sde_categories'])
+    has_sensors = bool(matches['sensor_categories'])
 
     if has_pde and has_sde:
         return "Both PDE and SDE"
@@ -51,58 +72,131 @@ def categorize_paper(text):
     else:
         return "Neither"
 
-def identify_subcategories(text, subcategories):
-    """Identifies subcategories in the given text."""
-    found_subcategories = []
-    for subcat in subcategories:
-        if re.search(r'\b' + re.escape(subcat) + r'\b', text, re.IGNORECASE):
-            found_subcategories.append(subcat)
-    return found_subcategories
+def identify_subcategories(matches, category):
+    """Identifies the subcategories of the given category found in the text."""
+    return list(matches[category])
 
 # Main analysis function
-def analyze_pdfs_in_folder(folder_path):
-    """Analyze each PDF in the folder for PDE, SDE, and sensor definitions."""
-    results = []
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(folder_path, filename)
-            print(f"Analyzing {filename}...")
-
-            # Extract text from the PDF
-            text = extract_text_from_pdf(pdf_path)
-
-            # Categorize the paper
-            category = categorize_paper(text)
-            paper_categories[category] += 1
-            paper_filenames[category].append(filename)
-
-            # Identify PDE, SDE, and sensor subcategories
-            pde_found = identify_subcategories(text, pde_subcategories)
-            sde_found = identify_subcategories(text, sde_subcategories)
-            sensors_found = identify_subcategories(text, sensor_subcategories)
-
-            # Update subcategory counts
-            for subcat in pde_found:
-                pde_subcategory_counts[subcat] += 1
-            for subcat in sde_found:
-                sde_subcategory_counts[subcat] += 1
-            for subcat in sensors_found:
-                sensor_subcategory_counts[subcat] += 1
-
-            # Store results
-            results.append({
-                "file": filename,
-                "category": category,
-                "pde_subcategories": pde_found,
-                "sde_subcategories": sde_found,
-                "sensor_subcategories": sensors_found
-            })
-
-    return results
+def analyze_pdf(pdf_path, sections=None):
+    """Analyze one PDF for PDE, SDE, and sensor definitions.
+
+    With `sections` (e.g. ['abstract', 'body', 'equations']), the paper is segmented from its
+    layout and only those sections are scanned, so reference titles, running headers, and
+    footers can't produce matches; the display equations found are returned as excerpts.
+    Returns a self-contained result for the paper; no module-level counters are touched,
+    so this can run in a worker process.
+    """
+    filename = os.path.basename(pdf_path)
+    print(f"Analyzing {filename}...")
+
+    with trace_paper(pdf_path, default_cache_stats) as paper:
+        if sections is None:
+            # Stream the text of the PDF page by page, so the whole document never has to be held in memory
+            pages = stream_text_from_pdf(pdf_path)
+            excerpts = []
+        else:
+            with paper.stage('extraction'):
+                segmented = extract_section_pages(pdf_path)
+            pages = (section_text(segments, sections) for segments in segmented)
+            excerpts = equation_excerpts(segmented)
+
+        with paper.stage('matching'):
+            return analyze_pages(filename, paper.count_pages(pages), excerpts)
+
+def analyze_pages(filename, pages, excerpts=()):
+    """Analyze the text of one PDF, given as an iterable of page texts, for PDE, SDE, and sensor definitions."""
+    scan = PageScan(filename, excerpts)
+    for page_text in pages:
+        scan.add_page(page_text)
+    return scan.result()
+
+class PageScan:
+    """Analyzes the pages of one PDF as they are extracted, keeping only a bounded tail of the text.
+
+    The survey feeds each page to the scans of several analyzers, so the pages are extracted
+    once and never held together.
+    """
+
+    def __init__(self, filename, excerpts=()):
+        self.filename = filename
+        self.excerpts = excerpts
+        self.page_number = 0
+        self.offsets = []
+        self.keywords = KeywordStream(keyword_matcher)
+
+    def add_page(self, page_text):
+        # Record where each keyword occurs as the pages stream past
+        self.page_number += 1
+        self.offsets.extend([name, keyword, self.page_number, start, end]
+                            for name, keyword, start, end in keyword_matcher.locate(page_text))
+        self.keywords.feed(page_text)
+
+    def result(self):
+        """Returns the paper's result once every page has been added."""
+        matches = keyword_matcher.resolve(self.keywords.close())
+        return {
+            "file": self.filename,
+            "category": categorize_paper(matches),
+            "pde_subcategories": identify_subcategories(matches, 'pde_categories'),
+            "sde_subcategories": identify_subcategories(matches, 'sde_categories'),
+            "sensor_subcategories": identify_subcategories(matches, 'sensor_categories'),
+            OFFSETS_KEY: self.offsets,
+            "equation_excerpts": list(self.excerpts)
+        }
+
+def merge_result(result):
+    """Adds one paper's result to the module-level category and subcategory counts."""
+    paper_categories[result["category"]] += 1
+    paper_filenames[result["category"]].append(result["file"])
+
+    # Update subcategory counts
+    for subcat in result["pde_subcategories"]:
+        pde_subcategory_counts[subcat] += 1
+    for subcat in result["sde_subcategories"]:
+        sde_subcategory_counts[subcat] += 1
+    for subcat in result["sensor_subcategories"]:
+        sensor_subcategory_counts[subcat] += 1
+
+    # Track PDE, SDE, and sensor co-occurrences
+    term_incidence.add_paper({
+        'pde': result["pde_subcategories"],
+        'sde': result["sde_subcategories"],
+        'sensor': result["sensor_subcategories"]
+    })
+
+def analyze_pdfs_in_folder(folder_path, workers=1, incremental=False, supervision=None, sections=None, dedupe=False,
+                           checkpoint=False):
+    """Analyze each PDF in the folder for PDE, SDE, and sensor definitions (in the given sections only, if any).
+
+    Returns every paper's result in filename order, for any number of `workers` processes.
+    With `incremental`, only new or changed papers are analyzed and the rest reuse the
+    results stored in the manifest. Papers that can't be read even with the fallback
+    extractor are left out of the results and recorded in `supervision.failures`. With
+    `dedupe`, only one copy of each duplicated paper is analyzed and counted, and the
+    other copies are listed in its result's 'aliases'. With `checkpoint`, each result is
+    journaled as it finishes and papers finished by an interrupted checkpointed run are
+    not analyzed again.
+    """
+    pdf_paths = [os.path.join(folder_path, filename) for filename in list_pdf_files(folder_path)]
+    if dedupe:
+        pdf_paths, aliases = canonical_papers(pdf_paths, workers, supervision)
+    # Stored results only apply to runs that scanned the same sections; the incremental
+    # manifest is journaled too, so it doubles as the checkpoint
+    manifest = Manifest(manifest_path if incremental else checkpoint_path,
+                        keyword_sections_hash(keyword_data, keyword_sections, [result_version, sections])) \
+        if incremental or checkpoint else None
+    analyze = partial(analyze_pdf, sections=sections) if sections else analyze_pdf
+    results = list(map_papers(analyze, pdf_paths, workers, manifest, supervision))
+    return link_aliases(results, aliases) if dedupe else results
 
 # Generate summary report and visualizations
 def generate_summary_report(results):
     """Generates a summary report and visualizations."""
+    write_summary_report(results)
+    plot_summary()
+
+def write_summary_report(results):
+    """Writes the per-paper results and the category, subcategory, and co-occurrence summaries."""
     report_path = './equation_analysis_summary_updated.txt'
     with open(report_path, 'w') as report:
         # Write detailed results
@@ -133,55 +227,108 @@ def generate_summary_report(results):
         for subcat, count in sensor_subcategory_counts.items():
             report.write(f"{subcat}: {count}\n")
 
+        # Write co-occurrence summaries
+        report.write("\nPDE-SDE Co-occurrences:\n")
+        for pair, count in term_incidence.pair_counts('pde', 'sde'):
+            report.write(f"{pair}: {count}\n")
+
+        report.write("\nSDE-Sensor Co-occurrences:\n")
+        for pair, count in term_incidence.pair_counts('sde', 'sensor'):
+            report.write(f"{pair}: {count}\n")
+
     print(f"Summary report saved at {report_path}")
 
-    # Generate visualizations
-    # Paper categorization
-    plt.figure(figsize=(8, 6))
-    plt.bar(paper_categories.keys(), paper_categories.values(), color="skyblue")
-    plt.title("Paper Categorization")
-    plt.xlabel("Category")
-    plt.ylabel("Number of Papers")
-    plt.savefig('./paper_categorization_updated.png')
-    plt.close()
-
-    # PDE subcategory distribution
-    plt.figure(figsize=(12, 8))
-    plt.barh(list(pde_subcategory_counts.keys()), list(pde_subcategory_counts.values()), color="lightgreen")
-    plt.title("PDE Subcategory Distribution", fontsize=18)
-    plt.xlabel("Frequency", fontsize=14)
-    plt.ylabel("Subcategories", fontsize=14)
-    plt.tight_layout()
-    plt.savefig('./pde_subcategory_distribution_updated.png')
-    plt.close()
-
-    # SDE subcategory distribution
-    plt.figure(figsize=(12, 8))
-    plt.barh(list(sde_subcategory_counts.keys()), list(sde_subcategory_counts.values()), color="lightcoral")
-    plt.title("SDE Subcategory Distribution", fontsize=18)
-    plt.xlabel("Frequency", fontsize=14)
-    plt.ylabel("Subcategories", fontsize=14)
-    plt.tight_layout()
-    plt.savefig('./sde_subcategory_distribution_updated.png')
-    plt.close()
-
-    # Sensor subcategory distribution
-    plt.figure(figsize=(12, 8))
-    plt.barh(list(sensor_subcategory_counts.keys()), list(sensor_subcategory_counts.values()), color="lightblue")
-    plt.title("Sensor Subcategory Distribution", fontsize=18)
-    plt.xlabel("Frequency", fontsize=14)
-    plt.ylabel("Subcategories", fontsize=14)
-    plt.tight_layout()
-    plt.savefig('./sensor_subcategory_distribution_updated.png')
-    plt.close()
-
-    print("Visualizations saved as PNG files.")
+    # Save the co-occurrence matrices for heatmaps
+    term_incidence.save(cooccurrence_path, {
+        'pde_sde_cooccurrence': ('pde', 'sde'),
+        'pde_sensor_cooccurrence': ('pde', 'sensor'),
+        'sde_sensor_cooccurrence': ('sde', 'sensor'),
+        'pde_sde_sensor_cooccurrence': ('pde', 'sde', 'sensor')
+    })
+    print(f"Co-occurrence matrices saved at {cooccurrence_path}")
+
+def write_detailed_results(results):
+    """Writes one CSV row per paper, joining the subcategory lists the way the notebooks expect."""
+    os.makedirs(os.path.dirname(detailed_results_path), exist_ok=True)
+    with open(detailed_results_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(detailed_results_columns)
+        for result in results:
+            writer.writerow([result['file'], result['category']] +
+                            [', '.join(result[column]) if result[column] else 'None' for column in detailed_results_columns[2:]])
+    print(f"Detailed results saved at {detailed_results_path}")
+
+def plot_summary(workers=None, force=False):
+    """Saves bar charts of the paper categories and the PDE, SDE, and sensor subcategory counts.
+
+    The charts are drawn in parallel, and any whose counts haven't changed since they were
+    last drawn is left as it is (unless `force`).
+    """
+    subcategory_chart = dict(horizontal=True, figsize=(12, 8), title_size=18, label_size=14, tight=True)
+    rendered, skipped = render_figures([
+        bar_chart('./paper_categorization_updated.png', paper_categories.keys(), paper_categories.values(),
+                  "Paper Categorization", "Category", "Number of Papers", "skyblue"),
+        bar_chart('./pde_subcategory_distribution_updated.png', pde_subcategory_counts.keys(), pde_subcategory_counts.values(),
+                  "PDE Subcategory Distribution", "Frequency", "Subcategories", "lightgreen", **subcategory_chart),
+        bar_chart('./sde_subcategory_distribution_updated.png', sde_subcategory_counts.keys(), sde_subcategory_counts.values(),
+                  "SDE Subcategory Distribution", "Frequency", "Subcategories", "lightcoral", **subcategory_chart),
+        bar_chart('./sensor_subcategory_distribution_updated.png', sensor_subcategory_counts.keys(), sensor_subcategory_counts.values(),
+                  "Sensor Subcategory Distribution", "Frequency", "Subcategories", "lightblue", **subcategory_chart)
+    ], workers, force=force)
+
+    print("Visualizations saved as PNG files." + (f" {len(skipped)} of them were unchanged and not redrawn." if skipped else ""))
+
+def render_reports(store, run_id=None):
+    """Renders the report, detailed results CSV, and plots from a stored run (the latest by default)."""
+    results = store.papers('equations', run_id)
+    for result in results:
+        merge_result(result)
+    with trace_stage('report'):
+        write_summary_report(results)
+        write_detailed_results(results)
+    with trace_stage('plotting'):
+        plot_summary()
 
 # Folder containing PDFs
 pdf_folder = "/Users/richardpurcell/Dropbox/dal04/PhD/papers/sensors_all/"
 
-# Run the analysis
-results = analyze_pdfs_in_folder(pdf_folder)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze PDFs for PDE, SDE, and sensor definitions.")
+    parser.add_argument("folder", nargs="?", default=pdf_folder, help="folder containing the PDFs")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--incremental", action="store_true", help="only analyze papers added or changed since the last incremental run")
+    parser.add_argument("--checkpoint", action="store_true", help="record each paper's result as soon as it finishes, and resume an interrupted --checkpoint run where it stopped")
+    parser.add_argument("--dedupe", action="store_true", help="analyze one copy of papers that appear under several filenames and list the others as its aliases")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"seconds allowed per paper before it is retried with the fallback extractor (default: {DEFAULT_TIMEOUT})")
+    parser.add_argument("--max-memory-mb", type=int, default=DEFAULT_MEMORY_MB, help=f"memory cap of each worker process in MB (default: {DEFAULT_MEMORY_MB})")
+    parser.add_argument("--trace", metavar="PATH", help="append per-paper and per-stage timings to a JSONL trace file")
+    parser.add_argument("--profile", metavar="PATH", help="profile the run into a cProfile .prof file (or a pyinstrument .html file)")
+    parser.add_argument("--sections", nargs="*", choices=SECTIONS, metavar="SECTION", help=f"only scan these sections of each paper, segmented from its layout ({', '.join(SECTIONS)}; default when given alone: {' '.join(DEFAULT_SECTIONS)}), and fill in the equation excerpts")
+    parser.add_argument("--from-store", nargs="?", const="latest", metavar="RUN_ID", help="re-render the report and plots from a stored run (the latest by default) without analyzing any PDFs")
+    args = parser.parse_args()
+    if args.trace:
+        start_tracing(args.trace, 'equations')
 
-# Generate summary report and visualizations
-generate_summary_report(results)
+    supervision = Supervision(args.timeout, args.max_memory_mb)
+    sections = (args.sections or DEFAULT_SECTIONS) if args.sections is not None else None
+    store = ResultStore()
+
+    with profiled(args.profile):
+        if args.from_store:
+            run_id = None if args.from_store == 'latest' else args.from_store
+        else:
+            # Run the analysis and store every paper's result
+            run_id = store.start_run('equations', args.folder, keywords_hash)
+            with trace_stage('analysis'):
+                results = analyze_pdfs_in_folder(args.folder, args.workers, args.incremental, supervision, sections,
+                                                 args.dedupe, args.checkpoint)
+            report_failures(supervision, failure_table_path)
+            store.save_results(run_id, 'equations', results, supervision.failures)
+            if args.checkpoint:
+                remove_manifest(checkpoint_path)
+            print(f"Results stored in {store.path} (run {run_id})")
+
+        # Generate summary report and visualizations
+        render_reports(store, run_id)
+    store.close()
+    finish_tracing()
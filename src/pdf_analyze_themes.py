@@ -1,20 +1,26 @@
 import os
-import pdfplumber
+import argparse
 import PyPDF2
 import re
-import json
-from itertools import combinations
-from collections import defaultdict
-
-# Load keyword lists from JSON file
-with open('./code/keywords.json', 'r') as f:
-    keyword_data = json.load(f)
+from keyword_index import get_keyword_index
+from keyword_matcher import KeywordStream, PatternStream
+from pdf_text import stream_text_from_pdf, default_cache_stats
+from duplicates import canonical_papers, link_aliases
+from corpus import list_pdf_files, map_papers, Supervision, report_failures, DEFAULT_TIMEOUT, DEFAULT_MEMORY_MB
+from manifest import Manifest, keyword_sections_hash, remove_manifest
+from result_store import ResultStore, OFFSETS_KEY
+from cooccurrence import TermIncidence
+from instrumentation import start_tracing, trace_paper, trace_stage, finish_tracing, profiled
+
+# Load the validated keyword lists (see keyword_index.py)
+keyword_index = get_keyword_index()
+keyword_data = keyword_index.keyword_data
 
 # Extract the lists from the loaded JSON
 themes = keyword_data['themes']
 datasets = keyword_data['datasets']
 regions = keyword_data['regions']
-dataset_variations = keyword_data['dataset_variations']
+dataset_variations = keyword_index.patterns('dataset_variations')
 detection_variations = keyword_data['detection_variations']
 prevention_variations = keyword_data['prevention_variations']
 prediction_variations = keyword_data['prediction_variations']
@@ -22,6 +28,20 @@ management_variations = keyword_data['management_variations']
 vegetation_variations = keyword_data['vegetation_variations']
 elevation_variations = keyword_data['elevation_variations']
 
+# Compile every keyword list into one matcher so each PDF is scanned once
+custom_term_categories = ['detection_variations', 'prevention_variations', 'prediction_variations',
+                          'management_variations', 'vegetation_variations', 'elevation_variations']
+keyword_matcher = keyword_index.matcher(['themes', 'datasets', 'regions'] + custom_term_categories)
+
+# Manifest of analyzed papers used by --incremental runs, tied to the keyword sections above
+manifest_path = './cache/themes_manifest.json'
+# Results of an unfinished --checkpoint run; removed once the run has been stored
+checkpoint_path = './cache/themes_checkpoint.json'
+keyword_sections = ['themes', 'datasets', 'regions', 'dataset_variations'] + custom_term_categories
+# Bump when the shape of analyze_pdf's result changes, so older manifest entries are re-analyzed
+result_version = 3
+keywords_hash = keyword_sections_hash(keyword_data, keyword_sections, result_version)
+
 # Initialize counters for PDFs mentioning custom terms (not the total occurrences)
 detection_count = 0
 prevention_count = 0
@@ -40,21 +60,13 @@ regional_focus_count = 0
 unclear_focus_count = 0
 
 # Dictionary to track co-occurrence of themes, theme-dataset, and region-dataset co-occurrences
-theme_cooccurrence = defaultdict(int)
-theme_dataset_cooccurrence = defaultdict(int)
-region_dataset_cooccurrence = defaultdict(int)  # New dictionary for region-dataset co-occurrence
+term_incidence = TermIncidence({'themes': themes, 'datasets': datasets, 'regions': regions})
 
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a PDF file."""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text()
-        return text
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return ""
+# Papers that could not be read are listed here instead of in the results
+failure_table_path = './pdf_analysis_failures.csv'
+
+# Co-occurrence tables saved for the notebooks' heatmaps
+cooccurrence_path = './theme_cooccurrence.npz'
 
 def extract_metadata_from_pdf(pdf_path):
     """Extracts metadata from a PDF file using PyPDF2 PdfReader."""
@@ -67,135 +79,196 @@ def extract_metadata_from_pdf(pdf_path):
         print(f"Error extracting metadata from {pdf_path}: {e}")
         return {}
 
-def search_for_keywords(text, keyword_list, count_dict):
-    """Searches the text for each keyword, returns found keywords, and updates the count dictionary."""
-    found_keywords = []
-    for keyword in keyword_list:
-        if re.search(r'\b' + re.escape(keyword) + r'\b', text, re.IGNORECASE):
-            found_keywords.append(keyword)
-            count_dict[keyword] += 1  # Count this as 1 mention for the entire PDF
-            break  # Ensure we only count once per document for each term
-    return found_keywords
-
-def search_for_custom_terms(text):
-    """Searches for detection, prevention, prediction, vegetation, elevation, and management mentions in a PDF."""
+def search_for_keywords(matched_keywords):
+    """Takes the keywords the matcher found in the text and returns the found keywords."""
+    return matched_keywords[:1]  # Ensure we only count once per document for each term
+
+def count_keywords(found_keywords, count_dict):
+    """Updates the count dictionary with the keywords found in one PDF."""
+    for keyword in found_keywords:
+        count_dict[keyword] += 1  # Count this as 1 mention for the entire PDF
+
+def search_for_custom_terms(matches):
+    """Returns which of the detection, prevention, prediction, vegetation, elevation, and management term lists a PDF mentions."""
+    return [name for name in custom_term_categories if matches[name]]
+
+def count_custom_terms(custom_terms):
+    """Updates the custom term counters with the term lists mentioned in one PDF."""
     global detection_count, prevention_count, prediction_count, management_count, vegetation_count, elevation_count
 
-    for term in detection_variations:
-        if re.search(r'\b' + re.escape(term) + r'\b', text, re.IGNORECASE):
-            detection_count += 1
-            break  # Only count once per document
-
-    for term in prevention_variations:
-        if re.search(r'\b' + re.escape(term) + r'\b', text, re.IGNORECASE):
-            prevention_count += 1
-            break
-
-    for term in prediction_variations:
-        if re.search(r'\b' + re.escape(term) + r'\b', text, re.IGNORECASE):
-            prediction_count += 1
-            break
-
-    for term in management_variations:
-        if re.search(r'\b' + re.escape(term) + r'\b', text, re.IGNORECASE):
-            management_count += 1
-            break
-
-    for term in vegetation_variations:
-        if re.search(r'\b' + re.escape(term) + r'\b', text, re.IGNORECASE):
-            vegetation_count += 1
-            break
-
-    for term in elevation_variations:
-        if re.search(r'\b' + re.escape(term) + r'\b', text, re.IGNORECASE):
-            elevation_count += 1
-            break
-
-def search_for_datasets_and_following_words(text, variations):
-    """Searches for variations of the word 'dataset' and captures following words."""
+    # Only count once per document
+    if 'detection_variations' in custom_terms:
+        detection_count += 1
+    if 'prevention_variations' in custom_terms:
+        prevention_count += 1
+    if 'prediction_variations' in custom_terms:
+        prediction_count += 1
+    if 'management_variations' in custom_terms:
+        management_count += 1
+    if 'vegetation_variations' in custom_terms:
+        vegetation_count += 1
+    if 'elevation_variations' in custom_terms:
+        elevation_count += 1
+
+def search_for_datasets_and_following_words(variation_matches):
+    """Captures the words following each variation of the word 'dataset', given each variation's (match, following text) pairs."""
     found_datasets = []
-    for variation in variations:
-        matches = re.finditer(variation, text, re.IGNORECASE)
-        for match in matches:
-            start_pos = match.end()
-            words_after = re.findall(r'\w+', text[start_pos:start_pos + 50])  # Adjust word count as needed
+    for matches in variation_matches:
+        for matched, following in matches:
+            words_after = re.findall(r'\w+', following)
             if words_after:
-                found_datasets.append(f"{match.group()}: {' '.join(words_after[:5])}")  # Limit to 5 following words
+                found_datasets.append(f"{matched}: {' '.join(words_after[:5])}")  # Limit to 5 following words
     return found_datasets
 
 def track_cooccurrence(found_themes, found_datasets, found_regions):
-    """Track how often themes appear together and with datasets or regions."""
-    # Track theme co-occurrences
-    if len(found_themes) > 1:
-        for theme_combination in combinations(found_themes, 2):
-            theme_cooccurrence[theme_combination] += 1
-    
-    # Track theme-dataset co-occurrences
-    for theme in found_themes:
-        for dataset in found_datasets:
-            theme_dataset_cooccurrence[(theme, dataset)] += 1
-
-    # Track region-dataset co-occurrences
-    for region in found_regions:
-        for dataset in found_datasets:
-            region_dataset_cooccurrence[(region, dataset)] += 1
-
-def analyze_pdfs_in_folder(folder_path):
-    """Analyze each PDF in the folder for themes, datasets, region keywords, custom terms, and metadata."""
-    global regional_focus_count, unclear_focus_count
-    results = []
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(folder_path, filename)
-            print(f"Analyzing {filename}...")
-            
-            # Extract text from the PDF
-            text = extract_text_from_pdf(pdf_path)
-            
-            # Extract metadata from the PDF
+    """Track how often themes appear together and with datasets or regions, given every one a paper mentions."""
+    term_incidence.add_paper({'themes': found_themes, 'datasets': found_datasets, 'regions': found_regions})
+
+def analyze_pdf(pdf_path):
+    """Analyze one PDF for themes, datasets, region keywords, custom terms, and metadata.
+
+    Returns a self-contained result for the paper; no module-level counters are touched,
+    so this can run in a worker process.
+    """
+    filename = os.path.basename(pdf_path)
+    print(f"Analyzing {filename}...")
+
+    with trace_paper(pdf_path, default_cache_stats) as paper:
+        # Extract metadata from the PDF
+        with paper.stage('metadata'):
             metadata = extract_metadata_from_pdf(pdf_path)
-            
-            # Combine text from PDF body and metadata
-            combined_text = text
-            if metadata:
-                combined_text += ' '.join([str(value) for value in metadata.values()])
-
-            # Search for custom terms in the text and update counts
-            search_for_custom_terms(combined_text)
-            
-            # Search for themes, datasets, and regions in the text, updating counts
-            found_themes = search_for_keywords(combined_text, themes, theme_count)
-            found_datasets = search_for_keywords(combined_text, datasets, dataset_count)
-            found_regions = search_for_keywords(combined_text, regions, region_count)
-            
-            # Track co-occurrences of themes and datasets
-            track_cooccurrence(found_themes, found_datasets, found_regions)
-
-            # Check if the paper is regional or global, and update counters
-            if found_regions:
-                regional_focus_count += 1
-            elif 'global' not in combined_text.lower():
-                unclear_focus_count += 1
-
-            # Search for variations of the word 'dataset' and capture following words
-            dataset_mentions = search_for_datasets_and_following_words(combined_text, dataset_variations)
-            
-            # Store results
-            if found_themes or found_datasets or found_regions or dataset_mentions:
-                results.append({
-                    'file': filename,
-                    'themes': found_themes,
-                    'datasets': found_datasets,
-                    'regions': found_regions,
-                    'dataset_mentions': dataset_mentions
-                })
-    return results
+
+        with paper.stage('matching'):
+            # Stream the text of the PDF page by page, so the whole document never has to be held in memory
+            return analyze_pages(filename, paper.count_pages(stream_text_from_pdf(pdf_path)), metadata)
+
+def analyze_pages(filename, pages, metadata=None):
+    """Analyze the text of one PDF, given as an iterable of page texts, and its metadata for themes, datasets, region keywords, and custom terms."""
+    scan = PageScan(filename, metadata)
+    for page_text in pages:
+        scan.add_page(page_text)
+    return scan.result()
+
+class PageScan:
+    """Analyzes the pages of one PDF as they are extracted, keeping only a bounded tail of the text.
+
+    The metadata is scanned after the last page, as if appended to the text. The survey feeds
+    each page to the scans of several analyzers, so the pages are extracted once and never
+    held together.
+    """
+
+    def __init__(self, filename, metadata=None):
+        self.filename = filename
+        self.metadata = metadata
+        self.page_number = 0
+        self.offsets = []
+        self.keywords = KeywordStream(keyword_matcher)
+        self.dataset_mentions = [PatternStream(variation, context=50) for variation in dataset_variations]
+        self.mentions_global = False
+        self._tail = ''
+
+    def add_page(self, page_text):
+        # Record where each keyword occurs as the pages stream past
+        self.page_number += 1
+        self.offsets.extend([name, keyword, self.page_number, start, end]
+                            for name, keyword, start, end in keyword_matcher.locate(page_text))
+        self._scan(page_text)
+
+    def _scan(self, text):
+        self.keywords.feed(text)
+        for mentions in self.dataset_mentions:
+            mentions.feed(text)
+        # Keep the end of the text, in case 'global' spans two pages
+        text = self._tail + text.lower()
+        self.mentions_global = self.mentions_global or 'global' in text
+        self._tail = text[-(len('global') - 1):]
+
+    def result(self):
+        """Returns the paper's result once every page has been added."""
+        # Combine text from PDF body and metadata
+        if self.metadata:
+            self._scan(' '.join([str(value) for value in self.metadata.values()]))
+        matches = keyword_matcher.resolve(self.keywords.close())
+
+        # Keep the themes, datasets, and regions found in the text
+        found_themes = search_for_keywords(matches['themes'])
+        found_datasets = search_for_keywords(matches['datasets'])
+        found_regions = search_for_keywords(matches['regions'])
+
+        # Check if the paper is regional or global
+        if found_regions:
+            focus = 'regional'
+        elif not self.mentions_global:
+            focus = 'unclear'
+        else:
+            focus = 'global'
+
+        # Variations of the word 'dataset' and the words following them
+        dataset_mentions = search_for_datasets_and_following_words([mentions.close() for mentions in self.dataset_mentions])
+
+        return {
+            'file': self.filename,
+            'themes': found_themes,
+            'datasets': found_datasets,
+            'regions': found_regions,
+            # Every theme, dataset, and region mentioned, for the co-occurrence tables
+            'theme_matches': matches['themes'],
+            'dataset_matches': matches['datasets'],
+            'region_matches': matches['regions'],
+            'dataset_mentions': dataset_mentions,
+            'custom_terms': search_for_custom_terms(matches),
+            'focus': focus,
+            OFFSETS_KEY: self.offsets
+        }
+
+def merge_result(result):
+    """Adds one paper's result to the module-level counts and co-occurrence tables."""
+    global regional_focus_count, unclear_focus_count
+
+    # Update counts for custom terms, themes, datasets, and regions
+    count_custom_terms(result['custom_terms'])
+    count_keywords(result['themes'], theme_count)
+    count_keywords(result['datasets'], dataset_count)
+    count_keywords(result['regions'], region_count)
+
+    # Track co-occurrences of every theme, dataset, and region mentioned (runs stored before
+    # these were recorded only have the first of each)
+    track_cooccurrence(result.get('theme_matches', result['themes']), result.get('dataset_matches', result['datasets']),
+                       result.get('region_matches', result['regions']))
+
+    # Update the regional and unclear focus counters
+    if result['focus'] == 'regional':
+        regional_focus_count += 1
+    elif result['focus'] == 'unclear':
+        unclear_focus_count += 1
+
+def analyze_pdfs_in_folder(folder_path, workers=1, incremental=False, supervision=None, dedupe=False, checkpoint=False):
+    """Analyze each PDF in the folder for themes, datasets, region keywords, custom terms, and metadata.
+
+    Returns every paper's result in filename order, for any number of `workers` processes.
+    With `incremental`, only new or changed papers are analyzed and the rest reuse the
+    results stored in the manifest. Papers that can't be read even with the fallback
+    extractor are left out of the results and recorded in `supervision.failures`. With
+    `dedupe`, only one copy of each duplicated paper is analyzed and counted, and the
+    other copies are listed in its result's 'aliases'. With `checkpoint`, each result is
+    journaled as it finishes and papers finished by an interrupted checkpointed run are
+    not analyzed again.
+    """
+    pdf_paths = [os.path.join(folder_path, filename) for filename in list_pdf_files(folder_path)]
+    if dedupe:
+        pdf_paths, aliases = canonical_papers(pdf_paths, workers, supervision)
+    # The incremental manifest is journaled too, so it doubles as the checkpoint
+    manifest = Manifest(manifest_path if incremental else checkpoint_path, keywords_hash) if incremental or checkpoint else None
+    results = list(map_papers(analyze_pdf, pdf_paths, workers, manifest, supervision))
+    return link_aliases(results, aliases) if dedupe else results
 
 def generate_summary_report(results):
     """Generates a summary report of the analysis and appends counts of themes, datasets, regions, and co-occurrences."""
     with open('pdf_analysis_report_2.txt', 'w') as report:
-        # Write detailed results per PDF
+        # Write detailed results per PDF, for the PDFs where anything was found
         for result in results:
+            if not (result['themes'] or result['datasets'] or result['regions'] or result['dataset_mentions']):
+                continue
             report.write(f"File: {result['file']}\n")
             report.write(f"  Themes: {', '.join(result['themes']) if result['themes'] else 'None'}\n")
             report.write(f"  Datasets: {', '.join(result['datasets']) if result['datasets'] else 'None'}\n")
@@ -224,17 +297,17 @@ def generate_summary_report(results):
         
         # Write a summary of theme co-occurrences
         report.write("\nSummary of Theme Co-occurrences (Pairs of themes appearing together):\n")
-        for theme_pair, cooccurrence_count in theme_cooccurrence.items():
+        for theme_pair, cooccurrence_count in term_incidence.pair_counts('themes'):
             report.write(f"{theme_pair}: {cooccurrence_count}\n")
         
         # Write a summary of theme-dataset co-occurrences
         report.write("\nSummary of Theme-Dataset Co-occurrences (Themes and Datasets appearing together):\n")
-        for theme_dataset_pair, cooccurrence_count in theme_dataset_cooccurrence.items():
+        for theme_dataset_pair, cooccurrence_count in term_incidence.pair_counts('themes', 'datasets'):
             report.write(f"{theme_dataset_pair}: {cooccurrence_count}\n")
         
         # Write a summary of region-dataset co-occurrences
         report.write("\nSummary of Region-Dataset Co-occurrences (Regions and Datasets appearing together):\n")
-        for region_dataset_pair, cooccurrence_count in region_dataset_cooccurrence.items():
+        for region_dataset_pair, cooccurrence_count in term_incidence.pair_counts('regions', 'datasets'):
             report.write(f"{region_dataset_pair}: {cooccurrence_count}\n")
 
         # Write a summary of custom term mentions (detection, prevention, prediction, management, vegetation, elevation)
@@ -248,11 +321,60 @@ def generate_summary_report(results):
 
     print("Summary report saved as 'pdf_analysis_report.txt'.")
 
+    # Save the co-occurrence matrices for heatmaps
+    term_incidence.save(cooccurrence_path, {
+        'theme_cooccurrence': ('themes',),
+        'theme_dataset_cooccurrence': ('themes', 'datasets'),
+        'region_dataset_cooccurrence': ('regions', 'datasets')
+    })
+    print(f"Co-occurrence matrices saved at {cooccurrence_path}")
+
+def render_reports(store, run_id=None):
+    """Renders the summary report and co-occurrence matrices from a stored run (the latest by default)."""
+    results = store.papers('themes', run_id)
+    for result in results:
+        merge_result(result)
+    generate_summary_report(results)
+
 # Folder where the PDFs are stored
 pdf_folder = "/Users/richardpurcell/Dropbox/dal04/PhD/papers/weather_specific/"
 
-# Run the analysis
-pdf_analysis_results = analyze_pdfs_in_folder(pdf_folder)
-
-# Generate a summary report of the findings, including counts
-generate_summary_report(pdf_analysis_results)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze PDFs for themes, datasets, regions, and custom terms.")
+    parser.add_argument("folder", nargs="?", default=pdf_folder, help="folder containing the PDFs")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    parser.add_argument("--incremental", action="store_true", help="only analyze papers added or changed since the last incremental run")
+    parser.add_argument("--checkpoint", action="store_true", help="record each paper's result as soon as it finishes, and resume an interrupted --checkpoint run where it stopped")
+    parser.add_argument("--dedupe", action="store_true", help="analyze one copy of papers that appear under several filenames and list the others as its aliases")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"seconds allowed per paper before it is retried with the fallback extractor (default: {DEFAULT_TIMEOUT})")
+    parser.add_argument("--max-memory-mb", type=int, default=DEFAULT_MEMORY_MB, help=f"memory cap of each worker process in MB (default: {DEFAULT_MEMORY_MB})")
+    parser.add_argument("--trace", metavar="PATH", help="append per-paper and per-stage timings to a JSONL trace file")
+    parser.add_argument("--profile", metavar="PATH", help="profile the run into a cProfile .prof file (or a pyinstrument .html file)")
+    parser.add_argument("--from-store", nargs="?", const="latest", metavar="RUN_ID", help="re-render the report from a stored run (the latest by default) without analyzing any PDFs")
+    args = parser.parse_args()
+    if args.trace:
+        start_tracing(args.trace, 'themes')
+
+    supervision = Supervision(args.timeout, args.max_memory_mb)
+    store = ResultStore()
+
+    with profiled(args.profile):
+        if args.from_store:
+            run_id = None if args.from_store == 'latest' else args.from_store
+        else:
+            # Run the analysis and store every paper's result
+            run_id = store.start_run('themes', args.folder, keywords_hash)
+            with trace_stage('analysis'):
+                pdf_analysis_results = analyze_pdfs_in_folder(args.folder, args.workers, args.incremental, supervision, args.dedupe,
+                                                              args.checkpoint)
+            report_failures(supervision, failure_table_path)
+            store.save_results(run_id, 'themes', pdf_analysis_results, supervision.failures)
+            if args.checkpoint:
+                remove_manifest(checkpoint_path)
+            print(f"Results stored in {store.path} (run {run_id})")
+
+        # Generate a summary report of the findings, including counts
+        with trace_stage('report'):
+            render_reports(store, run_id)
+    store.close()
+    finish_tracing()
@@ -1,77 +1,182 @@
 import os
 import json
-import re
-import pdfplumber
-from transformers import pipeline
+import time
+import argparse
 from collections import defaultdict
+from keyword_index import get_keyword_index
+from keyword_matcher import KeywordStream
+from pdf_text import stream_text_from_pdf, extract_text_from_pdf, default_cache_stats
+from corpus import list_pdf_files, map_papers, Supervision, report_failures, DEFAULT_TIMEOUT, DEFAULT_MEMORY_MB
+from manifest import Manifest, keyword_sections_hash, remove_manifest
+from result_store import ResultStore, OFFSETS_KEY
+from summarization import summarize_papers, SummaryCache, LazySummarizer, DEFAULT_BATCH_SIZE
+from instrumentation import (peak_rss_mb, start_tracing, trace_paper, trace_stage, trace_cache,
+                             finish_tracing, profiled)
 
-# Load keyword lists from JSON file
-with open('./code/keywords.json', 'r') as f:
-    keyword_data = json.load(f)
+script_start_time = time.perf_counter()
+
+# Load the validated keyword lists (see keyword_index.py)
+keyword_index = get_keyword_index()
+keyword_data = keyword_index.keyword_data
 
 # Extract the lists from the loaded JSON
 pde_subcategories = keyword_data['pde_categories']
 sde_subcategories = keyword_data['sde_categories']
 
-# Initialize an LLM summarization pipeline (you can switch to OpenAI API if preferred)
-summarizer = pipeline("summarization", model="facebook/bart-large-cnn")  # Hugging Face example
+# Compile the PDE and SDE lists into one matcher so each PDF is scanned once
+keyword_matcher = keyword_index.matcher(['pde_categories', 'sde_categories'])
+keywords_hash = keyword_sections_hash(keyword_data, ['pde_categories', 'sde_categories'])
+
+# LLM summarization pipeline (you can switch to OpenAI API if preferred); the model is
+# only loaded once a paper actually needs summarizing, so keyword-only and cached runs skip it
+model_name = "facebook/bart-large-cnn"  # Hugging Face example
+summarizer = LazySummarizer(model_name)
+
+# Papers that could not be read are listed here instead of in the results
+failure_table_path = './llm_analysis_failures.csv'
+
+# Keyword results of an unfinished --checkpoint run (summaries are kept by the summary cache);
+# removed once the run has been stored
+checkpoint_path = './cache/llm_checkpoint.json'
 
 # Helper functions
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a PDF file."""
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = ""
-            for page in pdf.pages:
-                text += page.extract_text()
-        return text
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return ""
-
-def identify_subcategories(text, subcategories):
-    """Identifies subcategories in the given text."""
-    found_subcategories = []
-    for subcat in subcategories:
-        if re.search(r'\b' + re.escape(subcat) + r'\b', text, re.IGNORECASE):
-            found_subcategories.append(subcat)
-    return found_subcategories
-
-def analyze_themes_with_llm(text):
-    """Use LLM to find themes in the text."""
-    try:
-        summary = summarizer(text, max_length=200, min_length=100, do_sample=False)
-        return summary[0]['summary_text']
-    except Exception as e:
-        print(f"Error analyzing themes with LLM: {e}")
-        return "LLM analysis failed."
+def identify_subcategories(matches, category):
+    """Identifies the subcategories of the given category found in the text."""
+    return list(matches[category])
+
+def analyze_themes_with_llm(texts, batch_size=DEFAULT_BATCH_SIZE, use_cache=True):
+    """Use LLM to find themes in each text, summarizing all of them together in batches.
+
+    Summaries of unchanged text with the same model settings are reused from the summary cache.
+    """
+    cache = SummaryCache() if use_cache else None
+    summaries = summarize_papers(summarizer, texts, batch_size, cache=cache, model_name=summarizer.name)
+    if cache is not None:
+        print(f"Summary cache: {cache.hits} hits, {cache.misses} misses")
+        trace_cache('summaries', cache)
+        cache.close()
+    return [summary if summary is not None else "LLM analysis failed." for summary in summaries]
 
 # Main analysis function
-def analyze_pdfs_with_llm(folder_path):
-    """Analyze each PDF for keywords and themes."""
-    results = []
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(folder_path, filename)
-            print(f"Analyzing {filename}...")
+def analyze_pdf(pdf_path, keep_text=True):
+    """Extracts one PDF's text and identifies its PDE and SDE subcategories.
+
+    The text is returned with the result (unless not `keep_text`) so it can be summarized
+    together with the other papers.
+    """
+    filename = os.path.basename(pdf_path)
+    print(f"Analyzing {filename}...")
+
+    with trace_paper(pdf_path, default_cache_stats) as paper:
+        with paper.stage('matching'):
+            # Stream the text of the PDF page by page; only the text to be summarized is kept
+            return analyze_pages(filename, paper.count_pages(stream_text_from_pdf(pdf_path)), keep_text)
+
+def analyze_pdf_keywords(pdf_path):
+    """analyze_pdf without the text, for results that are journaled; the text stays in the text cache."""
+    return analyze_pdf(pdf_path, keep_text=False)
+
+def paper_text(pdf_path):
+    """Returns one PDF's file name and text, for summarizing the papers of a --checkpoint run."""
+    return {"file": os.path.basename(pdf_path), "text": extract_text_from_pdf(pdf_path)}
 
-            # Extract text from the PDF
-            text = extract_text_from_pdf(pdf_path)
+def analyze_pages(filename, pages, keep_text=True):
+    """Identifies the PDE and SDE subcategories in the page texts of one PDF, returning the text along with them."""
+    scan = PageScan(filename, keep_text)
+    for page_text in pages:
+        scan.add_page(page_text)
+    return scan.result()
 
-            # Identify PDE and SDE subcategories
-            pde_found = identify_subcategories(text, pde_subcategories)
-            sde_found = identify_subcategories(text, sde_subcategories)
+class PageScan:
+    """Identifies the PDE and SDE subcategories in the pages of one PDF as they are extracted.
 
-            # Analyze themes with LLM
-            themes = analyze_themes_with_llm(text)
+    Only the text to be summarized (with `keep_text`) is kept. The survey feeds each page to
+    the scans of several analyzers, so the pages are extracted once and never held together.
+    """
 
-            # Store results
-            results.append({
-                "file": filename,
-                "pde_subcategories": pde_found,
-                "sde_subcategories": sde_found,
-                "themes": themes
-            })
+    def __init__(self, filename, keep_text=True):
+        self.filename = filename
+        self.page_number = 0
+        self.offsets = []
+        self.keywords = KeywordStream(keyword_matcher)
+        self.pages = [] if keep_text else None
+
+    def add_page(self, page_text):
+        # Record where each keyword occurs as the pages stream past
+        self.page_number += 1
+        self.offsets.extend([name, keyword, self.page_number, start, end]
+                            for name, keyword, start, end in keyword_matcher.locate(page_text))
+        self.keywords.feed(page_text)
+        if self.pages is not None:
+            self.pages.append(page_text)
+
+    def result(self):
+        """Returns the paper's result once every page has been added."""
+        matches = keyword_matcher.resolve(self.keywords.close())
+        result = {
+            "file": self.filename,
+            "pde_subcategories": identify_subcategories(matches, 'pde_categories'),
+            "sde_subcategories": identify_subcategories(matches, 'sde_categories'),
+            OFFSETS_KEY: self.offsets
+        }
+        if self.pages is not None:
+            result["text"] = "".join(self.pages)
+        return result
+
+def analyze_pdfs_with_llm(folder_path, batch_size=DEFAULT_BATCH_SIZE, use_cache=True, keywords_only=False, supervision=None,
+                          dedupe=False, checkpoint=False):
+    """Analyze each PDF for keywords and themes (themes are skipped when `keywords_only`).
+
+    Text extraction runs in a supervised worker process; papers that can't be read even with
+    the fallback extractor are left out of the results and recorded in `supervision.failures`.
+    With `dedupe`, only one copy of each duplicated paper is analyzed and summarized, and
+    the other copies are listed in its result's 'aliases'. With `checkpoint`, each paper's
+    keywords are journaled as they are found and a restarted run only reads the papers it
+    hadn't finished; summaries already made come back from the summary cache.
+    """
+    results = []
+    texts = []
+    pdf_paths = [os.path.join(folder_path, filename) for filename in list_pdf_files(folder_path)]
+    if dedupe:
+        # Imported here so a plain run doesn't pay for loading numpy at startup
+        from duplicates import canonical_papers, link_aliases
+        pdf_paths, aliases = canonical_papers(pdf_paths, supervision=supervision)
+    if checkpoint:
+        results = list(map_papers(analyze_pdf_keywords, pdf_paths, manifest=Manifest(checkpoint_path, keywords_hash),
+                                  supervision=supervision))
+        if not keywords_only:
+            # The text usually comes back from the text cache the extraction filled; a paper evicted
+            # from it is parsed again, so that goes through the same supervision (its failures were
+            # recorded the first time, and a paper that fails now is summarized as failed)
+            limits = Supervision(supervision.timeout, supervision.memory_mb, supervision.fallback) if supervision else None
+            paper_texts = {paper["file"]: paper["text"] for paper in
+                           map_papers(paper_text, [os.path.join(folder_path, result['file']) for result in results],
+                                      supervision=limits)}
+            texts = [paper_texts.get(result['file'], "") for result in results]
+    else:
+        for result in map_papers(analyze_pdf, pdf_paths, supervision=supervision):
+            # Themes are filled in once every paper has been read
+            texts.append(result.pop("text"))
+            results.append(result)
+    results = add_themes(results, texts, batch_size, use_cache, keywords_only)
+    return link_aliases(results, aliases) if dedupe else results
+
+def add_themes(results, texts, batch_size=DEFAULT_BATCH_SIZE, use_cache=True, keywords_only=False):
+    """Fills in each result's themes by summarizing the papers' texts with the LLM (None when `keywords_only`)."""
+    if keywords_only:
+        for result in results:
+            result["themes"] = None
+        return results
+
+    # Analyze themes with LLM across all papers at once
+    start_time = time.perf_counter()
+    with trace_stage('summarization', papers=len(texts)):
+        summaries = analyze_themes_with_llm(texts, batch_size, use_cache)
+    for result, themes in zip(results, summaries):
+        result["themes"] = themes
+    elapsed = time.perf_counter() - start_time
+    if results:
+        print(f"Summarized {len(results)} papers in {elapsed:.1f}s ({len(results) / elapsed * 60:.1f} papers/minute)")
 
     return results
 
@@ -89,17 +194,64 @@ def generate_summary_report(results):
 
     print(f"Summary report saved at {report_path}")
 
+def render_reports(store, run_id=None):
+    """Renders the summary report and the JSON results from a stored run (the latest by default)."""
+    results = store.papers('llm', run_id)
+    generate_summary_report(results)
+
+    # Save results as JSON
+    with open('./llm_analysis_results.json', 'w') as f:
+        json.dump(results, f, indent=4)
+
 # Folder containing PDFs
 pdf_folder = "/Users/richardpurcell/Dropbox/dal04/PhD/papers/sensors_all/"
 
-# Run the analysis
-results = analyze_pdfs_with_llm(pdf_folder)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze PDFs for PDE/SDE keywords and summarize their themes with an LLM.")
+    parser.add_argument("folder", nargs="?", default=pdf_folder, help="folder containing the PDFs")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"chunks summarized per batch (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--no-summary-cache", action="store_true", help="always re-run the model instead of reusing cached summaries")
+    parser.add_argument("--keywords-only", action="store_true", help="only identify PDE/SDE subcategories; never load the model")
+    parser.add_argument("--checkpoint", action="store_true", help="record each paper's result as soon as it finishes, and resume an interrupted --checkpoint run where it stopped")
+    parser.add_argument("--dedupe", action="store_true", help="analyze one copy of papers that appear under several filenames and list the others as its aliases")
+    parser.add_argument("--int8", action="store_true", help="use a dynamically int8-quantized model for faster CPU inference")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"seconds allowed per paper before it is retried with the fallback extractor (default: {DEFAULT_TIMEOUT})")
+    parser.add_argument("--max-memory-mb", type=int, default=DEFAULT_MEMORY_MB, help=f"memory cap of the extraction worker in MB (default: {DEFAULT_MEMORY_MB})")
+    parser.add_argument("--trace", metavar="PATH", help="append per-paper and per-stage timings to a JSONL trace file")
+    parser.add_argument("--profile", metavar="PATH", help="profile the run into a cProfile .prof file (or a pyinstrument .html file)")
+    parser.add_argument("--from-store", nargs="?", const="latest", metavar="RUN_ID", help="re-render the report from a stored run (the latest by default) without analyzing any PDFs")
+    args = parser.parse_args()
+    if args.checkpoint and args.no_summary_cache:
+        parser.error("--checkpoint resumes summarization from the summary cache; drop --no-summary-cache")
+    summarizer.int8 = args.int8
+    print(f"Startup took {time.perf_counter() - script_start_time:.2f}s (peak RSS {peak_rss_mb():.0f} MB)")
+    if args.trace:
+        start_tracing(args.trace, 'llm')
+
+    supervision = Supervision(args.timeout, args.max_memory_mb)
+    store = ResultStore()
 
-# Generate the summary report
-generate_summary_report(results)
+    with profiled(args.profile):
+        if args.from_store:
+            run_id = None if args.from_store == 'latest' else args.from_store
+        else:
+            # Run the analysis and store every paper's result
+            run_id = store.start_run('llm', args.folder, keywords_hash)
+            with trace_stage('analysis'):
+                results = analyze_pdfs_with_llm(args.folder, args.batch_size, not args.no_summary_cache, args.keywords_only, supervision,
+                                                args.dedupe, args.checkpoint)
+            report_failures(supervision, failure_table_path)
+            if summarizer.loaded:
+                print(f"Model load took {summarizer.load_seconds:.1f}s (peak RSS {peak_rss_mb():.0f} MB)")
+            store.save_results(run_id, 'llm', results, supervision.failures)
+            if args.checkpoint:
+                remove_manifest(checkpoint_path)
+            print(f"Results stored in {store.path} (run {run_id})")
 
-# Save results as JSON
-with open('./llm_analysis_results.json', 'w') as f:
-    json.dump(results, f, indent=4)
+        # Generate the summary report
+        with trace_stage('report'):
+            render_reports(store, run_id)
+    store.close()
 
-print("LLM-based theme analysis complete.")
+    finish_tracing(model_load_seconds=summarizer.load_seconds)
+    print("LLM-based theme analysis complete.")
@@ -0,0 +1,235 @@
+import os
+import re
+import time
+import hashlib
+from contextlib import contextmanager
+import pdfplumber
+import PyPDF2
+from disk_cache import DiskCache
+from instrumentation import get_tracer
+
+# Bump whenever the way page text is produced changes, so stale cache entries are ignored
+EXTRACTOR_VERSION = f"pdfplumber-{pdfplumber.__version__}/2"
+
+# Version of PyPDF2 text that passed the fast path's quality check
+FAST_VERSION = f"pypdf2-{PyPDF2.__version__}/1"
+
+# Extractor retried on papers pdfplumber can't read. Its text is cached under a version tied to
+# pdfplumber's, so a pdfplumber upgrade gets another chance at those papers
+FALLBACK_EXTRACTOR = 'pypdf2'
+FALLBACK_VERSION = f"pypdf2-{PyPDF2.__version__}/1+{EXTRACTOR_VERSION}"
+
+# Extractor used unless another is chosen: 'auto' takes PyPDF2's plain text when it looks sound
+# and only parses the layout with pdfplumber when it doesn't (overridable from the environment)
+DEFAULT_EXTRACTOR = os.environ.get('PDF_EXTRACTOR', 'auto')
+
+# Fast-path text is rejected below this many visible characters per page, or above this mean word length
+MIN_CHARS_PER_PAGE = 40
+MAX_MEAN_WORD_LENGTH = 12
+
+# Location and size budget of the extracted text cache (overridable from the environment)
+CACHE_PATH = os.environ.get('PDF_TEXT_CACHE', './cache/pdf_text.sqlite')
+CACHE_MAX_BYTES = int(os.environ.get('PDF_TEXT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+
+def file_sha256(path):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TextCache(DiskCache):
+    """Content-addressed store of page-level PDF text, evicted least-recently-used by size.
+
+    Entries are keyed by the SHA-256 of the PDF and the extractor version and hold the
+    list of page texts.
+    """
+
+    table = 'page_text'
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes)
+
+    def get(self, sha256, version=EXTRACTOR_VERSION):
+        """Returns the cached page texts, or None when the document is not cached."""
+        return super().get(sha256, version)
+
+    def put(self, sha256, pages, version=EXTRACTOR_VERSION):
+        """Stores the page texts of a document and evicts old entries beyond the size budget."""
+        super().put(sha256, pages, version)
+
+
+_default_cache = None
+_default_cache_pid = None
+
+
+def get_default_cache():
+    """Opens the shared text cache on first use (and again in each worker process)."""
+    global _default_cache, _default_cache_pid
+    if _default_cache is None or _default_cache_pid != os.getpid():
+        _default_cache = TextCache()
+        _default_cache_pid = os.getpid()
+    return _default_cache
+
+
+def default_cache_stats():
+    """Returns the (hits, misses) of this process's shared text cache so far."""
+    if _default_cache is None or _default_cache_pid != os.getpid():
+        return 0, 0
+    return _default_cache.hits, _default_cache.misses
+
+
+def iter_parsed_pages(pdf_path):
+    """Parses a PDF file with pdfplumber one page at a time.
+
+    Each page's layout objects are released as soon as its text is taken, so memory stays
+    flat however many pages the document has. Pages without text yield an empty string.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text() or ""
+            page.flush_cache()
+            # The text map is memoized per page outside of flush_cache's reach
+            if hasattr(page.get_textmap, 'cache_clear'):
+                page.get_textmap.cache_clear()
+            yield page_text
+
+
+def iter_pypdf2_pages(pdf_path):
+    """Parses a PDF file with PyPDF2 one page at a time; cruder than pdfplumber but more forgiving."""
+    with open(pdf_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        for page in reader.pages:
+            yield page.extract_text() or ""
+
+
+def plain_text_problem(pages):
+    """Returns why page text can't be trusted for keyword matching ('empty', 'garbled', or 'run-together'), or None."""
+    text = "".join(pages)
+    visible = len(re.sub(r'\s', '', text))
+    if visible < MIN_CHARS_PER_PAGE * max(1, len(pages)):
+        return 'empty'
+    # Unmapped glyphs come out as replacement characters or (cid:N) codes
+    if (text.count('\ufffd') + text.count('(cid:')) / visible > 0.01 or sum(char.isalpha() for char in text) / visible < 0.5:
+        return 'garbled'
+    # Without positional spacing, words on a line can come out joined together
+    if visible / len(text.split()) > MAX_MEAN_WORD_LENGTH:
+        return 'run-together'
+    return None
+
+
+# The backends each extractor tries in order, as (backend, page parser, cache version, check).
+# A backend's text is used when its check returns None; otherwise the next backend parses the
+# document. The last backend is always used and streams its pages as they are parsed.
+extractors = {
+    'auto': [('pypdf2', iter_pypdf2_pages, FAST_VERSION, plain_text_problem),
+             ('pdfplumber', iter_parsed_pages, EXTRACTOR_VERSION, None)],
+    'pdfplumber': [('pdfplumber', iter_parsed_pages, EXTRACTOR_VERSION, None)],
+    FALLBACK_EXTRACTOR: [('pypdf2', iter_pypdf2_pages, FALLBACK_VERSION, None)]
+}
+_active_extractor = DEFAULT_EXTRACTOR
+
+
+@contextmanager
+def use_extractor(name):
+    """Extracts text with the named extractor within the block (None keeps the current one)."""
+    global _active_extractor
+    previous = _active_extractor
+    _active_extractor = name or previous
+    try:
+        yield
+    finally:
+        _active_extractor = previous
+
+
+def active_extractor():
+    """Returns the name of the extractor currently in use."""
+    return _active_extractor
+
+
+def parse_pages_from_pdf(pdf_path):
+    """Parses the text of every page of a PDF file with pdfplumber."""
+    return list(iter_parsed_pages(pdf_path))
+
+
+def _timed_pages(pdf_path, parse, timing):
+    """Yields the pages of a parser, adding the pages and the time spent parsing them to `timing`."""
+    pages = parse(pdf_path)
+    while True:
+        start_time = time.perf_counter()
+        page_text = next(pages, None)
+        timing['seconds'] += time.perf_counter() - start_time
+        if page_text is None:
+            return
+        timing['pages'] += 1
+        yield page_text
+
+
+def _trace_extraction(pdf_path, backend, timing, rejected=None):
+    tracer = get_tracer()
+    if tracer is not None:
+        tracer.emit('extraction', file=os.path.basename(pdf_path), extractor=backend, **timing,
+                    **({'rejected': rejected} if rejected else {}))
+
+
+def iter_pages_from_pdf(pdf_path, cache=None):
+    """Yields the text of each page of a PDF file, parsing it only if it is not cached.
+
+    The active extractor's backends are tried in order (see extractors), and each backend's
+    pages and parse time are recorded in the run's trace, rejected attempts included.
+    """
+    cache = cache or get_default_cache()
+    sha256 = file_sha256(pdf_path)
+    *attempts, (backend, parse, version, _) = extractors[_active_extractor]
+    # Papers only the fallback could read aren't parsed again
+    versions = [attempt[2] for attempt in attempts] + [version]
+    pages = cache.get_first(sha256, versions if FALLBACK_VERSION in versions else versions + [FALLBACK_VERSION])
+    if pages is not None:
+        yield from pages
+        return
+
+    for attempt_backend, attempt_parse, attempt_version, check in attempts:
+        timing = {'pages': 0, 'seconds': 0.0}
+        try:
+            pages = list(_timed_pages(pdf_path, attempt_parse, timing))
+            problem = check(pages)
+        except MemoryError:
+            raise
+        except Exception as e:
+            problem = f"{type(e).__name__}: {e}"
+        _trace_extraction(pdf_path, attempt_backend, timing, problem)
+        if problem is None:
+            cache.put(sha256, pages, attempt_version)
+            yield from pages
+            return
+
+    pages = []
+    timing = {'pages': 0, 'seconds': 0.0}
+    for page_text in _timed_pages(pdf_path, parse, timing):
+        pages.append(page_text)
+        yield page_text
+    _trace_extraction(pdf_path, backend, timing)
+    # Only fully parsed documents are cached
+    cache.put(sha256, pages, version)
+
+
+def extract_pages_from_pdf(pdf_path, cache=None):
+    """Returns the text of every page of a PDF file, parsing it only if it is not cached."""
+    return list(iter_pages_from_pdf(pdf_path, cache))
+
+
+def stream_text_from_pdf(pdf_path, cache=None):
+    """Yields the text of a PDF file page by page.
+
+    Extraction errors are raised rather than turned into empty text, so the supervisor in
+    corpus.map_papers can retry the paper with the fallback extractor or report it as failed.
+    """
+    yield from iter_pages_from_pdf(pdf_path, cache)
+
+
+def extract_text_from_pdf(pdf_path, cache=None):
+    """Extracts text from a PDF file."""
+    return "".join(stream_text_from_pdf(pdf_path, cache))
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Hashes of the data each figure was last rendered from, so unchanged figures are skipped
+FIGURE_MANIFEST_PATH = os.environ.get('FIGURE_MANIFEST', './cache/figures_manifest.json')
+
+# Bump whenever draw_figure changes how a spec is drawn, so every figure is rendered again
+PLOT_VERSION = f"matplotlib-{matplotlib.__version__}/1"
+
+
+def bar_chart(path, labels, values, title, xlabel, ylabel, color, horizontal=False, figsize=(8, 6),
+              title_size=None, label_size=None, tight=False):
+    """Returns the spec of a bar chart (horizontal bars with `horizontal`), to be drawn by render_figures."""
+    return {'path': path, 'kind': 'barh' if horizontal else 'bar', 'labels': list(labels), 'values': list(values),
+            'title': title, 'xlabel': xlabel, 'ylabel': ylabel, 'color': color, 'figsize': list(figsize),
+            'title_size': title_size, 'label_size': label_size, 'tight': tight}
+
+
+def spec_hash(spec):
+    """Returns a hash of everything a figure is drawn from."""
+    return hashlib.sha256(json.dumps([PLOT_VERSION, spec], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def draw_figure(spec):
+    """Draws one figure spec with the Agg canvas and saves it; no pyplot or backend state is involved."""
+    figure = Figure(figsize=spec['figsize'])
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    if spec['kind'] == 'barh':
+        axes.barh(spec['labels'], spec['values'], color=spec['color'])
+    else:
+        axes.bar(spec['labels'], spec['values'], color=spec['color'])
+    # Without an explicit size the title and labels keep matplotlib's defaults
+    title_font = {'fontsize': spec['title_size']} if spec['title_size'] else {}
+    label_font = {'fontsize': spec['label_size']} if spec['label_size'] else {}
+    axes.set_title(spec['title'], **title_font)
+    axes.set_xlabel(spec['xlabel'], **label_font)
+    axes.set_ylabel(spec['ylabel'], **label_font)
+    if spec['tight']:
+        figure.tight_layout()
+    figure.savefig(spec['path'])
+    return spec['path']
+
+
+def _init_worker():
+    # Rendering workers never need a display, whatever backend the importing program chose
+    matplotlib.use('Agg')
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def render_figures(specs, workers=None, manifest_path=FIGURE_MANIFEST_PATH, force=False):
+    """Renders figure specs in parallel worker processes, skipping those already rendered from the same data.
+
+    A figure is skipped while its spec hashes the same as when it was last rendered and its
+    file is still the one written then. `workers` defaults to one process per figure, up
+    to the number of CPUs; with one figure to draw (or `workers=1`) it is drawn in this
+    process. Returns (rendered paths, skipped paths).
+    """
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    todo, skipped = [], []
+    for spec in specs:
+        entry = manifest.get(os.path.abspath(spec['path']))
+        if not force and entry is not None and entry['hash'] == spec_hash(spec) and os.path.exists(spec['path']) \
+                and _file_signature(spec['path']) == entry['file']:
+            skipped.append(spec['path'])
+        else:
+            todo.append(spec)
+
+    workers = min(len(todo), workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(),
+                                 initializer=_init_worker) as executor:
+            rendered = list(executor.map(draw_figure, todo))
+    else:
+        rendered = [draw_figure(spec) for spec in todo]
+
+    for spec in todo:
+        manifest[os.path.abspath(spec['path'])] = {'hash': spec_hash(spec), 'file': _file_signature(spec['path'])}
+    if todo:
+        if os.path.dirname(manifest_path):
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return rendered, skipped
@@ -0,0 +1,194 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import subprocess
+
+# Location of the result store (overridable from the environment)
+RESULT_STORE_PATH = os.environ.get('RESULT_STORE', './results/analysis_results.sqlite')
+
+# Result key holding a paper's keyword occurrences; stored as rows of the matches table
+OFFSETS_KEY = 'keyword_offsets'
+
+
+def git_commit():
+    """Returns the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ResultStore:
+    """SQLite store of analysis runs that the reports, CSVs and plots are rendered from.
+
+    Each run gets a row in `runs` (script, time, folder, command line, commit, keyword
+    hash). Each script's per-paper results go to a `<script>_papers` table with one column
+    per result field; list-valued fields are declared JSON and hold JSON arrays, so they
+    can be queried with SQLite's json_each and come back as lists. Every keyword occurrence
+    (category, keyword, page, character span) goes to `matches`, and papers that could not
+    be read go to `failures`.
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY, script TEXT NOT NULL, started REAL NOT NULL, finished REAL,"
+            " folder TEXT, argv JSON, git_commit TEXT, keywords_hash TEXT, papers INTEGER, failures INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            " run_id TEXT NOT NULL, file TEXT NOT NULL, category TEXT NOT NULL, keyword TEXT NOT NULL,"
+            " page INTEGER NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS matches_run_file ON matches (run_id, file)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            " run_id TEXT NOT NULL, file TEXT NOT NULL, extractor TEXT, failure TEXT, error TEXT,"
+            " seconds REAL, outcome TEXT)"
+        )
+        self.conn.commit()
+
+    def start_run(self, script, folder=None, keywords_hash=None):
+        """Records the start of a run and returns its id."""
+        run_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        self.conn.execute(
+            "INSERT INTO runs (run_id, script, started, folder, argv, git_commit, keywords_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run_id, script, time.time(), folder, json.dumps(sys.argv), git_commit(), keywords_hash)
+        )
+        self.conn.commit()
+        return run_id
+
+    def save_results(self, run_id, script, results, failures=()):
+        """Stores a run's per-paper results, their keyword occurrences, and its failures, and closes the run."""
+        table = f"{script}_papers"
+        rows = []
+        offsets = []
+        for result in results:
+            result = dict(result)
+            for category, keyword, page, start, end in result.pop(OFFSETS_KEY, []):
+                offsets.append((run_id, result['file'], category, keyword, page, start, end))
+            rows.append(result)
+
+        columns = self._ensure_columns(table, rows)
+        self.conn.executemany(
+            f"INSERT INTO {table} ({', '.join(['run_id'] + [f'[{column}]' for column in columns])})"
+            f" VALUES ({', '.join('?' * (len(columns) + 1))})",
+            ([run_id] + [self._encode(row.get(column), declared) for column, declared in columns.items()] for row in rows)
+        )
+        self.conn.executemany("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?)", offsets)
+        self.conn.executemany(
+            "INSERT INTO failures VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ((run_id, failure['file'], failure['extractor'], failure['failure'], failure['error'],
+              failure['seconds'], failure['outcome']) for failure in failures)
+        )
+        self.conn.execute("UPDATE runs SET finished = ?, papers = ?, failures = ? WHERE run_id = ?",
+                          (time.time(), len(rows), len(failures), run_id))
+        self.conn.commit()
+
+    def _ensure_columns(self, table, rows):
+        """Creates or widens a papers table for the fields of the rows; returns {column: declared type}."""
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (run_id TEXT NOT NULL)")
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_run ON {table} (run_id)")
+        columns = self._columns(table)
+        new_columns = {}
+        for row in rows:
+            for column, value in row.items():
+                if column not in columns:
+                    values = new_columns.setdefault(column, [])
+                    if value is not None:
+                        values.append(value)
+        for column, values in new_columns.items():
+            declared = self._declared_type(values)
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN [{column}] {declared}")
+            columns[column] = declared
+        return columns
+
+    @staticmethod
+    def _declared_type(values):
+        """Returns the column type for a field from its non-None values across all the rows.
+
+        Fields with no value yet or with mixed kinds of values are declared JSON, which
+        round-trips whatever a later row stores in them.
+        """
+        if values and all(isinstance(value, int) for value in values):
+            return 'INTEGER'
+        if values and all(isinstance(value, (int, float)) for value in values):
+            return 'REAL'
+        if values and all(isinstance(value, str) for value in values):
+            return 'TEXT'
+        return 'JSON'
+
+    def _columns(self, table):
+        return {name: declared for _, name, declared, _, _, _ in self.conn.execute(f"PRAGMA table_info({table})")
+                if name != 'run_id'}
+
+    @staticmethod
+    def _encode(value, declared):
+        # A list or dict can't be bound as it is, even in a column an earlier run declared otherwise
+        return json.dumps(value) if value is not None and (declared == 'JSON' or isinstance(value, (list, dict))) else value
+
+    def latest_run(self, script):
+        """Returns the id of the script's most recent finished run, or None."""
+        row = self.conn.execute(
+            "SELECT run_id FROM runs WHERE script = ? AND finished IS NOT NULL ORDER BY started DESC LIMIT 1", (script,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def run(self, run_id):
+        """Returns a run's metadata as a dict."""
+        cursor = self.conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise KeyError(f"No run {run_id!r} in {self.path}")
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def papers(self, script, run_id=None):
+        """Returns the per-paper results of a run (the latest by default) as dicts, lists decoded, in stored order."""
+        run_id = run_id or self.latest_run(script)
+        if run_id is None:
+            raise KeyError(f"No finished {script} run in {self.path}")
+        table = f"{script}_papers"
+        columns = self._columns(table)
+        cursor = self.conn.execute(
+            f"SELECT {', '.join(f'[{column}]' for column in columns)} FROM {table} WHERE run_id = ? ORDER BY rowid", (run_id,)
+        )
+        return [{column: json.loads(value) if declared == 'JSON' and value is not None else value
+                 for (column, declared), value in zip(columns.items(), row)}
+                for row in cursor]
+
+    def failures(self, run_id):
+        cursor = self.conn.execute("SELECT file, extractor, failure, error, seconds, outcome FROM failures WHERE run_id = ?", (run_id,))
+        return [dict(zip([column[0] for column in cursor.description], row)) for row in cursor]
+
+    def close(self):
+        self.conn.close()
+
+
+def load_papers(script, run_id=None, path=RESULT_STORE_PATH):
+    """Loads a run's per-paper results (the latest by default) into a pandas DataFrame with list-valued columns."""
+    import pandas as pd
+    store = ResultStore(path)
+    try:
+        return pd.DataFrame(store.papers(script, run_id))
+    finally:
+        store.close()
+
+
+def load_matches(script, run_id=None, path=RESULT_STORE_PATH):
+    """Loads a run's keyword occurrences (the latest run by default) into a pandas DataFrame."""
+    import pandas as pd
+    store = ResultStore(path)
+    try:
+        run_id = run_id or store.latest_run(script)
+        return pd.read_sql_query("SELECT file, category, keyword, page, start, end FROM matches WHERE run_id = ?",
+                                 store.conn, params=(run_id,))
+    finally:
+        store.close()
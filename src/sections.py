@@ -0,0 +1,216 @@
+import re
+import statistics
+from collections import Counter
+import pdfplumber
+from pdf_text import (file_sha256, get_default_cache, iter_pages_from_pdf, active_extractor,
+                      EXTRACTOR_VERSION, FALLBACK_EXTRACTOR, FALLBACK_VERSION)
+
+# Sections the lines of a paper are assigned to; title, authors, and everything else go to 'body'.
+# Running headers, footers, and page numbers are dropped.
+SECTIONS = ['abstract', 'body', 'equations', 'references']
+
+# Sections scanned when a script is asked for section-aware analysis without naming any
+DEFAULT_SECTIONS = ['abstract', 'body', 'equations']
+
+# Bump whenever the segmentation changes, so stale cache entries are ignored
+SECTIONS_VERSION = f"{EXTRACTOR_VERSION}+sections/1"
+
+# Share of the page height at the top and bottom where running headers and footers are looked for
+MARGIN = 0.08
+
+_numbering = r'(?:(?:\d+(?:\.\d+)*|[IVXLC]+|[A-Z])[.)]?\s+)?'
+_abstract_heading = re.compile(r'^\s*abstract\b[\s:.\-–—]*', re.IGNORECASE)
+_references_heading = re.compile(_numbering + r'(references?( and notes)?|bibliography|literature cited|works cited|reference list)\s*:?\s*$',
+                                 re.IGNORECASE)
+_abstract_end = re.compile(r'^\s*(' + _numbering + r'introduction\b|keywords?\b|index terms\b|key words\b)', re.IGNORECASE)
+_heading = re.compile(r'^' + _numbering + r'[A-Z][A-Za-z,&:\'\- ]{2,60}$')
+_page_number = re.compile(r'^\W*(page\s+)?\d+(\s+of\s+\d+)?\W*$', re.IGNORECASE)
+_equation_number = re.compile(r'\(\s*\d+(\.\d+)?[a-z]?\s*\)\s*$')
+_math = re.compile(r'[=<>+±×÷Ͱ-Ͽ←-⋿⌈-⌋⟨⟩]|\^|\bd[a-z]/d[a-z]\b')
+_prose_word = re.compile(r'[A-Za-z]{4,}')
+
+
+def _layout_line(line):
+    """Keeps the text, position, and dominant font of a pdfplumber text line."""
+    chars = [char for char in line['chars'] if not char['text'].isspace()]
+    fonts = Counter(char.get('fontname', '') for char in chars)
+    return {
+        'text': line['text'],
+        'x0': line['x0'], 'x1': line['x1'], 'top': line['top'], 'bottom': line['bottom'],
+        'size': round(statistics.median(char['size'] for char in chars), 1) if chars else 0.0,
+        'bold': bool(fonts) and 'bold' in fonts.most_common(1)[0][0].lower()
+    }
+
+
+def iter_layout_pages(pdf_path):
+    """Parses a PDF with pdfplumber, yielding each page's size and its text lines with position and font.
+
+    Like pdf_text.iter_parsed_pages, each page's layout objects are released once its lines are taken.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            lines = [_layout_line(line) for line in page.extract_text_lines(strip=True, return_chars=True)]
+            page.flush_cache()
+            if hasattr(page.get_textmap, 'cache_clear'):
+                page.get_textmap.cache_clear()
+            yield {'width': float(page.width), 'height': float(page.height), 'lines': lines}
+
+
+def text_page(page_text):
+    """Wraps plain page text (e.g. from PyPDF2) as a page of lines without layout information."""
+    return {'width': None, 'height': None, 'lines': [{'text': line.strip()} for line in page_text.splitlines() if line.strip()]}
+
+
+def _in_margin(page, index):
+    """Whether a line sits in the top or bottom margin of its page (the first or last two lines without layout)."""
+    line = page['lines'][index]
+    if page['height'] is None:
+        return index < 2 or index >= len(page['lines']) - 2
+    return line['top'] < page['height'] * MARGIN or line['bottom'] > page['height'] * (1 - MARGIN)
+
+
+def _margin_key(text):
+    # Page numbers and dates change from page to page, so running headers are compared without digits
+    return re.sub(r'\d+', '#', text.lower()).strip()
+
+
+def _running_lines(pages):
+    """Returns the margin texts repeated on at least half the pages (and at least two)."""
+    seen = Counter()
+    for page in pages:
+        seen.update({_margin_key(line['text']) for index, line in enumerate(page['lines']) if _in_margin(page, index)})
+    return {key for key, count in seen.items() if count >= max(2, len(pages) / 2)}
+
+
+def _body_size(pages):
+    """Returns the font size most of the text is set in, or None without layout information."""
+    sizes = Counter()
+    for page in pages:
+        for line in page['lines']:
+            if line.get('size'):
+                sizes[line['size']] += len(line['text'])
+    return sizes.most_common(1)[0][0] if sizes else None
+
+
+def _is_heading(line, body_size, capitals=True):
+    """Whether a line looks like a section heading: short, title-like, and set larger or bolder than the body.
+
+    Without layout information, numbered lines and (with `capitals`) all-caps lines count.
+    """
+    text = line['text'].strip()
+    if not _heading.match(text) or len(text.split()) > 8:
+        return False
+    if body_size is None:
+        return bool(re.match(r'^\d+(\.\d+)*\.?\s+[A-Z]', text)) or (capitals and text.isupper())
+    return line['size'] > body_size * 1.1 or line['bold'] or (capitals and text.isupper())
+
+
+def _text_column(page, body_size):
+    """Returns the left and right edges of the page's body text, or None without layout information."""
+    if page['width'] is None:
+        return None
+    lines = [line for line in page['lines'] if body_size is None or abs(line['size'] - body_size) <= 0.5] or page['lines']
+    if not lines:
+        return None
+    return min(line['x0'] for line in lines), max(line['x1'] for line in lines)
+
+
+def is_display_equation(line, column=None, page_width=None):
+    """Whether a line is a displayed equation: mostly symbols rather than prose, and numbered or set off from the text."""
+    text = line['text'].strip()
+    if not _math.search(text):
+        return False
+    visible = len(re.sub(r'\s', '', text))
+    prose = sum(len(word) for word in _prose_word.findall(text))
+    if not visible or prose / visible >= 0.5:
+        return False
+    if _equation_number.search(text):
+        return True
+    if column is None:
+        return False
+    left, right = column
+    width = right - left
+    center = (line['x0'] + line['x1']) / 2
+    # Clearly narrower than a full line of prose, and centered in the text column or on the page
+    centers = [(left + right) / 2] + ([page_width / 2] if page_width else [])
+    return line['x1'] - line['x0'] < 0.7 * width and any(abs(center - middle) < 0.1 * width for middle in centers)
+
+
+def segment_pages(pages):
+    """Assigns every line of a paper to a section and returns each page as [[section, text], ...].
+
+    `pages` are dicts as yielded by iter_layout_pages or made by text_page. Running headers,
+    footers, and page numbers in the margins are dropped. On the first two pages, an
+    'Abstract' heading (or a line starting with 'Abstract') opens the abstract, which ends
+    at the next heading, an Introduction or Keywords line, or the end of its page. A
+    References or Bibliography heading opens the references, which run until the next
+    heading set larger or bolder than the body (e.g. an appendix), or to the end without
+    layout information. Display equations outside the references go to 'equations';
+    consecutive lines of one section on a page are joined with newlines.
+    """
+    running = _running_lines(pages)
+    body_size = _body_size(pages)
+    state = 'body'
+    abstract_seen = False
+    segmented = []
+    for number, page in enumerate(pages):
+        column = _text_column(page, body_size)
+        segments = []
+        for index, line in enumerate(page['lines']):
+            text = line['text'].strip()
+            if _in_margin(page, index) and (_margin_key(text) in running or _page_number.match(text)):
+                continue
+
+            if _references_heading.match(text):
+                state = 'references'
+            elif state == 'references':
+                if body_size is not None and _is_heading(line, body_size, capitals=False):
+                    state = 'body'
+            elif _abstract_heading.match(text) and not abstract_seen and number < 2:
+                state = 'abstract'
+                abstract_seen = True
+            elif state == 'abstract' and (_abstract_end.match(text) or _is_heading(line, body_size)):
+                state = 'body'
+
+            section = state
+            if section != 'references' and is_display_equation(line, column, page['width']):
+                section = 'equations'
+            if segments and segments[-1][0] == section:
+                segments[-1][1] += '\n' + text
+            else:
+                segments.append([section, text])
+        segmented.append(segments)
+        if state == 'abstract':
+            state = 'body'
+    return segmented
+
+
+def extract_section_pages(pdf_path, cache=None):
+    """Returns each page of a PDF as [[section, text], ...], segmenting it only if it is not cached.
+
+    Layout-based segmentation needs pdfplumber; with the fallback extractor active (or for
+    papers only the fallback could read) the plain page text is segmented instead, which
+    finds the same sections from their headings but can't drop headers by position or spot
+    unnumbered equations.
+    """
+    cache = cache or get_default_cache()
+    sha256 = file_sha256(pdf_path)
+    if active_extractor() != FALLBACK_EXTRACTOR:
+        pages = cache.get(sha256, SECTIONS_VERSION)
+        if pages is not None:
+            return pages
+        if cache.get(sha256, FALLBACK_VERSION) is None:
+            pages = segment_pages(list(iter_layout_pages(pdf_path)))
+            cache.put(sha256, pages, SECTIONS_VERSION)
+            return pages
+    return segment_pages([text_page(page_text) for page_text in iter_pages_from_pdf(pdf_path, cache)])
+
+
+def section_text(segments, sections):
+    """Joins the text of a page's segments that belong to the chosen sections."""
+    return '\n'.join(text for section, text in segments if section in sections)
+
+
+def equation_excerpts(pages):
+    """Returns the lines of display equations found in a segmented paper."""
+    return [line for segments in pages for section, text in segments if section == 'equations' for line in text.split('\n')]
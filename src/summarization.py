@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import hashlib
+from disk_cache import DiskCache
+
+# Generation settings for the chunk summaries (map) and each paper's final summary (reduce)
+CHUNK_SUMMARY_PARAMS = {'max_length': 150, 'min_length': 40, 'do_sample': False}
+FINAL_SUMMARY_PARAMS = {'max_length': 200, 'min_length': 100, 'do_sample': False}
+
+# Number of chunks run through the pipeline together
+DEFAULT_BATCH_SIZE = 8
+
+# Location and size budget of the summary cache (overridable from the environment)
+SUMMARY_CACHE_PATH = os.environ.get('SUMMARY_CACHE', './cache/summaries.sqlite')
+SUMMARY_CACHE_MAX_BYTES = int(os.environ.get('SUMMARY_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+
+
+class SummaryCache(DiskCache):
+    """LLM outputs keyed by the SHA-256 of the summarized text and the model configuration."""
+
+    table = 'summaries'
+
+    def __init__(self, path=SUMMARY_CACHE_PATH, max_bytes=SUMMARY_CACHE_MAX_BYTES):
+        super().__init__(path, max_bytes)
+
+
+class LazySummarizer:
+    """A summarization pipeline that is only built the first time it is actually used.
+
+    Importing transformers and loading the model takes tens of seconds and over a gigabyte
+    of RAM, so runs that only need keyword matching or are fully cached never pay for it.
+    With `int8`, the model's linear layers are dynamically quantized for faster CPU inference.
+    """
+
+    def __init__(self, model_name, int8=False):
+        self.model_name = model_name
+        self.int8 = int8
+        self._pipeline = None
+        self.load_seconds = None
+
+    @property
+    def name(self):
+        """The model identifier used in cache keys; quantized outputs differ, so they are kept apart."""
+        return self.model_name + ('+int8' if self.int8 else '')
+
+    @property
+    def loaded(self):
+        return self._pipeline is not None
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            start_time = time.perf_counter()
+            from transformers import pipeline
+            summarizer = pipeline("summarization", model=self.model_name, device=-1)  # on CPU
+            if self.int8:
+                import torch
+                summarizer.model = torch.quantization.quantize_dynamic(summarizer.model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._pipeline = summarizer
+            self.load_seconds = time.perf_counter() - start_time
+            print(f"Loaded {self.name} in {self.load_seconds:.1f}s")
+        return self._pipeline
+
+    @property
+    def tokenizer(self):
+        return self.pipeline.tokenizer
+
+    def __call__(self, *args, **kwargs):
+        return self.pipeline(*args, **kwargs)
+
+
+def text_sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def config_version(model_name, **config):
+    """Describes a model and its generation settings as a cache version string."""
+    return json.dumps({'model': model_name, **config}, sort_keys=True)
+
+
+def chunk_text(text, tokenizer, max_tokens):
+    """Splits text into consecutive pieces of at most max_tokens tokens.
+
+    Returns a list of (piece, token_count) pairs.
+    """
+    token_ids = tokenizer(text, add_special_tokens=False, verbose=False)['input_ids']
+    return [
+        (tokenizer.decode(token_ids[start:start + max_tokens], skip_special_tokens=True),
+         len(token_ids[start:start + max_tokens]))
+        for start in range(0, len(token_ids), max_tokens)
+    ]
+
+
+def summarize_batched(summarizer, pieces, params, batch_size=DEFAULT_BATCH_SIZE, cache=None, model_name=None):
+    """Summarizes (text, token_count) pieces, batching pieces of similar length together.
+
+    Pieces already in the cache are not run. The rest are sorted longest first so each batch
+    pads to nearly the same length, and the summaries are returned in the original order.
+    A failed batch yields None for its pieces.
+    """
+    summaries = [None] * len(pieces)
+    pending = {}
+    for i, (text, token_count) in enumerate(pieces):
+        piece_params = dict(params)
+        # Don't force the model to generate more tokens than the input has
+        piece_params['min_length'] = max(1, min(params['min_length'], token_count // 2))
+        if cache is not None:
+            summaries[i] = cache.get(text_sha256(text), config_version(model_name, **piece_params))
+            if summaries[i] is not None:
+                continue
+        pending.setdefault(json.dumps(piece_params, sort_keys=True), []).append(i)
+
+    for piece_params, indices in pending.items():
+        piece_params = json.loads(piece_params)
+        order = sorted(indices, key=lambda i: pieces[i][1], reverse=True)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            try:
+                outputs = summarizer([pieces[i][0] for i in batch], batch_size=len(batch), truncation=True, **piece_params)
+            except Exception as e:
+                print(f"Error summarizing batch of {len(batch)} chunks: {e}")
+                continue
+            for i, output in zip(batch, outputs):
+                summaries[i] = output['summary_text']
+                if cache is not None:
+                    cache.put(text_sha256(pieces[i][0]), summaries[i], config_version(model_name, **piece_params))
+    return summaries
+
+
+def summarize_papers(summarizer, texts, batch_size=DEFAULT_BATCH_SIZE, max_tokens=None, cache=None, model_name=None):
+    """Summarizes every paper's full text with a map-reduce over token-bounded chunks.
+
+    Each paper is split into chunks that fit the model. Chunks from all papers are summarized
+    together in length-sorted batches, each paper's chunk summaries are joined and
+    re-chunked, and this repeats until a paper fits in one chunk, which gets the final
+    summary. Returns one summary per paper, or None where summarization failed.
+
+    With a cache, whole-paper summaries and individual chunk summaries are looked up by
+    text hash, model name and generation settings before the pipeline is run.
+    """
+    summaries = [None] * len(texts)
+    paper_version = config_version(model_name, chunk=CHUNK_SUMMARY_PARAMS, final=FINAL_SUMMARY_PARAMS, max_tokens=max_tokens)
+    if cache is not None:
+        summaries = [cache.get(text_sha256(text), paper_version) if text.strip() else None for text in texts]
+    missing = [paper for paper, text in enumerate(texts) if summaries[paper] is None and text.strip()]
+    if not missing:
+        return summaries
+
+    tokenizer = summarizer.tokenizer
+    if max_tokens is None:
+        max_tokens = tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+
+    pending = {}
+    for paper in missing:
+        pieces = chunk_text(texts[paper], tokenizer, max_tokens)
+        if pieces:
+            pending[paper] = pieces
+
+    while pending:
+        # Papers that fit in one chunk get their final summary; the rest are reduced a level
+        final = [paper for paper, pieces in pending.items() if len(pieces) == 1]
+        reducing = [paper for paper, pieces in pending.items() if len(pieces) > 1]
+
+        final_summaries = summarize_batched(summarizer, [pending[paper][0] for paper in final],
+                                            FINAL_SUMMARY_PARAMS, batch_size, cache, model_name)
+        for paper, summary in zip(final, final_summaries):
+            summaries[paper] = summary
+            # Stored as soon as it is made, so a run that dies keeps every paper it finished
+            if cache is not None and summary is not None:
+                cache.put(text_sha256(texts[paper]), summary, paper_version)
+
+        chunk_pieces = [(paper, piece) for paper in reducing for piece in pending[paper]]
+        chunk_summaries = summarize_batched(summarizer, [piece for _, piece in chunk_pieces],
+                                            CHUNK_SUMMARY_PARAMS, batch_size, cache, model_name)
+        joined = {paper: [] for paper in reducing}
+        for (paper, _), summary in zip(chunk_pieces, chunk_summaries):
+            joined[paper].append(summary)
+
+        reduced = {}
+        for paper, paper_summaries in joined.items():
+            if None in paper_summaries:
+                continue
+            pieces = chunk_text(' '.join(paper_summaries), tokenizer, max_tokens)
+            # Guard against summaries that don't shrink (e.g. a tiny context window): keep the head
+            if len(pieces) >= len(pending[paper]):
+                pieces = pieces[:1]
+            reduced[paper] = pieces
+        pending = reduced
+
+    return summaries
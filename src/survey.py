@@ -0,0 +1,171 @@
+import os
+import hashlib
+import argparse
+import importlib
+from functools import partial
+from duplicates import canonical_papers, link_aliases
+from corpus import list_pdf_files, map_papers, Supervision, report_failures, DEFAULT_TIMEOUT, DEFAULT_MEMORY_MB
+from manifest import Manifest, remove_manifest
+from pdf_text import stream_text_from_pdf, default_cache_stats
+from result_store import ResultStore
+from summarization import DEFAULT_BATCH_SIZE
+from instrumentation import start_tracing, trace_paper, trace_stage, finish_tracing, profiled
+
+# Analysis scripts that run off the survey's single extraction pass, by the script name used in the result store
+analyzer_modules = {'themes': 'pdf_analyze_themes', 'equations': 'pdf_analyze_equations', 'llm': 'pdf_anayze_LLM'}
+
+# Manifest of analyzed papers used by --incremental runs, tied to the analyzers and their keywords
+manifest_path = './cache/survey_manifest.json'
+# Results of an unfinished --checkpoint survey; removed once its runs have been stored
+checkpoint_path = './cache/survey_checkpoint.json'
+
+# Papers that could not be read are listed here instead of in the results
+failure_table_path = './survey_failures.csv'
+
+
+def load_analyzers(names):
+    """Imports the analysis scripts of the named analyzers."""
+    return {name: importlib.import_module(analyzer_modules[name]) for name in names}
+
+
+def survey_hash(analyzers):
+    """Returns a hash of the selected analyzers and the keyword sections each of them classifies with."""
+    modules = load_analyzers(analyzers)
+    combined = ' '.join(f"{name}:{modules[name].keywords_hash}" for name in sorted(analyzers))
+    return hashlib.sha256(combined.encode('utf-8')).hexdigest()
+
+
+def analyze_paper(pdf_path, analyzers):
+    """Extracts one PDF's text once and runs each of the named analyzers on it.
+
+    Returns {analyzer: result}, each result as the analyzer's own script would produce it,
+    except that the LLM result leaves out the text (it is read back from the text cache
+    when the papers are summarized). Each page is handed to every analyzer's scan as it is
+    extracted, so the pages are never held together.
+    """
+    modules = load_analyzers(analyzers)
+    filename = os.path.basename(pdf_path)
+    print(f"Analyzing {filename}...")
+
+    with trace_paper(pdf_path, default_cache_stats) as paper:
+        scans = {}
+        if 'themes' in modules:
+            with paper.stage('metadata'):
+                metadata = modules['themes'].extract_metadata_from_pdf(pdf_path)
+            scans['themes'] = modules['themes'].PageScan(filename, metadata)
+        if 'equations' in modules:
+            scans['equations'] = modules['equations'].PageScan(filename)
+        if 'llm' in modules:
+            scans['llm'] = modules['llm'].PageScan(filename, keep_text=False)
+        with paper.stage('matching'):
+            for page_text in paper.count_pages(stream_text_from_pdf(pdf_path)):
+                for scan in scans.values():
+                    scan.add_page(page_text)
+            return {name: scan.result() for name, scan in scans.items()}
+
+
+def run_survey(folder_path, analyzers, workers=1, incremental=False, supervision=None, dedupe=False, checkpoint=False):
+    """Analyzes each PDF in the folder with every selected analyzer off a single extraction pass.
+
+    Returns {analyzer: [result, ...]} in filename order. Papers that can't be read even with
+    the fallback extractor are left out and recorded in `supervision.failures`. With `dedupe`,
+    only one copy of each duplicated paper is analyzed, listing the others in its 'aliases'.
+    With `checkpoint`, each paper's results are journaled as they finish and papers finished
+    by an interrupted checkpointed survey are not analyzed again.
+    """
+    pdf_paths = [os.path.join(folder_path, filename) for filename in list_pdf_files(folder_path)]
+    if dedupe:
+        pdf_paths, aliases = canonical_papers(pdf_paths, workers, supervision)
+    # The incremental manifest is journaled too, so it doubles as the checkpoint
+    manifest = Manifest(manifest_path if incremental else checkpoint_path, survey_hash(analyzers)) \
+        if incremental or checkpoint else None
+    results = {name: [] for name in analyzers}
+    for paper_results in map_papers(partial(analyze_paper, analyzers=analyzers), pdf_paths, workers, manifest, supervision):
+        for name, result in paper_results.items():
+            results[name].append(result)
+    if dedupe:
+        for name_results in results.values():
+            link_aliases(name_results, aliases)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the survey's analyses over a folder of PDFs, extracting each paper only once.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    analyze = commands.add_parser("analyze", help="analyze a folder of PDFs with the selected analyzers and write their reports")
+    analyze.add_argument("folder", nargs="?", help="folder containing the PDFs (not needed with --metadata alone)")
+    analyze.add_argument("--themes", action="store_true", help="themes, datasets, regions, and custom terms (pdf_analyze_themes.py)")
+    analyze.add_argument("--equations", action="store_true", help="PDE, SDE, and sensor definitions (pdf_analyze_equations.py)")
+    analyze.add_argument("--llm", action="store_true", help="PDE/SDE keywords and LLM theme summaries (pdf_anayze_LLM.py)")
+    analyze.add_argument("--metadata", action="store_true", help="also classify the search-result CSV exports (classify_metadata.py)")
+    analyze.add_argument("--search-results", metavar="FOLDER", help="folder of CSV exports for --metadata (default: classify_metadata.py's)")
+    analyze.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    analyze.add_argument("--incremental", action="store_true", help="only analyze papers added or changed since the last incremental survey")
+    analyze.add_argument("--checkpoint", action="store_true", help="record each paper's results as soon as they finish, and resume an interrupted --checkpoint survey where it stopped")
+    analyze.add_argument("--dedupe", action="store_true", help="analyze one copy of papers that appear under several filenames and list the others as its aliases")
+    analyze.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"seconds allowed per paper before it is retried with the fallback extractor (default: {DEFAULT_TIMEOUT})")
+    analyze.add_argument("--max-memory-mb", type=int, default=DEFAULT_MEMORY_MB, help=f"memory cap of each worker process in MB (default: {DEFAULT_MEMORY_MB})")
+    analyze.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help=f"chunks summarized per batch with --llm (default: {DEFAULT_BATCH_SIZE})")
+    analyze.add_argument("--no-summary-cache", action="store_true", help="always re-run the model instead of reusing cached summaries")
+    analyze.add_argument("--keywords-only", action="store_true", help="with --llm, only identify PDE/SDE subcategories; never load the model")
+    analyze.add_argument("--int8", action="store_true", help="use a dynamically int8-quantized model for faster CPU inference")
+    analyze.add_argument("--trace", metavar="PATH", help="append per-paper and per-stage timings to a JSONL trace file")
+    analyze.add_argument("--profile", metavar="PATH", help="profile the run into a cProfile .prof file (or a pyinstrument .html file)")
+    args = parser.parse_args()
+
+    analyzers = [name for name in analyzer_modules if getattr(args, name)]
+    if not analyzers and not args.metadata:
+        parser.error("choose at least one of --themes, --equations, --llm, --metadata")
+    if analyzers and not args.folder:
+        parser.error("the PDF analyzers need the folder containing the PDFs")
+    if args.checkpoint and args.llm and args.no_summary_cache:
+        parser.error("--checkpoint resumes summarization from the summary cache; drop --no-summary-cache")
+    if args.trace:
+        start_tracing(args.trace, 'survey')
+
+    supervision = Supervision(args.timeout, args.max_memory_mb)
+    modules = load_analyzers(analyzers)
+    store = ResultStore()
+
+    with profiled(args.profile):
+        if analyzers:
+            run_ids = {name: store.start_run(name, args.folder, module.keywords_hash) for name, module in modules.items()}
+            with trace_stage('analysis'):
+                results = run_survey(args.folder, analyzers, args.workers, args.incremental, supervision, args.dedupe,
+                                     args.checkpoint)
+            report_failures(supervision, failure_table_path)
+
+            if 'llm' in modules:
+                llm = modules['llm']
+                llm.summarizer.int8 = args.int8
+                texts = []
+                if not args.keywords_only:
+                    # The text comes back from the text cache the extraction pass just filled, under the same
+                    # supervision (its failures were recorded the first time; a paper failing now is summarized
+                    # as failed)
+                    limits = Supervision(supervision.timeout, supervision.memory_mb, supervision.fallback)
+                    paper_texts = {paper['file']: paper['text'] for paper in
+                                   map_papers(llm.paper_text, [os.path.join(args.folder, result['file'])
+                                                               for result in results['llm']],
+                                              args.workers, supervision=limits)}
+                    texts = [paper_texts.get(result['file'], "") for result in results['llm']]
+                llm.add_themes(results['llm'], texts, args.batch_size, not args.no_summary_cache, args.keywords_only)
+
+            # Store every analyzer's results and render its reports from them
+            for name, module in modules.items():
+                store.save_results(run_ids[name], name, results[name], supervision.failures)
+                print(f"{name.capitalize()} results stored in {store.path} (run {run_ids[name]})")
+                with trace_stage('report', analyzer=name):
+                    module.render_reports(store, run_ids[name])
+            if args.checkpoint:
+                remove_manifest(checkpoint_path)
+
+        if args.metadata:
+            classify_metadata = importlib.import_module('classify_metadata')
+            search_results = args.search_results or classify_metadata.folder_path
+            with trace_stage('metadata'):
+                written = classify_metadata.stream_classified_csv_files(search_results, classify_metadata.output_path)
+            print(f"Classified {written} papers from {search_results} into '{classify_metadata.output_path}'")
+    store.close()
+    finish_tracing()
@@ -0,0 +1,282 @@
+import os
+import glob
+import json
+import shutil
+import argparse
+from functools import partial
+import numpy as np
+import pandas as pd
+from corpus import list_pdf_files, map_papers, Supervision, report_failures, DEFAULT_TIMEOUT, DEFAULT_MEMORY_MB
+from keyword_index import get_keyword_index, PATTERN_SECTIONS
+from pdf_text import file_sha256, extract_pages_from_pdf
+from duplicates import normalize_title, find_doi, pdf_title
+from classify_metadata import normalize_columns, deduplication_keys, drop_seen_papers
+
+# Folder of the term store's arrays (overridable from the environment)
+TERM_STORE_PATH = os.environ.get('TERM_STORE', './cache/term_store')
+
+# Search-result exports the papers are joined to for their publication year
+METADATA_PATTERN = './data/export*.csv'
+
+# Papers that could not be read by `build` are listed here instead of in the store
+failure_table_path = './term_store_failures.csv'
+
+# Bump whenever the layout of the stored arrays changes
+STORE_VERSION = 1
+
+# One row per keyword occurrence, sorted by term, paper, page, and offset
+OCCURRENCE_DTYPE = np.dtype([('paper', '<u4'), ('term', '<u4'), ('page', '<u4'), ('start', '<u4')])
+
+def load_metadata(pattern=METADATA_PATTERN):
+    """Reads the search-result exports into one DataFrame with IEEE column names, each paper once."""
+    frames = [normalize_columns(pd.read_csv(path, dtype=str, encoding='utf-8-sig')) for path in sorted(glob.glob(pattern))]
+    if not frames:
+        return pd.DataFrame(columns=['Document Title', 'Publication Year', 'DOI'])
+    return drop_seen_papers(pd.concat(frames, ignore_index=True), set()).reset_index(drop=True)
+
+
+def metadata_keys(metadata):
+    """Returns the key identifying each export row: 'doi:<doi>', or 'title:<title>' for rows without a DOI."""
+    doi, title = deduplication_keys(metadata)
+    return [f"doi:{paper_doi}" if paper_doi else f"title:{paper_title}" for paper_doi, paper_title in zip(doi, title)]
+
+
+def match_metadata(papers, metadata):
+    """Finds the export row of each paper: by DOI, then by the PDF's title, then by the
+    export title appearing on the paper's first page.
+
+    `papers` are dicts with 'doi', 'title', and 'first_page' (normalized text). Returns a
+    list of (row index or None, how it was matched).
+    """
+    doi, title = deduplication_keys(metadata)
+    by_doi = {key: row for row, key in reversed(list(enumerate(doi))) if key}
+    by_title = {key: row for row, key in reversed(list(enumerate(title))) if key}
+    matches = []
+    for paper in papers:
+        if paper['doi'] in by_doi:
+            matches.append((by_doi[paper['doi']], 'doi'))
+        elif paper['title'] and normalize_title(paper['title']) in by_title:
+            matches.append((by_title[normalize_title(paper['title'])], 'title'))
+        else:
+            # Titles shorter than a few words would match too much text
+            row = next((row for key, row in by_title.items() if len(key.split()) >= 4 and key in paper['first_page']), None)
+            matches.append((row, 'first page') if row is not None else (None, None))
+    return matches
+
+
+def paper_terms(pdf_path, matcher, term_ids):
+    """Returns one paper's keyword occurrences as (term, page, start) rows, with what it is joined to the exports by."""
+    pages = extract_pages_from_pdf(pdf_path)
+    return {'file': os.path.basename(pdf_path), 'sha256': file_sha256(pdf_path), 'pages': len(pages),
+            'doi': find_doi(pages), 'title': pdf_title(pdf_path),
+            'first_page': normalize_title(pages[0]) if pages else '',
+            'occurrences': [(term_ids[(section, keyword)], page, start)
+                            for section, keyword, page, start, _ in matcher.locate_pages(pages)]}
+
+
+def build_term_store(pdf_paths, path=TERM_STORE_PATH, metadata_pattern=METADATA_PATTERN, workers=1, supervision=None):
+    """Counts every keyword of keywords.json in each paper and writes the counts and positions as arrays.
+
+    Text comes from the extracted text cache (papers not cached yet are extracted once), in
+    `workers` supervised processes; papers that can't be read are left out and recorded in
+    `supervision.failures`. Each paper is joined to the search-result exports for its
+    publication year. The new store replaces the old one in a single rename. Returns the
+    number of papers stored.
+    """
+    keyword_index = get_keyword_index()
+    sections = [section for section in keyword_index.keyword_data if section not in PATTERN_SECTIONS]
+    matcher = keyword_index.matcher(sections)
+    terms = [(section, keyword) for section in sections for keyword in keyword_index.keyword_data[section]]
+    term_ids = {term: number for number, term in enumerate(terms)}
+
+    papers = []
+    counts = []
+    occurrences = []
+    for paper in map_papers(partial(paper_terms, matcher=matcher, term_ids=term_ids), pdf_paths, workers,
+                            supervision=supervision):
+        rows = paper.pop('occurrences')
+        terms_found = np.array([term for term, _, _ in rows], dtype=np.intp)
+        counts.append(np.bincount(terms_found, minlength=len(terms)).astype(np.uint32))
+        occurrences.extend((len(papers), term, page, start) for term, page, start in rows)
+        papers.append(paper)
+
+    metadata = load_metadata(metadata_pattern)
+    keys = metadata_keys(metadata)
+    years = np.zeros(len(papers), dtype=np.int32)
+    for number, (paper, (row, matched_by)) in enumerate(zip(papers, match_metadata(papers, metadata))):
+        del paper['first_page']
+        paper['matched_by'] = matched_by
+        if row is not None:
+            paper['metadata_key'] = keys[row]
+            year = metadata.at[row, 'Publication Year'] if 'Publication Year' in metadata else None
+            if isinstance(year, str) and year.strip().isdigit():
+                years[number] = int(year)
+        paper['year'] = int(years[number]) or None
+
+    occurrences = np.array(occurrences, dtype=OCCURRENCE_DTYPE)
+    occurrences.sort(order=['term', 'paper', 'page', 'start'])
+    term_offsets = np.searchsorted(occurrences['term'], np.arange(len(terms) + 1)).astype(np.int64)
+
+    staging = path.rstrip('/') + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    # Column-major counts, so a term's counts across the corpus are contiguous on disk
+    np.save(os.path.join(staging, 'counts.npy'),
+            np.asfortranarray(np.vstack(counts) if counts else np.zeros((0, len(terms)), dtype=np.uint32)))
+    np.save(os.path.join(staging, 'occurrences.npy'), occurrences)
+    np.save(os.path.join(staging, 'term_offsets.npy'), term_offsets)
+    np.save(os.path.join(staging, 'years.npy'), years)
+    with open(os.path.join(staging, 'store.json'), 'w') as f:
+        json.dump({'version': STORE_VERSION, 'keywords_sha256': keyword_index.sha256, 'metadata': metadata_pattern,
+                   'terms': terms, 'papers': papers}, f, indent=1)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging, path)
+    return len(papers)
+
+
+class TermStore:
+    """Per-paper keyword counts and occurrence positions, memory-mapped from NumPy arrays.
+
+    `counts[paper, term]` holds how often each keyword occurs in each paper, and
+    `occurrences` holds (paper, term, page, start) for every occurrence, grouped by term so
+    `term_offsets[term]:term_offsets[term + 1]` slices out one keyword's positions. `years`
+    holds each paper's publication year from the search-result exports (0 when unknown).
+    Only the pages of the arrays a query touches are read from disk.
+    """
+
+    def __init__(self, path=TERM_STORE_PATH):
+        self.path = path
+        with open(os.path.join(path, 'store.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f"{path} was built by another version of term_store.py; rebuild it")
+        self.keywords_sha256 = meta['keywords_sha256']
+        self.metadata_pattern = meta['metadata']
+        self.terms = [tuple(term) for term in meta['terms']]
+        self.papers = meta['papers']
+        self.counts = np.load(os.path.join(path, 'counts.npy'), mmap_mode='r')
+        self.occurrences = np.load(os.path.join(path, 'occurrences.npy'), mmap_mode='r')
+        self.term_offsets = np.load(os.path.join(path, 'term_offsets.npy'), mmap_mode='r')
+        self.years = np.load(os.path.join(path, 'years.npy'), mmap_mode='r')
+
+    def term_ids(self, keywords, section=None):
+        """Returns the term numbers of keywords (matched case-insensitively), optionally within one section."""
+        ids = []
+        for keyword in keywords:
+            found = [number for number, (term_section, term) in enumerate(self.terms)
+                     if term.lower() == keyword.lower() and section in (None, term_section)]
+            if not found:
+                raise KeyError(f"{keyword!r} is not a keyword{f' of {section}' if section else ''} in the term store")
+            ids.append(found[0])
+        return ids
+
+    def trend(self, keywords, section=None, share=False, occurrences=False):
+        """Returns a DataFrame of the papers per publication year mentioning each keyword.
+
+        With `occurrences`, counts every mention instead of every paper; with `share`,
+        divides by the number of papers of that year in the store. Papers without a known
+        year are left out.
+        """
+        ids = self.term_ids(keywords, section)
+        known = np.flatnonzero(np.asarray(self.years) > 0)
+        years, rows = np.unique(np.asarray(self.years)[known], return_inverse=True)
+        values = np.asarray(self.counts[:, ids])[known]
+        values = values if occurrences else values > 0
+        table = np.zeros((len(years), len(ids)))
+        np.add.at(table, rows, values)
+        if share:
+            table /= np.maximum(np.bincount(rows, minlength=len(years)), 1)[:, None]
+        return pd.DataFrame(table, index=pd.Index(years, name='year'), columns=[self.terms[term][1] for term in ids])
+
+    def top_terms(self, years=None, section=None, limit=20):
+        """Ranks keywords by mean TF-IDF over the papers published in `years` (a (first, last) range; all papers by default).
+
+        Term frequency is a keyword's share of all keyword occurrences in a paper, and the
+        inverse document frequency is taken over the whole store, so a year's ranking shows
+        the keywords that set it apart.
+        """
+        # Each section's terms are a contiguous block of columns
+        numbers = [number for number, term in enumerate(self.terms) if section in (None, term[0])]
+        columns = slice(numbers[0], numbers[-1] + 1) if numbers else slice(0, 0)
+        papers = slice(None)
+        if years is not None:
+            papers = np.flatnonzero((np.asarray(self.years) >= years[0]) & (np.asarray(self.years) <= years[1]))
+        document_frequency = (self.counts[:, columns] > 0).sum(axis=0)
+        idf = np.log((1 + len(self.counts)) / (1 + document_frequency)) + 1
+        # Only the ranked papers and keywords are read into memory as floats; term frequencies are
+        # still shares of all of a paper's keyword occurrences
+        selected = np.asarray(self.counts[papers, columns], dtype=np.float64)
+        totals = self.counts.sum(axis=1, dtype=np.float64)[papers]
+        tf = selected / np.maximum(totals, 1)[:, None]
+        ranking = pd.DataFrame({
+            'section': [self.terms[number][0] for number in numbers],
+            'keyword': [self.terms[number][1] for number in numbers],
+            'papers': (selected > 0).sum(axis=0),
+            'occurrences': selected.sum(axis=0).astype(np.int64),
+            'tfidf': (tf * idf).mean(axis=0) if len(selected) else np.zeros(len(numbers))
+        })
+        return ranking[ranking['occurrences'] > 0].sort_values('tfidf', ascending=False).head(limit).reset_index(drop=True)
+
+    def positions(self, keyword, section=None):
+        """Returns a DataFrame of the file, page (from 1), and character offset of every occurrence of a keyword."""
+        term = self.term_ids([keyword], section)[0]
+        rows = np.asarray(self.occurrences[self.term_offsets[term]:self.term_offsets[term + 1]])
+        return pd.DataFrame({'file': [self.papers[paper]['file'] for paper in rows['paper']],
+                             'page': rows['page'], 'start': rows['start']})
+
+    def paper_metadata(self, metadata_pattern=None):
+        """Returns the stored papers joined to all columns of their search-result export rows
+        (read from the exports the store was built with, unless others are given)."""
+        papers = pd.DataFrame(self.papers)
+        if 'metadata_key' not in papers:
+            papers['metadata_key'] = None
+        metadata = load_metadata(metadata_pattern or self.metadata_pattern)
+        metadata.index = metadata_keys(metadata)
+        return papers.join(metadata, on='metadata_key')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the memory-mapped keyword term-frequency store.")
+    parser.add_argument("--store", default=TERM_STORE_PATH, help=f"term store folder (default: {TERM_STORE_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="count the keywords of every PDF in a folder and join the papers to the exports")
+    build.add_argument("folder", help="folder containing the PDF files")
+    build.add_argument("--metadata", default=METADATA_PATTERN, help=f"search-result exports to join (default: {METADATA_PATTERN})")
+    build.add_argument("--workers", type=int, default=1, help="number of worker processes (default: 1)")
+    build.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"seconds allowed per paper before it is retried with the fallback extractor (default: {DEFAULT_TIMEOUT})")
+    build.add_argument("--max-memory-mb", type=int, default=DEFAULT_MEMORY_MB, help=f"memory cap of each worker process in MB (default: {DEFAULT_MEMORY_MB})")
+
+    trend = commands.add_parser("trend", help="papers per publication year mentioning each keyword")
+    trend.add_argument("keywords", nargs="+", help="keywords, e.g. 'IoT' 'machine learning'")
+    trend.add_argument("--section", help="only look the keywords up in this keywords.json section")
+    trend.add_argument("--share", action="store_true", help="divide by the number of papers of each year")
+    trend.add_argument("--occurrences", action="store_true", help="count every mention instead of every paper")
+
+    top = commands.add_parser("top", help="keywords ranked by TF-IDF")
+    top.add_argument("--years", help="publication years to rank, e.g. 2020 or 2015-2020 (default: all papers)")
+    top.add_argument("--section", help="only rank the keywords of this keywords.json section")
+    top.add_argument("--limit", type=int, default=20, help="number of keywords to list (default: 20)")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        pdf_paths = [os.path.join(args.folder, filename) for filename in list_pdf_files(args.folder)]
+        supervision = Supervision(args.timeout, args.max_memory_mb)
+        stored = build_term_store(pdf_paths, args.store, args.metadata, args.workers, supervision)
+        report_failures(supervision, failure_table_path)
+        dated = sum(year > 0 for year in TermStore(args.store).years)
+        print(f"Stored keyword counts of {stored} papers in {args.store}; {dated} joined to a publication year.")
+    else:
+        store = TermStore(args.store)
+        if store.keywords_sha256 != get_keyword_index().sha256:
+            print("Note: keywords.json changed since the term store was built; rebuild it to count the new keywords.")
+        try:
+            if args.command == "trend":
+                print(store.trend(args.keywords, args.section, args.share, args.occurrences).to_string())
+            else:
+                first, _, last = args.years.partition('-') if args.years else (None, None, None)
+                years = (int(first), int(last or first)) if first else None
+                print(store.top_terms(years, args.section, args.limit).to_string(index=False))
+        except KeyError as e:
+            parser.exit(1, f"{e.args[0]}\n")
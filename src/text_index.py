@@ -0,0 +1,492 @@
+import os
+import re
+import sys
+import json
+import zlib
+import sqlite3
+import argparse
+from array import array
+from pdf_text import active_extractor, extractors, file_sha256, iter_pages_from_pdf
+from corpus import list_pdf_files
+from keyword_matcher import KEYWORDS_PATH
+from keyword_index import get_keyword_index
+
+# Location of the inverted index (overridable from the environment)
+INDEX_PATH = os.environ.get('TEXT_INDEX', './cache/text_index.sqlite')
+
+# Bump whenever tokenization or the postings layout changes, so the index is rebuilt
+INDEX_VERSION = "index-1"
+
+# Terms are lowercased runs of word characters, the same notion of a word as the \b anchors
+TOKEN = re.compile(r'\w+')
+
+# Query syntax: quoted phrases (optionally ~N for proximity), parentheses, and bare terms
+QUERY_TOKEN = re.compile(r'\s*(?:(")([^"]*)"(?:~(\d+))?|(\()|(\))|([^\s()"]+))')
+
+
+def index_version():
+    """Returns the version stamped on an index built with the active extractor.
+
+    It names the extractor and its backends' versions as well as INDEX_VERSION, so switching
+    extractors (e.g. PDF_EXTRACTOR=pdfplumber) rebuilds the index rather than mixing texts.
+    """
+    name = active_extractor()
+    backends = '+'.join(version for _, _, version, _ in extractors[name])
+    return f"{name}:{backends}/{INDEX_VERSION}"
+
+
+def tokenize(text):
+    """Yields (term, start, end) for every word of the text."""
+    for match in TOKEN.finditer(text):
+        yield match.group().lower(), match.start(), match.end()
+
+
+def _joins(left, right):
+    """Returns True when two adjacent characters are both word characters (no \\b between them)."""
+    return bool(left and right and TOKEN.match(left) and TOKEN.match(right))
+
+
+def _pack(values):
+    return zlib.compress(array('I', values).tobytes())
+
+
+def _unpack(blob):
+    values = array('I')
+    values.frombytes(zlib.decompress(blob))
+    return values
+
+
+class QueryError(ValueError):
+    """Raised for a query that cannot be parsed."""
+
+
+def parse_query(query):
+    """Parses a query into a tree of ('and'|'or', [nodes]), ('not', node) and ('phrase', terms, slop).
+
+    Adjacent terms are ANDed; AND, OR and NOT (upper case) combine them and parentheses
+    group them. "quoted words" must appear in that order, and "quoted words"~N within N
+    extra words of each other in any order. A bare term with punctuation (e.g. k-means)
+    is treated as a phrase of its words.
+    """
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = QUERY_TOKEN.match(query, position)
+        if match is None or match.end() == position:
+            raise QueryError(f"Cannot parse query at: {query[position:]!r}")
+        quote, phrase, slop, open_paren, close_paren, word = match.groups()
+        if quote:
+            tokens.append(('phrase', [term for term, _, _ in tokenize(phrase)], int(slop or 0)))
+        elif open_paren or close_paren:
+            tokens.append((open_paren or close_paren,))
+        elif word in ('AND', 'OR', 'NOT'):
+            tokens.append((word,))
+        else:
+            tokens.append(('phrase', [term for term, _, _ in tokenize(word)], 0))
+        position = match.end()
+
+    def peek():
+        return tokens[0][0] if tokens else None
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == 'OR':
+            tokens.pop(0)
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and():
+        nodes = [parse_not()]
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                tokens.pop(0)
+            nodes.append(parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_not():
+        if peek() == 'NOT':
+            tokens.pop(0)
+            return ('not', parse_not())
+        if peek() == '(':
+            tokens.pop(0)
+            node = parse_or()
+            if peek() != ')':
+                raise QueryError("Missing closing parenthesis")
+            tokens.pop(0)
+            return node
+        if peek() != 'phrase':
+            raise QueryError(f"Expected a term, found {peek() or 'end of query'}")
+        node = tokens.pop(0)
+        if not node[1]:
+            raise QueryError("Empty phrase")
+        return node
+
+    if not tokens:
+        raise QueryError("Empty query")
+    tree = parse_or()
+    if tokens:
+        raise QueryError(f"Unexpected {tokens[0][0]}")
+    return tree
+
+
+class TextIndex:
+    """On-disk inverted index of the extracted text of a PDF corpus.
+
+    For every term it stores, per paper, the term's word positions together with the page
+    and character offsets of each occurrence, so boolean, phrase and proximity queries are
+    answered from the postings and hits can be shown with a snippet of surrounding text.
+    Page texts are kept alongside the postings for those snippets. The index is updated
+    incrementally: only papers whose size, mtime or contents changed are re-indexed.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        version = index_version()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is not None and row[0] != version:
+            # Postings from another tokenizer or extractor can't be mixed with new ones
+            for table in ('papers', 'pages', 'postings', 'failures'):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS papers ("
+            " id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE,"
+            " mtime REAL NOT NULL, size INTEGER NOT NULL, sha256 TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " paper_id INTEGER NOT NULL, page INTEGER NOT NULL, text BLOB NOT NULL,"
+            " PRIMARY KEY (paper_id, page))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            " term TEXT NOT NULL, paper_id INTEGER NOT NULL, occurrences BLOB NOT NULL,"
+            " PRIMARY KEY (term, paper_id)) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_paper ON postings (paper_id)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS failures ("
+            " path TEXT PRIMARY KEY, sha256 TEXT NOT NULL, error TEXT NOT NULL)"
+        )
+        self.conn.commit()
+        self._page_cache = {}
+
+    # Building
+
+    def update(self, pdf_paths, cache=None):
+        """Brings the index in line with the given papers.
+
+        New and changed papers are (re-)indexed from their extracted text, unchanged ones are
+        kept, and papers no longer listed are removed. A paper whose text can't be extracted
+        leaves nothing in the index and is recorded in the failures table, so the next update
+        tries it again. Returns (indexed, unchanged, removed, failed) lists of paths.
+        """
+        known = {path: (paper_id, mtime, size, sha256)
+                 for paper_id, path, mtime, size, sha256 in self.conn.execute("SELECT id, path, mtime, size, sha256 FROM papers")}
+        keep = set(pdf_paths)
+        removed = sorted(path for path in known if path not in keep)
+        for path in removed:
+            self._remove(known[path][0])
+        self.conn.execute("DELETE FROM failures")
+
+        indexed, unchanged, failed = [], [], []
+        for pdf_path in pdf_paths:
+            stat = os.stat(pdf_path)
+            entry = known.get(pdf_path)
+            if entry is not None and stat.st_size == entry[2] and stat.st_mtime == entry[1]:
+                unchanged.append(pdf_path)
+                continue
+            sha256 = file_sha256(pdf_path)
+            if entry is not None and stat.st_size == entry[2] and sha256 == entry[3]:
+                # Touched but not modified
+                self.conn.execute("UPDATE papers SET mtime = ? WHERE id = ?", (stat.st_mtime, entry[0]))
+                unchanged.append(pdf_path)
+                continue
+            if entry is not None:
+                self._remove(entry[0])
+            self.conn.commit()
+            try:
+                self._add(pdf_path, stat, sha256, cache)
+            except Exception as e:
+                # Drop whatever was written for the paper, so it isn't taken as indexed
+                self.conn.rollback()
+                print(f"Error extracting text from {pdf_path}: {e}")
+                self.conn.execute("INSERT OR REPLACE INTO failures (path, sha256, error) VALUES (?, ?, ?)",
+                                  (pdf_path, sha256, f"{type(e).__name__}: {e}"))
+                failed.append(pdf_path)
+            else:
+                indexed.append(pdf_path)
+            self.conn.commit()
+        self.conn.commit()
+        self._page_cache.clear()
+        return indexed, unchanged, removed, failed
+
+    def _add(self, pdf_path, stat, sha256, cache):
+        cursor = self.conn.execute(
+            "INSERT INTO papers (path, mtime, size, sha256) VALUES (?, ?, ?, ?)",
+            (pdf_path, stat.st_mtime, stat.st_size, sha256)
+        )
+        paper_id = cursor.lastrowid
+        occurrences = {}
+        position = 0
+        for page, page_text in enumerate(iter_pages_from_pdf(pdf_path, cache)):
+            self.conn.execute("INSERT INTO pages (paper_id, page, text) VALUES (?, ?, ?)",
+                              (paper_id, page, zlib.compress(page_text.encode('utf-8'))))
+            for term, start, end in tokenize(page_text):
+                occurrences.setdefault(term, array('I')).extend((position, page, start, end))
+                position += 1
+        self.conn.executemany(
+            "INSERT INTO postings (term, paper_id, occurrences) VALUES (?, ?, ?)",
+            ((term, paper_id, _pack(values)) for term, values in occurrences.items())
+        )
+
+    def _remove(self, paper_id):
+        for table, column in (('postings', 'paper_id'), ('pages', 'paper_id'), ('papers', 'id')):
+            self.conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (paper_id,))
+
+    # Querying
+
+    def paths(self):
+        """Returns {paper_id: path} for every indexed paper."""
+        return dict(self.conn.execute("SELECT id, path FROM papers ORDER BY path"))
+
+    def failures(self):
+        """Returns {path: error} for the papers the last update could not index."""
+        return dict(self.conn.execute("SELECT path, error FROM failures ORDER BY path"))
+
+    def postings(self, term):
+        """Returns {paper_id: [(position, page, start, end), ...]} for one term."""
+        result = {}
+        for paper_id, blob in self.conn.execute("SELECT paper_id, occurrences FROM postings WHERE term = ?", (term,)):
+            values = _unpack(blob)
+            result[paper_id] = [tuple(values[i:i + 4]) for i in range(0, len(values), 4)]
+        return result
+
+    def page_text(self, paper_id, page):
+        key = (paper_id, page)
+        if key not in self._page_cache:
+            row = self.conn.execute("SELECT text FROM pages WHERE paper_id = ? AND page = ?", key).fetchone()
+            self._page_cache[key] = zlib.decompress(row[0]).decode('utf-8') if row else ''
+        return self._page_cache[key]
+
+    def evaluate(self, query):
+        """Returns {paper_id: [(page, start, end), ...]} for the papers matching a query.
+
+        The hits are the character spans of the phrases that made the paper match; papers
+        matched only through NOT have no hits.
+        """
+        tree = parse_query(query) if isinstance(query, str) else query
+        return self._evaluate(tree)
+
+    def _evaluate(self, node):
+        kind = node[0]
+        if kind == 'phrase':
+            return self._phrase(node[1], node[2])
+        if kind == 'not':
+            excluded = self._evaluate(node[1])
+            return {paper_id: [] for paper_id in self.paths() if paper_id not in excluded}
+        results = [self._evaluate(child) for child in node[1]]
+        if kind == 'and':
+            papers = set(results[0]).intersection(*results[1:])
+        else:
+            papers = set().union(*results)
+        return {paper_id: sorted(hit for result in results for hit in result.get(paper_id, [])) for paper_id in papers}
+
+    def _phrase(self, terms, slop, across_pages=False):
+        postings = {}
+        for term in dict.fromkeys(terms):
+            postings[term] = self.postings(term)
+            if not postings[term]:
+                return {}
+        papers = set.intersection(*(set(term_postings) for term_postings in postings.values()))
+        hits = {}
+        for paper_id in papers:
+            occurrences = {term: term_postings[paper_id] for term, term_postings in postings.items()}
+            if slop == 0:
+                paper_hits = self._exact_phrase(terms, occurrences, across_pages)
+            else:
+                paper_hits = self._near(terms, occurrences, slop)
+            if paper_hits:
+                hits[paper_id] = paper_hits
+        return hits
+
+    @staticmethod
+    def _exact_phrase(terms, occurrences, across_pages=False):
+        """Returns (page, start, end) for each occurrence of the phrase on a page, or with
+        `across_pages` (page, start, last page, end) for every occurrence."""
+        by_position = {term: {occurrence[0]: occurrence for occurrence in term_occurrences}
+                       for term, term_occurrences in occurrences.items()}
+        hits = []
+        for position, page, start, end in occurrences[terms[0]]:
+            last = by_position[terms[-1]].get(position + len(terms) - 1)
+            if last is None or (last[1] != page and not across_pages):
+                continue
+            if all(position + i in by_position[term] for i, term in enumerate(terms[1:-1], 1)):
+                hits.append((page, start, last[1], last[3]) if across_pages else (page, start, last[3]))
+        return hits
+
+    @staticmethod
+    def _near(terms, occurrences, slop):
+        # Smallest windows containing every distinct term, at most slop words wider than the phrase
+        wanted = list(dict.fromkeys(terms))
+        merged = sorted((occurrence, wanted.index(term)) for term, term_occurrences in occurrences.items()
+                        for occurrence in term_occurrences)
+        counts = [0] * len(wanted)
+        covered = 0
+        left = 0
+        hits = []
+        for right, (occurrence, term) in enumerate(merged):
+            counts[term] += 1
+            covered += counts[term] == 1
+            while covered == len(wanted):
+                first = merged[left][0]
+                if occurrence[0] - first[0] <= len(terms) - 1 + slop and first[1] == occurrence[1]:
+                    hits.append((first[1], first[2], occurrence[3]))
+                counts[merged[left][1]] -= 1
+                covered -= counts[merged[left][1]] == 0
+                left += 1
+        return hits
+
+    def snippet(self, paper_id, page, start, end, context=60):
+        """Returns the hit with up to `context` characters on either side, on one line."""
+        text = self.page_text(paper_id, page)
+        before = text[max(0, start - context):start]
+        after = text[end:end + context]
+        snippet = f"{'...' if start > context else ''}{before}[{text[start:end]}]{after}{'...' if end + context < len(text) else ''}"
+        return ' '.join(snippet.split())
+
+    def search(self, query, max_snippets=3, context=60):
+        """Returns [(path, hit_count, [(page, snippet), ...]), ...] for the papers matching a query,
+        most hits first."""
+        paths = self.paths()
+        results = []
+        for paper_id, hits in self.evaluate(query).items():
+            snippets = [(page + 1, self.snippet(paper_id, page, start, end, context))
+                        for page, start, end in hits[:max_snippets]]
+            results.append((paths[paper_id], len(hits), snippets))
+        return sorted(results, key=lambda result: (-result[1], result[0]))
+
+    def keyword_matches(self, categories):
+        """Returns {path: {category: [keywords found, in keyword-list order]}} for every indexed paper.
+
+        This answers the same question as KeywordMatcher.find over each paper's text: every
+        keyword is looked up as a phrase and its hits are checked against the page text with
+        the scripts' case-insensitive \\b keyword \\b pattern, so punctuation inside a keyword
+        (e.g. "wireless sensor networks (WSNs)") still has to match literally.
+        """
+        paths = self.paths()
+        matches = {path: {category: [] for category in categories} for path in paths.values()}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                for paper_id in self._keyword_papers(keyword):
+                    matches[paths[paper_id]][category].append(keyword)
+        return matches
+
+    def _keyword_papers(self, keyword):
+        terms = [term for term, _, _ in tokenize(keyword)]
+        if not terms:
+            return set()
+        pattern = re.compile(r'\b' + re.escape(keyword) + r'\b', re.IGNORECASE)
+        # The keyword may begin with punctuation that comes before its first word
+        lead = TOKEN.search(keyword).start()
+        papers = set()
+        # The scripts match the joined text of the pages, so a keyword may continue onto the next page
+        for paper_id, hits in self._phrase(terms, 0, across_pages=True).items():
+            for page, start, last_page, _ in hits:
+                text = ''.join(self.page_text(paper_id, number) for number in range(page, last_page + 1))
+                match = pattern.match(text, start - lead) if start >= lead else None
+                if match is None:
+                    continue
+                # The scripts join pages without a separator, so a word touching the edge of
+                # a page runs into the neighbouring page's text
+                if match.start() == 0 and _joins(self._adjacent_char(paper_id, page, -1), text[0]):
+                    continue
+                if match.end() == len(text) and _joins(text[-1], self._adjacent_char(paper_id, last_page, 1)):
+                    continue
+                papers.add(paper_id)
+                break
+        return papers
+
+    def _adjacent_char(self, paper_id, page, step):
+        """Returns the character that precedes (step -1) or follows (step 1) a page in the joined text."""
+        page += step
+        while page >= 0:
+            text = self.page_text(paper_id, page)
+            if text:
+                return text[-1] if step < 0 else text[0]
+            if self.conn.execute("SELECT 1 FROM pages WHERE paper_id = ? AND page = ?", (paper_id, page)).fetchone() is None:
+                break
+            page += step
+        return ''
+
+    def close(self):
+        self.conn.close()
+
+
+def load_keyword_sections(keywords_path, sections):
+    """Returns {section: keywords} for the requested sections of a validated keywords.json file."""
+    return get_keyword_index(keywords_path).sections(sections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query a full-text inverted index of the paper corpus.")
+    parser.add_argument("--index", default=INDEX_PATH, help=f"index database (default: {INDEX_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="index new and changed PDFs in a folder and drop removed ones")
+    build.add_argument("folder", help="folder containing the PDF files")
+
+    query = commands.add_parser("query", help='search the index, e.g. \'FWI AND LoRa\', \'"fire weather index"\', \'"sensor placement"~5\'')
+    query.add_argument("query", help="boolean (AND, OR, NOT, parentheses), phrase and proximity query")
+    query.add_argument("--limit", type=int, default=20, help="maximum number of papers to list (default: 20)")
+    query.add_argument("--snippets", type=int, default=3, help="context snippets per paper (default: 3)")
+    query.add_argument("--context", type=int, default=60, help="characters of context around each hit (default: 60)")
+
+    classify = commands.add_parser("classify", help="count the papers mentioning each keyword of keywords.json sections")
+    classify.add_argument("sections", nargs="+", help="keywords.json sections, e.g. themes datasets pde_categories")
+    classify.add_argument("--keywords", default=KEYWORDS_PATH, help=f"keyword file (default: {KEYWORDS_PATH})")
+    classify.add_argument("--json", dest="json_path", help="also write each paper's matched keywords to this JSON file")
+
+    args = parser.parse_args()
+    index = TextIndex(args.index)
+
+    if args.command == "build":
+        pdf_paths = [os.path.join(args.folder, filename) for filename in list_pdf_files(args.folder)]
+        indexed, unchanged, removed, failed = index.update(pdf_paths)
+        print(f"Indexed {len(indexed)} papers, kept {len(unchanged)} unchanged, removed {len(removed)}.")
+        if failed:
+            print(f"Could not index {len(failed)} papers; they will be retried on the next build:")
+            for path, error in index.failures().items():
+                print(f"  {os.path.basename(path)}: {error}")
+
+    elif args.command == "query":
+        try:
+            results = index.search(args.query, args.snippets, args.context)
+        except QueryError as e:
+            sys.exit(f"Invalid query: {e}")
+        print(f"{len(results)} papers match {args.query!r}")
+        for path, hit_count, snippets in results[:args.limit]:
+            print(f"\n{os.path.basename(path)} ({hit_count} hits)")
+            for page, snippet in snippets:
+                print(f"  p.{page}: {snippet}")
+
+    elif args.command == "classify":
+        categories = load_keyword_sections(args.keywords, args.sections)
+        matches = index.keyword_matches(categories)
+        for category, keywords in categories.items():
+            print(f"\n{category}:")
+            for keyword in keywords:
+                count = sum(keyword in paper[category] for paper in matches.values())
+                if count:
+                    print(f"  {keyword}: {count}")
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump(matches, f, indent=4)
+
+    index.close()
@@ -0,0 +1,82 @@
+import random
+import pandas as pd
+from classify_metadata import (classification_keywords, classify_abstracts, classify_paper, drop_seen_papers,
+                               normalize_columns, stream_classified_csv_files)
+
+WORDS = ['wildfire', 'forest', 'the', 'of', 'deep learning', 'MODIS', 'IoT', 'wind speed', 'California',
+         'Victoria', 'Amazon', 'network', 'networks', 'temperature', 'global', 'fire spread model', 'SVM']
+
+
+def random_abstracts(rng, count):
+    return pd.Series([' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 15))) for _ in range(count)],
+                     index=range(100, 100 + count))
+
+
+def test_classify_abstracts_matches_classify_paper():
+    abstracts = random_abstracts(random.Random(0), 300)
+    classified = classify_abstracts(abstracts)
+    assert list(classified.index) == list(abstracts.index)
+    for index, abstract in abstracts.items():
+        for column, keyword_dict in classification_keywords.items():
+            categories = classify_paper(abstract, keyword_dict)
+            assert classified.at[index, column] == categories
+            for category in keyword_dict:
+                assert classified.at[index, f"{column}: {category}"] == (category in categories)
+
+
+def test_classify_abstracts_handles_missing_and_empty_input():
+    classified = classify_abstracts(pd.Series([None, 'Deep learning in California']))
+    assert classified.at[0, 'Method'] == []
+    assert classified.at[1, 'Method'] == ['machine learning']
+    assert classified.at[1, 'Region'] == ['USA']
+
+    empty = classify_abstracts(pd.Series([], dtype=str))
+    assert len(empty) == 0
+    assert {'Method', 'Data Type', 'Region', 'Method: machine learning'} <= set(empty.columns)
+
+
+def test_normalize_columns_maps_export_names():
+    scopus = pd.DataFrame(columns=['Title', ' Year ', 'Source title', 'Link', 'Abstract', 'DOI'])
+    assert list(normalize_columns(scopus).columns) == ['Document Title', 'Publication Year', 'Publication Title',
+                                                       'PDF Link', 'Abstract', 'DOI']
+    wos = pd.DataFrame(columns=['Article Title', 'Source Title'])
+    assert list(normalize_columns(wos).columns) == ['Document Title', 'Publication Title']
+
+
+def test_drop_seen_papers_by_doi_or_title_across_chunks():
+    seen = set()
+    first = pd.DataFrame({'DOI': ['10.1/A', None, '10.1/b'],
+                          'Document Title': ['Fire Spread', 'Smoke: Detection!', 'Fire spread']})
+    # The third row repeats the first one's title within the chunk
+    assert list(drop_seen_papers(first, seen).index) == [0, 1]
+
+    second = pd.DataFrame({'DOI': ['https://doi.org/10.1/a', 'doi: 10.1/C', None, ''],
+                           'Document Title': ['Another title', 'smoke detection', 'New Paper', None]})
+    # Same DOI as a link, same title up to case and punctuation, a new paper, and a row without keys
+    assert list(drop_seen_papers(second, seen).index) == [2, 3]
+
+
+def test_stream_matches_combined_classification(tmp_path):
+    folder = tmp_path / 'exports'
+    folder.mkdir()
+    rng = random.Random(1)
+    abstracts = random_abstracts(rng, 40)
+    pd.DataFrame({'Document Title': [f'Paper {i}' for i in range(25)], 'DOI': [f'10.1/{i}' for i in range(25)],
+                  'Abstract': abstracts[:25].values}).to_csv(folder / 'ieee.csv', index=False)
+    # Scopus export with a UTF-8 BOM, a repeated DOI and a repeated title
+    pd.DataFrame({'Title': ['Paper 3', 'Other'] + [f'Paper {i}' for i in range(25, 38)],
+                  'DOI': ['10.1/new', '10.1/4'] + [f'10.1/{i}' for i in range(25, 38)],
+                  'Year': ['2020'] * 15,
+                  'Abstract': abstracts[25:].values}).to_csv(folder / 'scopus.csv', index=False, encoding='utf-8-sig')
+
+    output = tmp_path / 'classified.csv'
+    assert stream_classified_csv_files(str(folder), str(output), chunksize=7) == 38
+    streamed = pd.read_csv(output, dtype=str, keep_default_na=False)
+    assert list(streamed.columns[:4]) == ['Document Title', 'DOI', 'Abstract', 'Publication Year']
+    assert list(streamed['Document Title']) == [f'Paper {i}' for i in range(38)]
+    assert list(streamed['Publication Year']) == [''] * 25 + ['2020'] * 13
+
+    kept = pd.Series(list(abstracts[:25]) + list(abstracts[27:]))
+    expected = classify_abstracts(kept)
+    assert list(streamed['Method']) == [str(categories) for categories in expected['Method']]
+    assert list(streamed['Region: USA']) == [str(flag) for flag in expected['Region: USA']]
@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+from itertools import combinations
+import numpy as np
+import pytest
+from cooccurrence import TermIncidence
+
+VOCABULARIES = {
+    'themes': ['fire', 'smoke', 'sensor', 'satellite', 'model'],
+    'datasets': ['MODIS', 'Landsat', 'VIIRS'],
+    'regions': ['USA', 'Canada'],
+}
+
+
+@pytest.fixture(scope='module')
+def papers():
+    rng = random.Random(0)
+    return [{name: rng.sample(terms, rng.randint(0, len(terms))) for name, terms in VOCABULARIES.items()}
+            for _ in range(200)]
+
+
+@pytest.fixture(scope='module')
+def incidence(papers):
+    incidence = TermIncidence(VOCABULARIES)
+    for found in papers:
+        incidence.add_paper(found)
+    return incidence
+
+
+def test_incidence_blocks(papers, incidence):
+    assert incidence.incidence().shape == (200, 10)
+    datasets = incidence.incidence('datasets')
+    for row, found in zip(datasets, papers):
+        assert [term for term, flag in zip(VOCABULARIES['datasets'], row) if flag] == \
+            [term for term in VOCABULARIES['datasets'] if term in found['datasets']]
+
+
+def test_pair_counts_match_counting_pairs(papers, incidence):
+    within = Counter()
+    across = Counter()
+    for found in papers:
+        themes = [term for term in VOCABULARIES['themes'] if term in found['themes']]
+        within.update(combinations(themes, 2))
+        across.update((theme, dataset) for theme in found['themes'] for dataset in found['datasets'])
+    assert dict(incidence.pair_counts('themes')) == dict(within)
+    assert dict(incidence.pair_counts('themes', 'datasets')) == dict(across)
+    # Listed in keyword-list order, not discovery order
+    assert [pair for pair, _ in incidence.pair_counts('themes')] == sorted(within, key=lambda pair: (
+        VOCABULARIES['themes'].index(pair[0]), VOCABULARIES['themes'].index(pair[1])))
+
+
+def test_cooccurrence_diagonal_and_triples(papers, incidence):
+    themes = incidence.cooccurrence('themes')
+    assert (themes == themes.T).all()
+    assert list(np.diag(themes)) == [sum(term in found['themes'] for found in papers) for term in VOCABULARIES['themes']]
+
+    triples = incidence.cooccurrence3('themes', 'datasets', 'regions')
+    for i, theme in enumerate(VOCABULARIES['themes']):
+        for j, dataset in enumerate(VOCABULARIES['datasets']):
+            for k, region in enumerate(VOCABULARIES['regions']):
+                assert triples[i, j, k] == sum(theme in found['themes'] and dataset in found['datasets']
+                                               and region in found['regions'] for found in papers)
+
+
+def test_sparse_form_and_saved_tables(incidence, tmp_path):
+    rows, columns, counts = incidence.to_sparse('themes', 'regions')
+    dense = np.zeros((5, 2), dtype=counts.dtype)
+    dense[rows, columns] = counts
+    assert (dense == incidence.cooccurrence('themes', 'regions')).all()
+    assert (counts > 0).all()
+
+    path = tmp_path / 'cooccurrence.npz'
+    incidence.save(path, {'theme_pairs': ('themes',), 'theme_dataset_region': ('themes', 'datasets', 'regions')})
+    with np.load(path) as saved:
+        assert list(saved['datasets_terms']) == VOCABULARIES['datasets']
+        assert (saved['theme_pairs'] == incidence.cooccurrence('themes')).all()
+        assert saved['theme_dataset_region'].shape == (5, 3, 2)
+
+
+def test_papers_added_after_a_query_are_counted():
+    incidence = TermIncidence(VOCABULARIES)
+    incidence.add_paper({'themes': ['fire', 'smoke']})
+    assert incidence.pair_counts('themes') == [(('fire', 'smoke'), 1)]
+    incidence.add_paper({'themes': ['smoke', 'fire'], 'regions': []})
+    assert incidence.pair_counts('themes') == [(('fire', 'smoke'), 2)]
+    assert incidence.cooccurrence('regions').sum() == 0
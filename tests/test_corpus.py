@@ -0,0 +1,116 @@
+import os
+import time
+import pytest
+from corpus import Supervision, map_papers
+from pdf_text import FALLBACK_EXTRACTOR, active_extractor
+
+
+def analyze(pdf_path):
+    """Misbehaves according to the file name, unless the fallback extractor is in use."""
+    name = os.path.basename(pdf_path)
+    if active_extractor() != FALLBACK_EXTRACTOR or name.startswith('always'):
+        if 'slow' in name:
+            time.sleep(30)
+        elif 'hog' in name:
+            bytearray(8 * 1024 ** 3)
+        elif 'crash' in name:
+            os._exit(3)
+        elif 'broken' in name:
+            raise ValueError('Unexpected EOF')
+    return {'file': name, 'extractor': active_extractor()}
+
+
+def address_space_mb():
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) // 1024 for line in f if line.startswith('VmSize:'))
+
+
+@pytest.fixture
+def supervision():
+    # Leave room for the forked worker's inherited address space, but not for the hog's 8 GB
+    memory_mb = address_space_mb() + 512 if os.path.exists('/proc/self/status') else None
+    return Supervision(timeout=2, memory_mb=memory_mb)
+
+
+def outcomes(supervision):
+    return {(failure['file'], failure['failure'], failure['outcome']) for failure in supervision.failures}
+
+
+def test_failed_papers_are_retried_with_the_fallback(supervision):
+    paths = ['a.pdf', 'broken.pdf', 'slow.pdf', 'crash.pdf', 'b.pdf']
+    results = list(map_papers(analyze, paths, workers=2, supervision=supervision))
+    assert [result['file'] for result in results] == ['a.pdf', 'broken.pdf', 'slow.pdf', 'crash.pdf', 'b.pdf']
+    assert [result['extractor'] for result in results] == \
+        [active_extractor(), FALLBACK_EXTRACTOR, FALLBACK_EXTRACTOR, FALLBACK_EXTRACTOR, active_extractor()]
+    assert outcomes(supervision) == {('broken.pdf', 'error', 'recovered'), ('slow.pdf', 'timeout', 'recovered'),
+                                     ('crash.pdf', 'crashed', 'recovered')}
+    assert supervision.failed_files() == []
+    error = next(failure for failure in supervision.failures if failure['file'] == 'broken.pdf')
+    assert error['error'] == 'ValueError: Unexpected EOF' and error['extractor'] == active_extractor()
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/status'), reason="needs /proc to size the memory cap")
+def test_memory_cap_stops_a_paper_without_stopping_the_run(supervision):
+    results = list(map_papers(analyze, ['hog.pdf', 'a.pdf', 'always-hog.pdf'], supervision=supervision))
+    assert [(result['file'], result['extractor']) for result in results] == \
+        [('hog.pdf', FALLBACK_EXTRACTOR), ('a.pdf', active_extractor())]
+    assert outcomes(supervision) == {('hog.pdf', 'memory', 'recovered'), ('always-hog.pdf', 'memory', 'failed')}
+    assert supervision.failed_files() == ['always-hog.pdf']
+
+
+def test_papers_failing_with_the_fallback_are_left_out(supervision):
+    results = list(map_papers(analyze, ['always-broken.pdf', 'a.pdf', 'always-crash.pdf'], supervision=supervision))
+    assert [result['file'] for result in results] == ['a.pdf']
+    assert outcomes(supervision) == {('always-broken.pdf', 'error', 'failed'), ('always-crash.pdf', 'crashed', 'failed')}
+    # Each paper failed once with the active extractor and once with the fallback
+    assert sorted(failure['extractor'] for failure in supervision.failures) == \
+        sorted([active_extractor(), FALLBACK_EXTRACTOR] * 2)
+    assert supervision.failed_files() == ['always-broken.pdf', 'always-crash.pdf']
+
+
+def test_without_fallback_failures_are_final():
+    supervision = Supervision(timeout=2, fallback=False)
+    results = list(map_papers(analyze, ['broken.pdf', 'a.pdf'], supervision=supervision))
+    assert [result['file'] for result in results] == ['a.pdf']
+    assert outcomes(supervision) == {('broken.pdf', 'error', 'failed')}
+
+
+def analyze_logged(pdf_path):
+    """Records when each paper starts and finishes in $ANALYZE_LOG; papers named 'slow' take a while."""
+    with open(os.environ['ANALYZE_LOG'], 'a') as log:
+        log.write(f"start {os.path.basename(pdf_path)}\n")
+    time.sleep(0.5 if 'slow' in pdf_path else 0.01 * (sum(map(ord, pdf_path)) % 3))
+    with open(os.environ['ANALYZE_LOG'], 'a') as log:
+        log.write(f"end {os.path.basename(pdf_path)}\n")
+    return os.path.basename(pdf_path)
+
+
+@pytest.fixture
+def analyze_log(tmp_path, monkeypatch):
+    path = tmp_path / 'analyzed.log'
+    path.touch()
+    monkeypatch.setenv('ANALYZE_LOG', str(path))
+    return path
+
+
+def test_results_come_back_in_input_order(tmp_path, analyze_log):
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"paper_{i:02d}.pdf"
+        path.write_bytes(b'%PDF' * (i + 1))
+        paths.append(str(path))
+    # A paper the read-ahead threads can't open doesn't hold up the others
+    paths.append(str(tmp_path / 'missing.pdf'))
+    assert list(map_papers(analyze_logged, paths, workers=3)) == [os.path.basename(path) for path in paths]
+
+
+def test_workers_stay_within_the_prefetch_window(tmp_path, analyze_log):
+    paths = [str(tmp_path / 'slow_00.pdf')] + [str(tmp_path / f"paper_{i:02d}.pdf") for i in range(1, 12)]
+    results = list(map_papers(analyze_logged, paths, workers=2, prefetch=4))
+    assert results == [os.path.basename(path) for path in paths]
+
+    # While the first paper is still running, no paper past the window of four is started
+    events = analyze_log.read_text().split('\n')
+    before = events[:events.index('end slow_00.pdf')]
+    started = sorted(event.split()[1] for event in before if event.startswith('start'))
+    assert started[-1] == 'slow_00.pdf' and started[:-1] == ['paper_01.pdf', 'paper_02.pdf', 'paper_03.pdf']
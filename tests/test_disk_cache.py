@@ -0,0 +1,58 @@
+import itertools
+import pytest
+import disk_cache
+from disk_cache import DiskCache
+
+
+class NotesCache(DiskCache):
+    table = 'notes'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Makes every timestamp the cache takes one second later than the last, so recency is unambiguous."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(disk_cache.time, 'time', lambda: float(next(ticks)))
+
+
+def entry_size(value):
+    cache = DiskCache(':memory:', 10 ** 9)
+    cache.put('key', value, 'v1')
+    return cache.total_size()
+
+
+def test_round_trip_and_versions(tmp_path):
+    cache = NotesCache(str(tmp_path / 'cache' / 'notes.sqlite'), 10 ** 6)
+    assert cache.get('sha', 'v1') is None
+    cache.put('sha', {'pages': ['one', 'two']}, 'v1')
+    cache.put('sha', ['other'], 'v2')
+    assert cache.get('sha', 'v1') == {'pages': ['one', 'two']}
+    assert cache.get('sha', 'v2') == ['other']
+    assert (cache.hits, cache.misses) == (2, 1)
+    cache.close()
+
+    reopened = NotesCache(str(tmp_path / 'cache' / 'notes.sqlite'), 10 ** 6)
+    assert reopened.get('sha', 'v1') == {'pages': ['one', 'two']}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    size = entry_size('x' * 100)
+    cache = DiskCache(str(tmp_path / 'cache.sqlite'), 3 * size)
+    for key in 'abc':
+        cache.put(key, 'x' * 100, 'v1')
+    assert cache.total_size() == 3 * size
+
+    # Reading 'a' makes 'b' the least recently used
+    cache.get('a', 'v1')
+    cache.put('d', 'x' * 100, 'v1')
+    assert [key for key in 'abcd' if cache.get(key, 'v1') is not None] == ['a', 'c', 'd']
+    assert cache.total_size() <= 3 * size
+
+
+def test_oversized_entry_evicts_everything_older(tmp_path, clock):
+    size = entry_size('x' * 100)
+    cache = DiskCache(str(tmp_path / 'cache.sqlite'), 2 * size)
+    cache.put('a', 'x' * 100, 'v1')
+    cache.put('b', 'x' * 100, 'v1')
+    cache.put('big', ''.join(chr(33 + (i * 7919) % 90) for i in range(5000)), 'v1')
+    assert cache.get('a', 'v1') is None and cache.get('b', 'v1') is None
@@ -0,0 +1,145 @@
+import os
+import random
+import pytest
+import duplicates
+from duplicates import MinHashIndex, find_duplicates, find_doi, minhash, normalize_doi, similarity
+
+WORDS = ['fire', 'sensor', 'network', 'model', 'data', 'forest', 'detection', 'the', 'of', 'a', 'in', 'global',
+         'weather', 'index', 'risk', 'spread', 'node', 'energy', 'drone', 'camera']
+
+
+def random_words(rng, count):
+    return [rng.choice(WORDS) for _ in range(count)]
+
+
+def texts():
+    rng = random.Random(5)
+    original = random_words(rng, 600)
+    return {
+        'original': ' '.join(original),
+        'reformatted': ' '.join(original).upper().replace(' the ', '\nthe\n'),
+        # A revised version: two thirds of the text kept
+        'revised': ' '.join(original[:400] + random_words(rng, 200)),
+        **{name: ' '.join(random_words(rng, 600)) for name in ('unrelated', 'other', 'third', 'fourth', 'fifth')},
+    }
+
+
+def test_find_doi():
+    assert find_doi(['Title\nhttps://doi.org/10.1016/J.Envsoft.2020.104.', 'x']) == '10.1016/j.envsoft.2020.104'
+    assert find_doi(['no identifier', 'see (doi:10.1109/JSEN.2021.3050281).']) == '10.1109/jsen.2021.3050281'
+    assert find_doi(['none', 'here', 'DOI 10.1000/too-late']) is None
+    assert normalize_doi(' DOI: 10.1000/ABC ') == '10.1000/abc'
+
+
+def test_minhash_similarity_estimates_shingle_overlap():
+    paper = texts()
+    assert similarity(minhash(paper['original']), minhash(paper['reformatted'])) == 1.0
+    assert 0.35 < similarity(minhash(paper['original']), minhash(paper['revised'])) < 0.75
+    assert similarity(minhash(paper['original']), minhash(paper['unrelated'])) < 0.1
+    assert minhash('') is None
+
+
+def test_minhash_index_finds_similar_papers():
+    paper = texts()
+    index = MinHashIndex()
+    for name in ('original', 'unrelated', 'other'):
+        index.add(name, minhash(paper[name]))
+    assert [name for name, _ in index.query(minhash(paper['reformatted']))] == ['original']
+    assert [name for name, _ in index.query(minhash(paper['revised']), threshold=0.3)] == ['original']
+    assert index.query(minhash(paper['revised'])) == []
+
+
+PAPERS = {
+    # filename: (text, DOI, PDF title)
+    'a.pdf': ('original', None, None),
+    'a_copy.pdf': ('reformatted', None, None),
+    'b.pdf': ('revised', '10.1000/revised', None),
+    'c.pdf': ('unrelated', '10.1000/cited', None),
+    'd.pdf': ('other', '10.1000/cited', 'Untitled'),
+    'e.pdf': ('third', None, 'A Survey of Wildfire Sensor Networks'),
+    'f.pdf': ('fourth', None, 'A survey of wildfire sensor networks.'),
+}
+
+
+def fake_signature(pdf_path, cache=None):
+    """Stands in for paper_signature, describing each fixture file from PAPERS instead of parsing it."""
+    name, doi, title = PAPERS[os.path.basename(pdf_path)]
+    text = texts()[name]
+    with open(pdf_path, 'rb') as f:
+        sha256 = f.read().decode()
+    return {'path': pdf_path, 'sha256': sha256, 'signature': minhash(text).tolist(), 'words': len(text.split()),
+            'doi': doi, 'title': title, 'first_page': ''}
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(duplicates, 'paper_signature', fake_signature)
+    paths = []
+    for filename in PAPERS:
+        path = tmp_path / filename
+        path.write_text(filename)
+        paths.append(str(path))
+    return paths
+
+
+def names(groups):
+    return {os.path.basename(canonical): [os.path.basename(path) for path in paths]
+            for canonical, paths in groups.items()}
+
+
+def test_find_duplicates(corpus, tmp_path, monkeypatch):
+    # An identical file, with a text of its own so only its hash can give it away
+    (tmp_path / 'a_twin.pdf').write_text('a.pdf')
+    monkeypatch.setitem(PAPERS, 'a_twin.pdf', ('fifth', None, None))
+    groups = names(find_duplicates(corpus + [str(tmp_path / 'a_twin.pdf')]))
+    # Near-identical text and identical files
+    assert groups == {'a.pdf': ['a_copy.pdf', 'a_twin.pdf']}
+
+
+def test_shared_doi_needs_similar_text(corpus, tmp_path, monkeypatch):
+    # c.pdf and d.pdf print the DOI of a paper they both cite; their texts are unrelated
+    groups = names(find_duplicates(corpus))
+    assert 'c.pdf' not in groups and 'd.pdf' not in groups
+
+    # A revised version with the same DOI is a copy, though its text is below the threshold
+    (tmp_path / 'b_preprint.pdf').write_text('b_preprint.pdf')
+    monkeypatch.setitem(PAPERS, 'b_preprint.pdf', ('original', '10.1000/revised', None))
+    groups = names(find_duplicates(corpus + [str(tmp_path / 'b_preprint.pdf')]))
+    # The copy with a DOI, then the most text, is canonical
+    assert groups == {'b.pdf': ['a.pdf', 'a_copy.pdf', 'b_preprint.pdf']}
+
+
+def add_papers(tmp_path, monkeypatch, papers):
+    monkeypatch.setattr(duplicates, 'paper_signature', fake_signature)
+    paths = []
+    for filename, paper in papers.items():
+        monkeypatch.setitem(PAPERS, filename, paper)
+        (tmp_path / filename).write_text(filename)
+        paths.append(str(tmp_path / filename))
+    return paths
+
+
+def test_shared_title_needs_similar_text(tmp_path, monkeypatch):
+    paths = add_papers(tmp_path, monkeypatch, {
+        # Unrelated papers under one title
+        'e.pdf': ('third', None, 'A Survey of Wildfire Sensor Networks'),
+        'f.pdf': ('fourth', None, 'A survey of wildfire sensor networks.'),
+        # A revised version under the original's title, though its text is below the threshold
+        'g.pdf': ('original', None, 'Forest Fire Risk from Drone Cameras'),
+        'h.pdf': ('revised', None, 'Forest fire risk from drone cameras'),
+    })
+    assert names(find_duplicates(paths)) == {'g.pdf': ['h.pdf']}
+
+
+def test_shared_metadata_row_needs_similar_text(tmp_path, monkeypatch):
+    paths = add_papers(tmp_path, monkeypatch, {
+        'e.pdf': ('third', None, None),
+        'f.pdf': ('fourth', None, None),
+        'g.pdf': ('original', None, None),
+        'h.pdf': ('revised', None, None),
+    })
+    rows = {'e.pdf': 0, 'f.pdf': 0, 'g.pdf': 1, 'h.pdf': 1}
+    monkeypatch.setattr(duplicates, '_metadata_rows',
+                        lambda papers, pattern: [rows[os.path.basename(paper['path'])] for paper in papers])
+    assert names(find_duplicates(paths)) == {}
+    assert names(find_duplicates(paths, metadata_pattern='exports/*.csv')) == {'g.pdf': ['h.pdf']}
@@ -0,0 +1,97 @@
+import json
+import shutil
+import pytest
+import keyword_index
+from keyword_index import KeywordFileError, KeywordIndex, KeywordIndexCache, get_keyword_index, KEYWORDS_PATH
+
+
+@pytest.fixture
+def keywords_file(tmp_path):
+    path = tmp_path / 'keywords.json'
+    shutil.copy(KEYWORDS_PATH, path)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = KeywordIndexCache(str(tmp_path / 'keyword_index.sqlite'))
+    monkeypatch.setattr(keyword_index, 'get_index_cache', lambda: cache)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def watched(monkeypatch, cache):
+    """Starts get_keyword_index afresh, checking the file on every call."""
+    monkeypatch.setattr(keyword_index, '_indexes', {})
+    monkeypatch.setattr(keyword_index, '_checked', {})
+    monkeypatch.setattr(keyword_index, 'RELOAD_INTERVAL', 0.0)
+
+
+def edit(path, **sections):
+    keyword_data = json.loads(path.read_text())
+    keyword_data.update(sections)
+    path.write_text(json.dumps(keyword_data))
+
+
+@pytest.mark.parametrize('sections, message', [
+    ({'themes': ['fire', 'fire']}, 'non-unique'),
+    ({'regions': ['Canada', '  ']}, 'does not match'),
+    ({'dataset_variations': ['data(set']}, 'is not a'),
+    ({'problems': 'scalability'}, 'is not of type'),
+])
+def test_invalid_files_are_rejected(keywords_file, cache, sections, message):
+    edit(keywords_file, **sections)
+    with pytest.raises(KeywordFileError, match=message):
+        KeywordIndex(str(keywords_file), cache)
+
+
+def test_missing_section_is_rejected(keywords_file, cache):
+    keyword_data = json.loads(keywords_file.read_text())
+    del keyword_data['sensor_categories']
+    keywords_file.write_text(json.dumps(keyword_data))
+    with pytest.raises(KeywordFileError, match='sensor_categories'):
+        KeywordIndex(str(keywords_file), cache)
+
+
+def test_compiled_matchers_are_cached(keywords_file, cache, monkeypatch):
+    index = KeywordIndex(str(keywords_file), cache)
+    text = 'Wildfire detection with satellite imagery in California'
+    expected = index.matcher(['themes', 'regions']).find(text)
+
+    # Another process with the same file takes the compiled matcher from the cache
+    def compile_again(self, categories):
+        raise AssertionError("the matcher was compiled again")
+    monkeypatch.setattr(keyword_index.KeywordMatcher, '__init__', compile_again)
+    other = KeywordIndex(str(keywords_file), cache)
+    assert other.matcher(['themes', 'regions']).find(text) == expected
+
+
+def test_edits_are_picked_up(keywords_file, watched):
+    index = get_keyword_index(str(keywords_file))
+    assert get_keyword_index(str(keywords_file)) is index
+
+    edit(keywords_file, themes=['sensor placement'])
+    reloaded = get_keyword_index(str(keywords_file))
+    assert reloaded.sha256 != index.sha256
+    assert reloaded.sections(['themes']) == {'themes': ['sensor placement']}
+    # An index already handed out keeps the keywords it was loaded with
+    assert index.sections(['themes']) != reloaded.sections(['themes'])
+
+
+def test_broken_edit_keeps_the_previous_keywords(keywords_file, watched, capsys):
+    index = get_keyword_index(str(keywords_file))
+    edit(keywords_file, themes=['fire', 'fire'])
+    assert get_keyword_index(str(keywords_file)) is index
+    assert get_keyword_index(str(keywords_file)) is index
+    assert capsys.readouterr().out.count('Keeping the previous keywords') == 1
+
+    edit(keywords_file, themes=['fire'])
+    assert get_keyword_index(str(keywords_file)).sections(['themes']) == {'themes': ['fire']}
+
+
+def test_checks_are_throttled(keywords_file, watched, monkeypatch):
+    monkeypatch.setattr(keyword_index, 'RELOAD_INTERVAL', 3600.0)
+    index = get_keyword_index(str(keywords_file))
+    edit(keywords_file, themes=['sensor placement'])
+    assert get_keyword_index(str(keywords_file)) is index
@@ -0,0 +1,145 @@
+import re
+import random
+import pytest
+from keyword_matcher import KeywordMatcher, PatternStream, load_keywords
+
+# Keywords whose edges are not word characters, that are prefixes or suffixes of one another,
+# or that repeat across categories, where a single-pass matcher is most likely to disagree
+TRICKY = {
+    'edges': ['C++', 'k-means', 'U.S.', '(PDE)', '-based', 'IoT', '3D', 'CO2', 'a.i'],
+    'nested': ['fire', 'fire weather', 'fire weather index', 'weather index', 'weather', 'index', 'wild fire'],
+    'repeated': ['Fire', 'remote sensing', 'sensing', 'k-means', 'aa', 'aa aa'],
+}
+
+FILLER = ['the', 'of', 'a', 'model', 'firewall', 'sensingly', 'c', 'us', 'k', 'means', 'mean', '2', '3', 'd']
+SEPARATORS = [' ', ' ', ' ', '', '\n', '-', '.', ',', '(', ')', '+', '_', '/']
+
+
+def baseline(categories, text):
+    """The per-keyword search the scripts used before KeywordMatcher."""
+    return {name: [keyword for keyword in keywords
+                   if re.search(r'\b' + re.escape(keyword) + r'\b', text, re.IGNORECASE)]
+            for name, keywords in categories.items()}
+
+
+def random_text(rng, keywords, words=60):
+    pieces = []
+    for _ in range(words):
+        word = rng.choice(keywords) if rng.random() < 0.3 else rng.choice(FILLER)
+        word = word.upper() if rng.random() < 0.1 else word.title() if rng.random() < 0.1 else word
+        pieces.append(word + rng.choice(SEPARATORS))
+    return ''.join(pieces)
+
+
+def random_chunks(rng, text):
+    cuts = sorted(rng.sample(range(len(text) + 1), min(len(text) + 1, rng.randint(0, 8))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.fixture(scope='module')
+def keyword_categories():
+    keyword_data = load_keywords()
+    categories = {name: keyword_data[name] for name in ('themes', 'datasets', 'regions', 'pde_categories')}
+    return {**categories, **TRICKY}
+
+
+@pytest.fixture(scope='module')
+def matcher(keyword_categories):
+    return KeywordMatcher(keyword_categories)
+
+
+def test_find_matches_per_keyword_search(keyword_categories, matcher):
+    rng = random.Random(1)
+    keywords = [keyword for keywords in keyword_categories.values() for keyword in keywords]
+    for _ in range(400):
+        text = random_text(rng, keywords)
+        assert matcher.find(text) == baseline(keyword_categories, text), text
+
+
+@pytest.mark.parametrize('text', [
+    '', 'fire', 'FIRE', 'fire-weather index', 'wildfire', 'fire_weather', 'C++ and c+', 'uses k-means.',
+    'the U.S. and U.S', '(PDE) models', 'a sensor-based net', 'aa aa aa', 'aaa', 'IoTs', '3D', 'co2.',
+    'fire weather indexes', 'weather index', 'remote sensing', 'Remote\nSensing',
+])
+def test_find_edge_cases(keyword_categories, matcher, text):
+    assert matcher.find(text) == baseline(keyword_categories, text)
+
+
+def test_stream_matches_whole_text_across_chunk_boundaries(keyword_categories, matcher):
+    rng = random.Random(2)
+    keywords = [keyword for keywords in keyword_categories.values() for keyword in keywords]
+    for _ in range(400):
+        text = random_text(rng, keywords)
+        chunks = random_chunks(rng, text)
+        assert matcher.find_in_stream(chunks) == baseline(keyword_categories, text), chunks
+
+
+def test_stream_with_keywords_split_at_every_position(keyword_categories, matcher):
+    for text in ['see fire weather index.', 'C++', '(PDE)', 'x k-means y', 'remote sensing']:
+        for cut in range(len(text) + 1):
+            assert matcher.find_in_stream([text[:cut], text[cut:]]) == baseline(keyword_categories, text), (text, cut)
+
+
+def test_stream_with_one_character_chunks(keyword_categories, matcher):
+    text = 'Fire weather index (PDE) on the U.S. C++ k-means firewall remote sensing aa aa'
+    assert matcher.find_in_stream(text) == baseline(keyword_categories, text)
+
+
+def test_locate_finds_every_occurrence(keyword_categories, matcher):
+    rng = random.Random(3)
+    keywords = [keyword for keywords in keyword_categories.values() for keyword in keywords]
+    for _ in range(200):
+        text = random_text(rng, keywords, words=30)
+        expected = sorted((name, keyword, match.start(1), match.end(1))
+                          for name, keywords in keyword_categories.items() for keyword in keywords
+                          for match in re.finditer(r'(?=\b(' + re.escape(keyword) + r')\b)', text, re.IGNORECASE))
+        assert sorted(matcher.locate(text)) == expected, text
+
+
+def test_locate_offsets_index_the_original_text(matcher):
+    # Lowercasing 'İ' gives two characters, which must not shift the offsets after it
+    text = 'İİ İzmir: fire weather index and remote sensing, İ k-means'
+    located = {(keyword, text[start:end]) for _, keyword, start, end in matcher.locate(text)}
+    assert {('fire weather index', 'fire weather index'), ('remote sensing', 'remote sensing'), ('k-means', 'k-means')} <= located
+    assert all(keyword.lower() == span.lower() for keyword, span in located)
+
+
+def test_locate_pages_matches_the_joined_text(keyword_categories, matcher):
+    rng = random.Random(5)
+    keywords = [keyword for keywords in keyword_categories.values() for keyword in keywords]
+    for _ in range(200):
+        text = random_text(rng, keywords, words=30)
+        pages = random_chunks(rng, text)
+        page_starts = [sum(len(page_text) for page_text in pages[:number]) for number in range(len(pages))]
+        located = matcher.locate_pages(pages)
+        # Each occurrence starts on the page it is numbered with, and may end on a later one
+        assert all(0 <= start < len(pages[page - 1]) for _, _, page, start, _ in located), pages
+        assert sorted((name, keyword, page_starts[page - 1] + start, page_starts[page - 1] + end)
+                      for name, keyword, page, start, end in located) == sorted(matcher.locate(text)), pages
+
+
+def test_compiled_round_trip(keyword_categories, matcher):
+    rebuilt = KeywordMatcher.from_compiled(matcher.compiled())
+    text = 'The fire weather index of the U.S. with k-means and remote sensing'
+    assert rebuilt.find(text) == matcher.find(text)
+    assert rebuilt.locate(text) == matcher.locate(text)
+
+
+def test_empty_matcher():
+    matcher = KeywordMatcher({'themes': []})
+    assert matcher.find('anything') == {'themes': []}
+    assert matcher.find_in_stream(['any', 'thing']) == {'themes': []}
+    assert matcher.locate('anything') == []
+
+
+@pytest.mark.parametrize('pattern', [r'data ?sets?', r'\bdatasets?\b', r'(?<=\s)set\b', r'\d+', r'x*'])
+def test_pattern_stream_matches_finditer(pattern):
+    compiled = re.compile(pattern, re.IGNORECASE)
+    rng = random.Random(4)
+    for _ in range(200):
+        text = random_text(rng, ['data set', 'datasets', 'Data Sets', 'dataset', '42', 'set'], words=40)
+        expected = [(match.group(), text[match.end():match.end() + 50]) for match in compiled.finditer(text)]
+        stream = PatternStream(compiled, context=50, window=60)
+        for chunk in random_chunks(rng, text):
+            stream.feed(chunk)
+        assert stream.close() == expected, text
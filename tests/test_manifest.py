@@ -0,0 +1,193 @@
+import os
+import json
+import pytest
+from corpus import map_papers
+from manifest import Manifest, keyword_sections_hash, remove_manifest
+
+
+@pytest.fixture
+def papers(tmp_path):
+    """Three small files standing in for PDFs; the manifest only looks at their size, mtime and contents."""
+    folder = tmp_path / 'papers'
+    folder.mkdir()
+    paths = []
+    for number in range(3):
+        path = folder / f'paper_{number}.pdf'
+        path.write_text(f'paper {number}')
+        paths.append(str(path))
+    return paths
+
+
+def analyze_logged(pdf_path):
+    """Stands in for an analysis, logging each call so a test can see which papers were analyzed."""
+    with open(os.environ['ANALYZE_LOG'], 'a') as f:
+        f.write(os.path.basename(pdf_path) + '\n')
+    with open(pdf_path) as f:
+        return {'file': os.path.basename(pdf_path), 'text': f.read()}
+
+
+def analyzed(log_path):
+    return log_path.read_text().split() if log_path.exists() else []
+
+
+def test_keyword_sections_hash():
+    keyword_data = {'themes': ['fire'], 'regions': ['Canada']}
+    assert keyword_sections_hash(keyword_data, ['themes']) == keyword_sections_hash({'themes': ['fire']}, ['themes'])
+    assert keyword_sections_hash(keyword_data, ['themes']) != keyword_sections_hash(keyword_data, ['regions'])
+    assert keyword_sections_hash(keyword_data, ['themes'], 1) != keyword_sections_hash(keyword_data, ['themes'], 2)
+
+
+def test_saved_manifest_round_trip(tmp_path, papers):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, 'hash')
+    manifest.record(papers[0], {'file': 'paper_0.pdf', 'themes': ['fire']})
+    manifest.save()
+    assert not os.path.exists(manifest.journal_path)
+
+    reloaded = Manifest(path, 'hash')
+    assert reloaded.lookup(papers[0]) == {'file': 'paper_0.pdf', 'themes': ['fire']}
+    assert reloaded.lookup(papers[1]) is None
+    assert Manifest(path, 'other hash').lookup(papers[0]) is None
+
+
+def test_changed_and_touched_papers(tmp_path, papers):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, 'hash')
+    for pdf_path in papers[:2]:
+        manifest.record(pdf_path, {'file': os.path.basename(pdf_path)})
+    manifest.save()
+
+    # Touched but unchanged: reused after comparing contents
+    stat = os.stat(papers[0])
+    os.utime(papers[0], (stat.st_atime, stat.st_mtime + 10))
+    # Same size, different contents: analyzed again
+    with open(papers[1], 'w') as f:
+        f.write('paper X')
+    os.utime(papers[1], (stat.st_atime, stat.st_mtime + 10))
+
+    reloaded = Manifest(path, 'hash')
+    assert reloaded.lookup(papers[0]) == {'file': 'paper_0.pdf'}
+    assert reloaded.lookup(papers[1]) is None
+
+
+def test_journal_replayed_without_save(tmp_path, papers):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, 'hash')
+    manifest.record(papers[0], {'file': 'paper_0.pdf'})
+    manifest.record(papers[1], {'file': 'paper_1.pdf'})
+    # The run dies here: no save(), only the journal is on disk
+    assert not os.path.exists(path)
+
+    resumed = Manifest(path, 'hash')
+    assert resumed.lookup(papers[0]) == {'file': 'paper_0.pdf'}
+    assert resumed.lookup(papers[1]) == {'file': 'paper_1.pdf'}
+    assert resumed.lookup(papers[2]) is None
+
+
+def test_journal_entries_override_saved_manifest(tmp_path, papers):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, 'hash')
+    manifest.record(papers[0], {'file': 'paper_0.pdf', 'run': 1})
+    manifest.save()
+    manifest = Manifest(path, 'hash')
+    manifest.record(papers[0], {'file': 'paper_0.pdf', 'run': 2})
+
+    assert Manifest(path, 'hash').lookup(papers[0]) == {'file': 'paper_0.pdf', 'run': 2}
+
+
+def test_torn_journal_line_is_skipped(tmp_path, papers):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, 'hash')
+    manifest.record(papers[0], {'file': 'paper_0.pdf'})
+    manifest.record(papers[1], {'file': 'paper_1.pdf'})
+    del manifest
+    # A crash part-way through writing the second record
+    with open(path + '.journal') as f:
+        lines = f.readlines()
+    with open(path + '.journal', 'w') as f:
+        f.write(lines[0] + lines[1][:len(lines[1]) // 2])
+
+    resumed = Manifest(path, 'hash')
+    assert resumed.lookup(papers[0]) == {'file': 'paper_0.pdf'}
+    assert resumed.lookup(papers[1]) is None
+
+    # The next record starts on a line of its own, so both survive another restart
+    resumed.record(papers[1], {'file': 'paper_1.pdf'})
+    resumed.record(papers[2], {'file': 'paper_2.pdf'})
+    with open(path + '.journal') as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)['path'] for line in lines if line.endswith('}')][-2:] == papers[1:]
+
+    again = Manifest(path, 'hash')
+    assert [again.lookup(pdf_path) for pdf_path in papers] == [{'file': f'paper_{number}.pdf'} for number in range(3)]
+
+
+def test_retain_forgets_removed_papers(tmp_path, papers):
+    manifest = Manifest(str(tmp_path / 'manifest.json'), 'hash')
+    for pdf_path in papers:
+        manifest.record(pdf_path, {})
+    assert manifest.retain(papers[:2]) == [papers[2]]
+    assert sorted(manifest.entries) == sorted(papers[:2])
+
+
+def test_remove_manifest(tmp_path, papers):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, 'hash')
+    manifest.record(papers[0], {})
+    manifest.save()
+    Manifest(path, 'hash').record(papers[1], {})
+    remove_manifest(path)
+    assert not os.path.exists(path) and not os.path.exists(path + '.journal')
+    remove_manifest(path)  # Nothing left to remove is fine
+
+
+def test_map_papers_only_analyzes_new_and_changed_papers(tmp_path, papers, monkeypatch):
+    log_path = tmp_path / 'analyzed.log'
+    monkeypatch.setenv('ANALYZE_LOG', str(log_path))
+    path = str(tmp_path / 'manifest.json')
+    expected = [{'file': f'paper_{number}.pdf', 'text': f'paper {number}'} for number in range(3)]
+
+    assert list(map_papers(analyze_logged, papers, manifest=Manifest(path, 'hash'))) == expected
+    assert analyzed(log_path) == ['paper_0.pdf', 'paper_1.pdf', 'paper_2.pdf']
+
+    # An unchanged corpus is answered from the manifest
+    log_path.unlink()
+    assert list(map_papers(analyze_logged, papers, manifest=Manifest(path, 'hash'))) == expected
+    assert analyzed(log_path) == []
+
+    # A changed paper is analyzed again, and a removed one is dropped from the results and the manifest
+    with open(papers[1], 'w') as f:
+        f.write('paper one, revised')
+    expected[1]['text'] = 'paper one, revised'
+    assert list(map_papers(analyze_logged, papers[:2], manifest=Manifest(path, 'hash'))) == expected[:2]
+    assert analyzed(log_path) == ['paper_1.pdf']
+    assert sorted(Manifest(path, 'hash').entries) == papers[:2]
+
+    # New keywords mean every paper is analyzed again
+    log_path.unlink()
+    assert list(map_papers(analyze_logged, papers[:2], manifest=Manifest(path, 'new hash'))) == expected[:2]
+    assert analyzed(log_path) == ['paper_0.pdf', 'paper_1.pdf']
+
+
+def test_map_papers_resumes_an_interrupted_run(tmp_path, papers, monkeypatch):
+    log_path = tmp_path / 'analyzed.log'
+    monkeypatch.setenv('ANALYZE_LOG', str(log_path))
+    path = str(tmp_path / 'checkpoint.json')
+    expected = [{'file': f'paper_{number}.pdf', 'text': f'paper {number}'} for number in range(3)]
+
+    # An interrupted run: the first paper was journaled before the process died
+    Manifest(path, 'hash').record(papers[0], expected[0])
+
+    results = list(map_papers(analyze_logged, papers, manifest=Manifest(path, 'hash')))
+    assert results == expected
+    assert analyzed(log_path) == ['paper_1.pdf', 'paper_2.pdf']
+    assert not os.path.exists(path + '.journal')
+
+    # A finished run reuses everything
+    log_path.unlink()
+    assert list(map_papers(analyze_logged, papers, manifest=Manifest(path, 'hash'))) == expected
+    assert analyzed(log_path) == []
+
+    # New keywords mean every paper is analyzed again
+    assert list(map_papers(analyze_logged, papers, manifest=Manifest(path, 'new hash'))) == expected
+    assert analyzed(log_path) == ['paper_0.pdf', 'paper_1.pdf', 'paper_2.pdf']
@@ -0,0 +1,167 @@
+import pytest
+import pdf_text
+from pdf_text import (TextCache, extract_text_from_pdf, iter_parsed_pages, plain_text_problem, stream_text_from_pdf,
+                      use_extractor)
+
+PAGE_TEXTS = ['Wildfire detection with sensor networks', 'Fire weather index forecasts', 'Remote sensing of burned area']
+
+
+@pytest.fixture(scope='module')
+def sample_pdf(tmp_path_factory):
+    """A three-page PDF with one line of text per page."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    path = tmp_path_factory.mktemp('pdfs') / 'sample.pdf'
+    with plt.rc_context({'pdf.fonttype': 42}), PdfPages(path) as pdf:
+        for page_text in PAGE_TEXTS:
+            figure = plt.figure(figsize=(8.5, 11))
+            figure.text(0.1, 0.9, page_text)
+            pdf.savefig(figure)
+            plt.close(figure)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TextCache(str(tmp_path / 'pdf_text.sqlite'), 10 ** 8)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def fake_extractor(tmp_path, monkeypatch):
+    """Registers a 'fake' extractor whose pages come from a list, recording how many were parsed."""
+    parsed = []
+
+    def parse(pdf_path):
+        for page_text in FAKE_PAGES[pdf_path.rsplit('/', 1)[-1]]:
+            if isinstance(page_text, Exception):
+                raise page_text
+            parsed.append(page_text)
+            yield page_text
+
+    monkeypatch.setitem(pdf_text.extractors, 'fake', [('fake', parse, 'fake/1', None)])
+    with use_extractor('fake'):
+        yield parsed
+
+
+FAKE_PAGES = {
+    'good.pdf': ['first page', 'second page', 'third page'],
+    'truncated.pdf': ['first page', 'second page', ValueError('Unexpected EOF')],
+}
+
+
+def fake_pdf(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+    return str(path)
+
+
+def test_pages_are_parsed_one_at_a_time(sample_pdf):
+    pages = list(iter_parsed_pages(sample_pdf))
+    assert len(pages) == 3
+    assert [' '.join(page_text.split()) for page_text in pages] == PAGE_TEXTS
+
+
+def test_stream_is_cached_and_replayed(sample_pdf, cache):
+    with use_extractor('pdfplumber'):
+        pages = list(stream_text_from_pdf(sample_pdf, cache))
+        assert (cache.hits, cache.misses) == (0, 1)
+        assert list(stream_text_from_pdf(sample_pdf, cache)) == pages
+        assert cache.hits == 1
+        assert extract_text_from_pdf(sample_pdf, cache) == ''.join(pages)
+
+
+def test_stream_does_not_parse_ahead(tmp_path, cache, fake_extractor):
+    stream = stream_text_from_pdf(fake_pdf(tmp_path, 'good.pdf'), cache)
+    assert next(stream) == 'first page'
+    assert fake_extractor == ['first page']
+    assert list(stream) == ['second page', 'third page']
+
+
+def test_only_complete_documents_are_cached(tmp_path, cache, fake_extractor):
+    path = fake_pdf(tmp_path, 'truncated.pdf')
+    stream = stream_text_from_pdf(path, cache)
+    assert [next(stream), next(stream)] == ['first page', 'second page']
+    # Errors are raised, not turned into empty text, so the supervisor can retry the paper
+    with pytest.raises(ValueError):
+        next(stream)
+    assert cache.get(pdf_text.file_sha256(path), 'fake/1') is None
+
+    path = fake_pdf(tmp_path, 'good.pdf')
+    assert extract_text_from_pdf(path, cache) == 'first pagesecond pagethird page'
+    assert cache.get(pdf_text.file_sha256(path), 'fake/1') == FAKE_PAGES['good.pdf']
+
+
+PROSE = 'Sensor networks detect wildfires early by measuring temperature and smoke in remote forests.'
+
+
+@pytest.mark.parametrize('pages, problem', [
+    ([PROSE, PROSE], None),
+    ([PROSE, ''], None),
+    (['', ' \n '], 'empty'),
+    ([PROSE[:30]], 'empty'),
+    ([PROSE + ' (cid:12)(cid:40)(cid:7)'], 'garbled'),
+    (['3.14 2.71 1.41 1.73 0.57 2.23 1.61 4.66 0.69 1.09 2.30 1.38'], 'garbled'),
+    ([PROSE.replace(' ', '')], 'run-together'),
+])
+def test_plain_text_problem(pages, problem):
+    assert plain_text_problem(pages) == problem
+
+
+@pytest.fixture
+def two_backends(monkeypatch):
+    """Registers a 'two-step' extractor whose fast backend's text is checked, recording which backends parsed what."""
+    parsed = []
+
+    def backend(name):
+        def parse(pdf_path):
+            parsed.append((name, pdf_path.rsplit('/', 1)[-1]))
+            for page_text in TWO_STEP_PAGES[pdf_path.rsplit('/', 1)[-1]][name]:
+                if isinstance(page_text, Exception):
+                    raise page_text
+                yield page_text
+        return parse
+
+    monkeypatch.setitem(pdf_text.extractors, 'two-step', [('fast', backend('fast'), 'fast/1', plain_text_problem),
+                                                          ('slow', backend('slow'), 'slow/1', None)])
+    with use_extractor('two-step'):
+        yield parsed
+
+
+TWO_STEP_PAGES = {
+    'sound.pdf': {'fast': [PROSE, PROSE], 'slow': ['slow page', 'slow page']},
+    'scanned.pdf': {'fast': ['', ''], 'slow': ['ocr page', 'ocr page']},
+    'unreadable.pdf': {'fast': [PROSE, ValueError('bad xref')], 'slow': ['slow page']},
+}
+
+
+def test_sound_fast_text_is_used(tmp_path, cache, two_backends):
+    path = fake_pdf(tmp_path, 'sound.pdf')
+    assert extract_text_from_pdf(path, cache) == PROSE * 2
+    assert two_backends == [('fast', 'sound.pdf')]
+    assert cache.get(pdf_text.file_sha256(path), 'fast/1') == [PROSE, PROSE]
+
+    assert extract_text_from_pdf(path, cache) == PROSE * 2
+    assert two_backends == [('fast', 'sound.pdf')]
+
+
+@pytest.mark.parametrize('name, text', [('scanned.pdf', 'ocr pageocr page'), ('unreadable.pdf', 'slow page')])
+def test_rejected_fast_text_falls_back_to_the_next_backend(tmp_path, cache, two_backends, name, text):
+    path = fake_pdf(tmp_path, name)
+    assert extract_text_from_pdf(path, cache) == text
+    assert two_backends == [('fast', name), ('slow', name)]
+    assert cache.get(pdf_text.file_sha256(path), 'fast/1') is None
+
+    # The next run takes the slow backend's cached text without trying the fast one again
+    assert extract_text_from_pdf(path, cache) == text
+    assert len(two_backends) == 2
+
+
+def test_papers_read_by_the_fallback_are_not_parsed_again(tmp_path, cache, two_backends):
+    path = fake_pdf(tmp_path, 'scanned.pdf')
+    cache.put(pdf_text.file_sha256(path), ['fallback page'], pdf_text.FALLBACK_VERSION)
+    assert extract_text_from_pdf(path, cache) == 'fallback page'
+    assert two_backends == []
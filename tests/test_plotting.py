@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import pytest
+from plotting import bar_chart, render_figures
+
+
+@pytest.fixture
+def charts(tmp_path):
+    return [bar_chart(str(tmp_path / f"chart_{i}.png"), ['PDE', 'SDE', 'Sensor'], [3, i, 5], f"Chart {i}",
+                      'Category', 'Papers', 'skyblue') for i in range(3)]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    return str(tmp_path / 'cache' / 'figures_manifest.json')
+
+
+def test_unchanged_figures_are_skipped(charts, manifest):
+    paths = [chart['path'] for chart in charts]
+    assert render_figures(charts, 1, manifest) == (paths, [])
+    assert render_figures(charts, 1, manifest) == ([], paths)
+    assert render_figures(charts, 1, manifest, force=True) == (paths, [])
+
+
+def test_changed_data_or_files_are_rendered_again(charts, manifest):
+    render_figures(charts, 1, manifest)
+    charts[0]['values'][0] = 4
+    os.remove(charts[1]['path'])
+    with open(charts[2]['path'], 'ab') as f:
+        f.write(b'edited')
+    rendered, skipped = render_figures(charts, 1, manifest)
+    assert (rendered, skipped) == ([chart['path'] for chart in charts], [])
+    assert render_figures(charts, 1, manifest) == ([], [chart['path'] for chart in charts])
+
+
+def test_worker_processes_draw_the_same_files(charts, manifest):
+    render_figures(charts, 1, manifest)
+    drawn_here = [open(chart['path'], 'rb').read() for chart in charts]
+    rendered, _ = render_figures(charts, 3, manifest, force=True)
+    assert rendered == [chart['path'] for chart in charts]
+    assert [open(chart['path'], 'rb').read() for chart in charts] == drawn_here
+
+
+def test_import_leaves_the_backend_alone():
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+    code = "import matplotlib; matplotlib.use('pdf'); import plotting; print(matplotlib.get_backend())"
+    output = subprocess.run([sys.executable, '-c', code], cwd=src, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'pdf'
@@ -0,0 +1,103 @@
+import pytest
+from result_store import ResultStore, OFFSETS_KEY, load_papers, load_matches
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(str(tmp_path / 'results' / 'analysis_results.sqlite'))
+    yield store
+    store.close()
+
+
+RESULTS = [
+    {'file': 'paper_0.pdf', 'themes': ['machine learning', 'drones'], 'focus': 'Detection', 'pages': 4,
+     'score': 0.5, 'custom_terms': {'problems': ['scalability']}, 'aliases': [],
+     OFFSETS_KEY: [['themes', 'machine learning', 1, 10, 26], ['themes', 'drones', 3, 0, 6]]},
+    {'file': 'paper_1.pdf', 'themes': [], 'focus': None, 'pages': 1, 'score': 1.25,
+     'custom_terms': {}, 'aliases': ['copy of paper_1.pdf'], OFFSETS_KEY: []},
+]
+
+FAILURES = [{'file': 'broken.pdf', 'extractor': 'pdfplumber', 'failure': 'error', 'error': 'PSEOF: Unexpected EOF',
+             'seconds': 0.1, 'outcome': 'failed'}]
+
+
+def test_results_round_trip(store):
+    run_id = store.start_run('themes', folder='/papers', keywords_hash='abc')
+    store.save_results(run_id, 'themes', RESULTS, FAILURES)
+
+    assert store.papers('themes', run_id) == [{key: value for key, value in result.items() if key != OFFSETS_KEY}
+                                              for result in RESULTS]
+    assert store.failures(run_id) == FAILURES
+    run = store.run(run_id)
+    assert (run['script'], run['folder'], run['keywords_hash'], run['papers'], run['failures']) == \
+        ('themes', '/papers', 'abc', 2, 1)
+    assert run['finished'] >= run['started']
+
+
+def test_offsets_go_to_matches(store):
+    run_id = store.start_run('themes')
+    store.save_results(run_id, 'themes', RESULTS)
+    rows = store.conn.execute(
+        "SELECT file, category, keyword, page, start, end FROM matches WHERE run_id = ? ORDER BY rowid", (run_id,)
+    ).fetchall()
+    assert rows == [('paper_0.pdf', 'themes', 'machine learning', 1, 10, 26), ('paper_0.pdf', 'themes', 'drones', 3, 0, 6)]
+    # The results passed in are left as they were
+    assert OFFSETS_KEY in RESULTS[0]
+
+
+def test_list_columns_are_json(store):
+    run_id = store.start_run('themes')
+    store.save_results(run_id, 'themes', RESULTS)
+    files = store.conn.execute(
+        "SELECT file FROM themes_papers, json_each(themes_papers.themes) WHERE run_id = ? AND json_each.value = ?",
+        (run_id, 'drones')
+    ).fetchall()
+    assert files == [('paper_0.pdf',)]
+
+
+def test_runs_are_kept_apart_and_columns_widen(store):
+    first = store.start_run('equations')
+    store.save_results(first, 'equations', [{'file': 'a.pdf', 'pde_subcategories': ['boundary conditions']}])
+    second = store.start_run('equations')
+    store.save_results(second, 'equations', [{'file': 'a.pdf', 'pde_subcategories': [], 'excerpts': ['u_t = u_xx']}])
+
+    assert store.latest_run('equations') == second
+    assert store.papers('equations') == [{'file': 'a.pdf', 'pde_subcategories': [], 'excerpts': ['u_t = u_xx']}]
+    # Rows stored before a field existed read back as None for it
+    assert store.papers('equations', first) == [{'file': 'a.pdf', 'pde_subcategories': ['boundary conditions'],
+                                                 'excerpts': None}]
+
+
+def test_unfinished_and_missing_runs(store):
+    store.start_run('llm')
+    assert store.latest_run('llm') is None
+    with pytest.raises(KeyError):
+        store.papers('llm')
+    with pytest.raises(KeyError):
+        store.run('no such run')
+
+
+def test_load_into_dataframes(store):
+    run_id = store.start_run('themes')
+    store.save_results(run_id, 'themes', RESULTS)
+    papers = load_papers('themes', path=store.path)
+    assert list(papers['file']) == ['paper_0.pdf', 'paper_1.pdf']
+    assert papers['themes'][0] == ['machine learning', 'drones']
+    matches = load_matches('themes', path=store.path)
+    assert list(matches['keyword']) == ['machine learning', 'drones']
+
+
+def test_column_types_come_from_every_row(store):
+    run_id = store.start_run('equations')
+    rows = [{'file': 'a.pdf', 'excerpts': None, 'notes': None, 'score': 1, 'focus': None},
+            {'file': 'b.pdf', 'excerpts': ['u_t = u_xx'], 'notes': None, 'score': 0.5, 'focus': 'Detection'}]
+    store.save_results(run_id, 'equations', rows)
+    assert store.papers('equations', run_id) == rows
+    assert {column: declared for column, declared in store._columns('equations_papers').items()} == \
+        {'file': 'TEXT', 'excerpts': 'JSON', 'notes': 'JSON', 'score': 'REAL', 'focus': 'TEXT'}
+
+    # A field that had no value yet takes whatever a later run stores
+    later = store.start_run('equations')
+    store.save_results(later, 'equations', [{'file': 'a.pdf', 'notes': {'pages': [1, 2]}},
+                                             {'file': 'b.pdf', 'notes': 'see appendix'}])
+    assert [paper['notes'] for paper in store.papers('equations', later)] == [{'pages': [1, 2]}, 'see appendix']
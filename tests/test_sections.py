@@ -0,0 +1,78 @@
+import pytest
+from sections import equation_excerpts, is_display_equation, section_text, segment_pages, text_page
+
+WIDTH, HEIGHT = 612.0, 792.0
+
+
+def line(text, top, x0=72.0, x1=540.0, size=10.0, bold=False):
+    return {'text': text, 'x0': x0, 'x1': x1, 'top': top, 'bottom': top + size, 'size': size, 'bold': bold}
+
+
+def page(number, *lines):
+    """A laid-out page with a running header and a page number in its margins."""
+    return {'width': WIDTH, 'height': HEIGHT, 'lines': [
+        line('Journal of Fire Sciences, Vol. 12', 30.0, size=8.0),
+        *lines,
+        line(str(number), 760.0, x0=300.0, x1=310.0, size=8.0)]}
+
+
+@pytest.fixture
+def paper():
+    return [
+        page(1,
+             line('Sensor Placement for Wildfire Detection', 80.0, size=16.0, bold=True),
+             line('A. Author, B. Author', 110.0),
+             line('Abstract', 140.0, size=12.0, bold=True),
+             line('We place sensors to detect fires early in remote forests.', 160.0),
+             line('Keywords: wildfire, sensor networks', 180.0),
+             line('1 Introduction', 210.0, size=12.0, bold=True),
+             line('Fires spread quickly through dry fuel in the summer months.', 230.0)),
+        page(2,
+             line('The rate of spread follows the equation below.', 80.0),
+             line('∂u/∂t = D ∇²u + f(u)', 100.0, x0=250.0, x1=362.0),
+             line('R = I_R ξ (1 + φ_w) / (ρ_b ε Q_ig)    (2)', 120.0, x0=150.0, x1=462.0),
+             line('where the wind factor depends on the slope of the terrain.', 140.0)),
+        page(3,
+             line('References', 80.0, size=12.0, bold=True),
+             line('[1] R. Rothermel, A mathematical model for predicting fire spread, 1972.', 100.0),
+             line('[2] F. Albini, Estimating wildfire behavior and effects = 1976.', 120.0),
+             line('Appendix A', 150.0, size=12.0, bold=True),
+             line('Sensor coordinates are listed in the supplementary material.', 170.0)),
+    ]
+
+
+def sections_of(segmented):
+    return [[section for section, _ in segments] for segments in segmented]
+
+
+def test_layout_segmentation(paper):
+    segmented = segment_pages(paper)
+    assert sections_of(segmented) == [['body', 'abstract', 'body'], ['body', 'equations', 'body'],
+                                      ['references', 'body']]
+    # Running headers and page numbers are dropped
+    assert not any('Journal of Fire Sciences' in text or text == '2' for segments in segmented for _, text in segments)
+    assert section_text(segmented[0], ['abstract']) == 'Abstract\nWe place sensors to detect fires early in remote forests.'
+    # Symbols inside the references stay there
+    assert 'effects = 1976' in section_text(segmented[2], ['references'])
+    assert equation_excerpts(segmented) == ['∂u/∂t = D ∇²u + f(u)', 'R = I_R ξ (1 + φ_w) / (ρ_b ε Q_ig)    (2)']
+
+
+def test_plain_text_segmentation(paper):
+    # Without layout, sections are found from their headings and only numbered equations are recognized
+    pages = [text_page('\n'.join(line['text'] for line in laid_out['lines'])) for laid_out in paper]
+    segmented = segment_pages(pages)
+    assert section_text(segmented[0], ['abstract']) == 'Abstract\nWe place sensors to detect fires early in remote forests.'
+    assert equation_excerpts(segmented) == ['R = I_R ξ (1 + φ_w) / (ρ_b ε Q_ig)    (2)']
+    # Nothing ends the references without font sizes to tell an appendix heading apart
+    assert section_text(segmented[2], ['references']).endswith('supplementary material.')
+
+
+@pytest.mark.parametrize('text, x0, x1, expected', [
+    ('E = mc^2', 250.0, 362.0, True),
+    ('E = mc^2', 72.0, 540.0, False),
+    ('x + y = z    (3)', 72.0, 540.0, True),
+    ('The temperature rose to 40 degrees = hot summer conditions.', 250.0, 362.0, False),
+    ('Sensor deployment', 250.0, 362.0, False),
+])
+def test_display_equations(text, x0, x1, expected):
+    assert is_display_equation(line(text, 100.0, x0, x1), (72.0, 540.0), WIDTH) == expected
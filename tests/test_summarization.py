@@ -0,0 +1,82 @@
+import pytest
+from summarization import SummaryCache, summarize_papers
+
+
+class WordTokenizer:
+    """Tokenizes on whitespace, one token id per distinct word."""
+
+    model_max_length = 12
+
+    def __init__(self):
+        self.words = []
+
+    def __call__(self, text, add_special_tokens=False, verbose=False):
+        ids = []
+        for word in text.split():
+            if word not in self.words:
+                self.words.append(word)
+            ids.append(self.words.index(word))
+        return {'input_ids': ids}
+
+    def decode(self, token_ids, skip_special_tokens=True):
+        return ' '.join(self.words[token_id] for token_id in token_ids)
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+class FakeSummarizer:
+    """Summarizes a text as its first three words, recording every text it is run on."""
+
+    def __init__(self):
+        self.tokenizer = WordTokenizer()
+        self.inputs = []
+
+    def __call__(self, texts, batch_size, truncation, **params):
+        self.inputs.extend(texts)
+        return [{'summary_text': ' '.join(text.split()[:3])} for text in texts]
+
+
+TEXTS = [
+    'short paper about wildfire detection',
+    ' '.join(f'word{i}' for i in range(40)),
+    '',
+]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = SummaryCache(str(tmp_path / 'summaries.sqlite'), 10 ** 6)
+    yield cache
+    cache.close()
+
+
+def test_cached_papers_are_not_summarized_again(cache):
+    summarizer = FakeSummarizer()
+    summaries = summarize_papers(summarizer, TEXTS, cache=cache, model_name='model')
+    assert summaries[0] == 'short paper about'
+    assert summaries[1] is not None and summaries[2] is None
+    assert summarizer.inputs
+
+    rerun = FakeSummarizer()
+    assert summarize_papers(rerun, TEXTS, cache=cache, model_name='model') == summaries
+    assert rerun.inputs == []
+
+
+def test_another_model_does_not_reuse_summaries(cache):
+    summarize_papers(FakeSummarizer(), TEXTS[:1], cache=cache, model_name='model')
+    other = FakeSummarizer()
+    summarize_papers(other, TEXTS[:1], cache=cache, model_name='model+int8')
+    assert other.inputs == [TEXTS[0]]
+
+
+def test_chunk_summaries_are_reused_across_papers(cache):
+    summarizer = FakeSummarizer()
+    long_text = TEXTS[1]
+    summarize_papers(summarizer, [long_text], cache=cache, model_name='model')
+    chunks = len(summarizer.inputs)
+
+    # A new paper made of the same text plus a new final chunk only needs the new chunk summarized
+    rerun = FakeSummarizer()
+    summarize_papers(rerun, [long_text + ' extra words at the end'], cache=cache, model_name='model')
+    assert len(rerun.inputs) < chunks
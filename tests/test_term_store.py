@@ -0,0 +1,102 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import term_store
+from corpus import Supervision
+from keyword_index import get_keyword_index
+from term_store import TermStore, build_term_store
+
+PAGES = {
+    'a.pdf': ['doi:10.1000/A1 Wildfire detection with', 'a sensor network in California. Wildfire detection'],
+    # 'remote sensing' continues onto the second page
+    'b.pdf': ['Early Warning From Satellites via remote', ' sensing of Canada and Australia'],
+    'c.pdf': ['Fire weather in the Amazon', ''],
+}
+
+
+def read_pages(pdf_path):
+    """Stands in for PDF extraction: the fixture files hold their pages separated by form feeds."""
+    with open(pdf_path) as f:
+        text = f.read()
+    if text.startswith('BROKEN'):
+        raise ValueError('Unexpected EOF')
+    return text.split('\f')
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(term_store, 'extract_pages_from_pdf', read_pages)
+    folder = tmp_path / 'papers'
+    folder.mkdir()
+    for filename, pages in PAGES.items():
+        (folder / filename).write_text('\f'.join(pages))
+    (folder / 'broken.pdf').write_text('BROKEN')
+    pd.DataFrame({'Document Title': ['Something else', 'Early warning from satellites'],
+                  'DOI': ['10.1000/a1', ''], 'Publication Year': ['2019', '2021']}).to_csv(tmp_path / 'export.csv', index=False)
+    return folder
+
+
+@pytest.fixture
+def store(tmp_path, corpus):
+    supervision = Supervision(timeout=30)
+    paths = sorted(str(path) for path in corpus.iterdir())
+    assert build_term_store(paths, str(tmp_path / 'term_store'), str(tmp_path / 'export*.csv'), 2, supervision) == 3
+    assert supervision.failed_files() == ['broken.pdf']
+    return TermStore(str(tmp_path / 'term_store'))
+
+
+def test_counts_match_the_joined_text(store):
+    matcher = get_keyword_index().matcher([section for section, _ in dict.fromkeys(store.terms)])
+    assert [paper['file'] for paper in store.papers] == ['a.pdf', 'b.pdf', 'c.pdf']
+    for number, paper in enumerate(store.papers):
+        found = matcher.find(''.join(PAGES[paper['file']]))
+        expected = {term for term in store.terms if term[1] in found.get(term[0], [])}
+        assert {store.terms[term] for term in np.flatnonzero(store.counts[number])} == expected
+    assert store.counts[0, store.term_ids(['wildfire detection'], 'themes')[0]] == 2
+
+
+def test_positions_of_a_keyword_continuing_onto_the_next_page(store):
+    positions = store.positions('remote sensing', 'themes')
+    assert positions.to_dict('records') == [{'file': 'b.pdf', 'page': 1, 'start': len('Early Warning From Satellites via ')}]
+
+
+def test_papers_are_joined_to_their_publication_year(store):
+    assert [(paper['matched_by'], paper['year']) for paper in store.papers] == [('doi', 2019), ('first page', 2021),
+                                                                              (None, None)]
+    assert list(store.years) == [2019, 2021, 0]
+
+
+def write_store(path, terms, counts, years):
+    path.mkdir()
+    np.save(path / 'counts.npy', np.asfortranarray(np.array(counts, dtype=np.uint32)))
+    np.save(path / 'occurrences.npy', np.zeros(0, dtype=term_store.OCCURRENCE_DTYPE))
+    np.save(path / 'term_offsets.npy', np.zeros(len(terms) + 1, dtype=np.int64))
+    np.save(path / 'years.npy', np.array(years, dtype=np.int32))
+    with open(path / 'store.json', 'w') as f:
+        json.dump({'version': term_store.STORE_VERSION, 'keywords_sha256': '', 'metadata': '', 'terms': terms,
+                   'papers': [{'file': f'{number}.pdf'} for number in range(len(years))]}, f)
+    return TermStore(str(path))
+
+
+@pytest.mark.parametrize('years, section', [(None, None), ((2020, 2021), None), ((2019, 2019), 'themes'),
+                                            (None, 'regions'), ((1990, 1991), None)])
+def test_top_terms_ranks_by_tfidf(tmp_path, years, section):
+    rng = np.random.default_rng(0)
+    terms = [['themes', f'theme {i}'] for i in range(6)] + [['regions', f'region {i}'] for i in range(4)]
+    counts = rng.integers(0, 4, size=(30, len(terms))) * (rng.random((30, len(terms))) < 0.4)
+    paper_years = rng.integers(2018, 2023, size=30)
+    store = write_store(tmp_path / 'term_store', terms, counts, paper_years)
+
+    # TF-IDF computed directly on the whole matrix
+    counts = counts.astype(np.float64)
+    idf = np.log((1 + len(counts)) / (1 + (counts > 0).sum(axis=0))) + 1
+    selected = np.ones(len(counts), dtype=bool) if years is None else (paper_years >= years[0]) & (paper_years <= years[1])
+    tf = counts[selected] / np.maximum(counts[selected].sum(axis=1, keepdims=True), 1)
+    tfidf = (tf * idf).mean(axis=0) if selected.any() else np.zeros(len(terms))
+    expected = sorted(((term[1], tfidf[number]) for number, term in enumerate(terms)
+                       if section in (None, term[0]) and counts[selected, number].sum() > 0), key=lambda item: -item[1])
+
+    ranking = store.top_terms(years, section, limit=len(terms))
+    assert list(ranking['keyword']) == [keyword for keyword, _ in expected]
+    assert np.allclose(ranking['tfidf'], [score for _, score in expected])
@@ -0,0 +1,140 @@
+import os
+import pytest
+import text_index
+from keyword_matcher import KeywordMatcher
+from text_index import TextIndex, QueryError, parse_query
+
+PAGES = {
+    'fwi.pdf': ['The Fire Weather Index (FWI) is computed daily.', 'LoRa sensors report the FWI.'],
+    'lora.pdf': ['A LoRa network of wireless sensor networks (WSNs).', 'Sensor placement and k-means clustering.'],
+    'split.pdf': ['Optimal sensor', ' placement under fire weather', 'index constraints.'],
+}
+
+
+def read_pages(pdf_path, cache=None):
+    """Stands in for PDF extraction: the fixture files hold their pages separated by form feeds."""
+    with open(pdf_path) as f:
+        text = f.read()
+    if text.startswith('BROKEN'):
+        yield 'a first page that was read'
+        raise ValueError('Unexpected EOF')
+    yield from text.split('\f')
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_index, 'iter_pages_from_pdf', read_pages)
+    folder = tmp_path / 'papers'
+    folder.mkdir()
+    for filename, pages in PAGES.items():
+        (folder / filename).write_text('\f'.join(pages))
+    return folder
+
+
+@pytest.fixture
+def index(tmp_path, corpus):
+    index = TextIndex(str(tmp_path / 'text_index.sqlite'))
+    yield index
+    index.close()
+
+
+def build(index, folder):
+    return index.update(sorted(str(path) for path in folder.iterdir()))
+
+
+def matching_files(index, query):
+    return sorted(os.path.basename(path) for path, _, _ in index.search(query))
+
+
+def test_parse_query():
+    assert parse_query('fire') == ('phrase', ['fire'], 0)
+    assert parse_query('FWI LoRa') == ('and', [('phrase', ['fwi'], 0), ('phrase', ['lora'], 0)])
+    assert parse_query('a OR b AND c') == \
+        ('or', [('phrase', ['a'], 0), ('and', [('phrase', ['b'], 0), ('phrase', ['c'], 0)])])
+    assert parse_query('NOT (a OR b)') == ('not', ('or', [('phrase', ['a'], 0), ('phrase', ['b'], 0)]))
+    assert parse_query('"sensor placement"~5') == ('phrase', ['sensor', 'placement'], 5)
+    assert parse_query('k-means') == ('phrase', ['k', 'means'], 0)
+    assert parse_query('or and') == ('and', [('phrase', ['or'], 0), ('phrase', ['and'], 0)])
+
+
+@pytest.mark.parametrize('query', ['', '   ', '(fire', 'fire)', 'fire OR', 'NOT', '""', 'AND fire', '"unclosed'])
+def test_invalid_queries(query):
+    with pytest.raises(QueryError):
+        parse_query(query)
+
+
+def test_queries(index, corpus):
+    assert build(index, corpus) == (sorted(str(path) for path in corpus.iterdir()), [], [], [])
+    assert matching_files(index, 'FWI') == ['fwi.pdf']
+    assert matching_files(index, 'lora AND fwi') == ['fwi.pdf']
+    assert matching_files(index, 'lora OR placement') == ['fwi.pdf', 'lora.pdf', 'split.pdf']
+    assert matching_files(index, 'lora NOT fwi') == ['lora.pdf']
+    assert matching_files(index, '"fire weather"') == ['fwi.pdf', 'split.pdf']
+    assert matching_files(index, '"index weather"') == []
+    assert matching_files(index, '"weather fire"~1') == ['fwi.pdf', 'split.pdf']
+    assert matching_files(index, '"daily fire"~4') == []
+    assert matching_files(index, '"daily fire"~5') == ['fwi.pdf']
+
+
+def test_snippets(index, corpus):
+    build(index, corpus)
+    [(path, hits, snippets)] = index.search('"fire weather index"', context=10)
+    assert os.path.basename(path) == 'fwi.pdf' and hits == 1
+    assert snippets == [(1, 'The [Fire Weather Index] (FWI) is ...')]
+
+
+def test_keyword_matches_agree_with_keyword_matcher(index, corpus):
+    build(index, corpus)
+    categories = {'themes': ['Fire Weather Index', 'FWI', 'k-means', 'wireless sensor networks (WSNs)',
+                             'sensor placement', 'fire weather', 'LoRa network', 'network', 'WSN']}
+    matcher = KeywordMatcher(categories)
+    expected = {str(corpus / filename): matcher.find(''.join(pages)) for filename, pages in PAGES.items()}
+    assert index.keyword_matches(categories) == expected
+
+
+def test_incremental_updates(index, corpus):
+    build(index, corpus)
+    paths = sorted(str(path) for path in corpus.iterdir())
+    assert build(index, corpus) == ([], paths, [], [])
+
+    (corpus / 'fwi.pdf').write_text('Nothing about weather here.')
+    os.remove(corpus / 'split.pdf')
+    assert build(index, corpus) == ([str(corpus / 'fwi.pdf')], [str(corpus / 'lora.pdf')], [str(corpus / 'split.pdf')], [])
+    assert matching_files(index, 'fwi') == []
+    assert matching_files(index, 'weather') == ['fwi.pdf']
+
+
+def test_unreadable_paper_is_left_out_and_retried(index, corpus):
+    broken = corpus / 'broken.pdf'
+    broken.write_text('BROKEN')
+    indexed, unchanged, removed, failed = build(index, corpus)
+    assert failed == [str(broken)] and str(broken) not in indexed
+    assert index.failures() == {str(broken): 'ValueError: Unexpected EOF'}
+    # Nothing of the pages read before the error is kept
+    assert str(broken) not in index.paths().values()
+    assert matching_files(index, 'first') == []
+
+    # The next build tries it again, and once it reads it is indexed like any other paper
+    _, _, _, failed = build(index, corpus)
+    assert failed == [str(broken)]
+    broken.write_text('Now readable')
+    indexed, _, _, failed = build(index, corpus)
+    assert (indexed, failed) == ([str(broken)], [])
+    assert index.failures() == {}
+    assert matching_files(index, 'readable') == ['broken.pdf']
+
+
+def test_index_is_rebuilt_for_another_extractor(tmp_path, corpus, monkeypatch):
+    path = str(tmp_path / 'text_index.sqlite')
+    index = TextIndex(path)
+    build(index, corpus)
+    index.close()
+
+    index = TextIndex(path)
+    assert index.paths()
+    index.close()
+
+    monkeypatch.setattr(text_index, 'active_extractor', lambda: 'pdfplumber')
+    index = TextIndex(path)
+    assert index.paths() == {}
+    index.close()